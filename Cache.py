@@ -0,0 +1,141 @@
+import os
+import json
+import pickle
+import hashlib
+
+import Emitter
+
+# How many compiled definition files are kept, unless it's overridden
+DEFAULT_MAX_ENTRIES = 32
+
+# The source files which determine what a definition file compiles to
+engine_files = ["Tokenizer.py", "Parser.py", "Incremental.py", "Includes.py", "Emitter.py", "__main__.py"]
+
+# Templates are rendered into some of the outputs (such as .htaccess and route stubs), so
+# every file inside this directory is part of the engine's version as well
+templates_directory = "templates"
+
+
+def engine_version():
+	""" Returns a hash of the engine's own source and templates, so that anything compiled
+		by a different version of the engine (even an unreleased one) is never reused. """
+
+	engine_hash = hashlib.sha256()
+	engine_directory = os.path.dirname(os.path.realpath(__file__))
+
+	template_files = [os.path.join(templates_directory, file_name) for file_name in sorted(os.listdir(os.path.join(engine_directory, templates_directory)))]
+
+	for file_name in engine_files + template_files:
+		engine_hash.update(file_name.encode("utf-8") + b"\0")
+
+		with open(os.path.join(engine_directory, file_name), "rb") as engine_file:
+			engine_hash.update(engine_file.read())
+
+	return engine_hash.hexdigest()
+
+
+def default_cache_directory():
+	""" Returns the directory the compile cache is kept in, which is $APIENGINE_CACHE_DIR if
+		it's set, or otherwise an 'apiengine' directory inside the user's cache directory. """
+
+	if "APIENGINE_CACHE_DIR" in os.environ:
+		return os.environ["APIENGINE_CACHE_DIR"]
+
+	user_cache_directory = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+
+	return os.path.join(user_cache_directory, "apiengine")
+
+
+class CompileCache:
+	""" Keeps the compiled outputs and defined classes of recently compiled definition files,
+		keyed on a hash of the definition file's text, the settings it was compiled with and
+		the version of the engine. Compiling a definition file which is byte-for-byte the same
+		as one which is still in the cache then needs no tokenising or parsing at all.
+
+		Each entry is a file of its own inside the cache directory, so the cache can be shared
+		by several projects (and processes) at once. Entries are touched whenever they're
+		used, and only the `max_entries` most recently used are kept.
+	"""
+
+	def __init__(self, directory, max_entries=DEFAULT_MAX_ENTRIES):
+		self.directory = directory
+		self.max_entries = max_entries
+		self.version = engine_version()
+
+
+	def key(self, definition, settings):
+		"""Returns the key of the given definition file text compiled with the given settings."""
+
+		key_hash = hashlib.sha256()
+
+		key_hash.update(self.version.encode("utf-8") + b"\0")
+		key_hash.update(json.dumps(settings, sort_keys=True).encode("utf-8") + b"\0")
+		key_hash.update(definition.encode("utf-8"))
+
+		return key_hash.hexdigest()
+
+
+	def entry_path(self, key):
+		return os.path.join(self.directory, key + ".pickle")
+
+
+	def load(self, definition, settings):
+		""" Returns the (compiled outputs, defined classes) of the definition file text, as
+			compiled with the given settings, or None if they aren't in the cache. """
+
+		key = self.key(definition, settings)
+		entry_path = self.entry_path(key)
+
+		try:
+			with open(entry_path, "rb") as entry_file:
+				entry = pickle.load(entry_file)
+
+			if entry["key"] != key:
+				return None
+
+			# Keep track of when it was last used, which is what eviction goes by
+			os.utime(entry_path)
+		except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+			return None
+
+		return entry["outputs"], entry["classes"]
+
+
+	def store(self, definition, settings, outputs, classes):
+		""" Adds the compiled outputs and defined classes of the definition file text, as
+			compiled with the given settings, to the cache. The cache is only there to save
+			time, so anything which stops it being written is ignored. """
+
+		key = self.key(definition, settings)
+		entry = {"key": key, "outputs": outputs, "classes": classes}
+
+		try:
+			os.makedirs(self.directory, exist_ok=True)
+			Emitter.write_atomically(self.entry_path(key), pickle.dumps(entry, pickle.HIGHEST_PROTOCOL))
+
+			self.evict()
+		except OSError:
+			pass
+
+
+	def evict(self):
+		"""Removes all but the `max_entries` most recently used entries."""
+
+		entries = []
+
+		for file_name in os.listdir(self.directory):
+			if file_name.endswith(".pickle"):
+				entry_path = os.path.join(self.directory, file_name)
+
+				try:
+					entries.append((os.stat(entry_path).st_mtime, entry_path))
+				except FileNotFoundError:
+					pass # Evicted by someone else in the meantime
+
+		entries.sort(reverse=True)
+
+		for _, entry_path in entries[self.max_entries:]:
+			try:
+				os.unlink(entry_path)
+			except FileNotFoundError:
+				pass
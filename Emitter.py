@@ -0,0 +1,535 @@
+import re
+import os
+import json
+import struct
+import hashlib
+import tempfile
+
+from Parser import EndpointComponent
+
+# How each byte is written inside a double-quoted PHP string
+php_byte_escapes = [chr(byte) if 0x20 <= byte < 0x7f and chr(byte) not in '"\\$' else "\\x{0:02x}".format(byte) for byte in range(256)]
+
+
+def php_value(value, default=None):
+	""" Returns the PHP literal representation of `value`, which may be made up of
+		dictionaries, lists, tuples, strings, bytes, integers, booleans and None.
+
+		Bytes are written as a double-quoted string, where anything other than printable
+		ASCII is escaped, so the PHP file stays valid UTF-8 whatever the bytes are.
+
+		Much like `json.dumps`, `default` is called to obtain a representable version
+		of any other kind of object.
+	"""
+
+	pieces = []
+
+	def append_value(value):
+		if isinstance(value, str):
+			pieces.append("'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'")
+		elif isinstance(value, bytes):
+			pieces.append('"' + "".join(php_byte_escapes[byte] for byte in value) + '"')
+		elif value is None:
+			pieces.append("null")
+		elif value is True or value is False:
+			pieces.append("true" if value else "false")
+		elif isinstance(value, int):
+			pieces.append(str(value))
+		elif isinstance(value, dict):
+			pieces.append("[")
+
+			for key, sub_value in value.items():
+				append_value(key)
+				pieces.append("=>")
+				append_value(sub_value)
+				pieces.append(",")
+
+			pieces.append("]")
+		elif isinstance(value, (list, tuple)):
+			pieces.append("[")
+
+			for sub_value in value:
+				append_value(sub_value)
+				pieces.append(",")
+
+			pieces.append("]")
+		elif default is not None:
+			append_value(default(value))
+		else:
+			raise TypeError("no PHP representation for " + repr(value))
+
+	append_value(value)
+
+	return "".join(pieces)
+
+
+def php_file(value, default=None):
+	""" Returns the source of a PHP file which returns `value` when it is included, so that
+		it can be loaded with `require` (and cached by opcache) rather than decoded. """
+
+	return "<?php\n\nreturn " + php_value(value, default) + ";\n"
+
+
+def write_atomically(file_path, contents, mode=None):
+	""" Writes `contents` to the file at `file_path` by writing a temporary file beside
+		it and renaming it into place, so anything reading the file sees either the old
+		contents or the new contents, but never a partially written file. The contents
+		can be either a string or bytes.
+
+		If `mode` is given, the file's permissions are set to it before it's renamed.
+	"""
+
+	directory, file_name = os.path.split(file_path)
+	handle, temporary_path = tempfile.mkstemp(prefix="." + file_name + ".", dir=directory or ".")
+
+	try:
+		# Text is always UTF-8, whatever the locale, as it's hashed as UTF-8 by the manifest
+		file = os.fdopen(handle, "wb") if isinstance(contents, bytes) else os.fdopen(handle, "w", encoding="utf-8")
+
+		with file:
+			file.write(contents)
+			file.flush()
+			os.fsync(file.fileno())
+
+		os.chmod(temporary_path, 0o644 if mode is None else mode)
+		os.replace(temporary_path, file_path)
+	except BaseException:
+		os.unlink(temporary_path)
+		raise
+
+
+class Manifest:
+	""" Keeps the content hash of every file generated inside a project, in a manifest
+		file inside the project's directory, so that files whose contents haven't changed
+		aren't written again. Rewriting an identical file would otherwise invalidate
+		opcache and file caches, and make it look changed to anything syncing the project.
+
+		Along with its hash, the size and modification time of each file are recorded
+		when it's written. A file which no longer has them (say, because it was edited
+		by hand) is always written, so the files themselves never need to be read.
+	"""
+
+	def __init__(self, project_directory, manifest_name):
+		self.project_directory = project_directory
+		self.manifest_path = os.path.join(project_directory, manifest_name)
+		self.changed = False
+
+		try:
+			with open(self.manifest_path, encoding="utf-8") as manifest_file:
+				self.files = json.load(manifest_file)
+		except (OSError, ValueError):
+			self.files = {} # Nothing's been written yet, or the manifest can't be trusted
+
+	def is_current(self, relative_path, content_hash):
+		"""Returns whether the file at relative_path is known to have the given hash."""
+
+		recorded = self.files.get(relative_path)
+
+		if recorded is None or recorded["hash"] != content_hash:
+			return False
+
+		try:
+			status = os.stat(os.path.join(self.project_directory, relative_path))
+		except OSError:
+			return False
+
+		return status.st_size == recorded["size"] and status.st_mtime_ns == recorded["mtime"]
+
+	def write(self, relative_path, contents, mode=None):
+		""" Writes `contents` to the file at relative_path inside the project atomically,
+			as `write_atomically` does, unless the file already has those contents.
+			Returns whether the file was written. """
+
+		content_hash = hashlib.sha256(contents if isinstance(contents, bytes) else contents.encode("utf-8")).hexdigest()
+
+		if self.is_current(relative_path, content_hash):
+			return False
+
+		file_path = os.path.join(self.project_directory, relative_path)
+		write_atomically(file_path, contents, mode)
+
+		status = os.stat(file_path)
+
+		self.files[relative_path] = {"hash": content_hash, "size": status.st_size, "mtime": status.st_mtime_ns}
+		self.changed = True
+
+		return True
+
+	def remove(self, relative_path):
+		"""Deletes the file at relative_path inside the project, if it's there, and forgets it."""
+
+		try:
+			os.unlink(os.path.join(self.project_directory, relative_path))
+		except FileNotFoundError:
+			pass
+
+		if self.files.pop(relative_path, None) is not None:
+			self.changed = True
+
+	def save(self):
+		"""Writes out the manifest, if any file has been written since it was loaded."""
+
+		if self.changed:
+			write_atomically(self.manifest_path, json.dumps(self.files, indent="\t", sort_keys=True))
+			self.changed = False
+
+
+def component_pattern(sub_tree, leaves, separator):
+	""" Returns a regular expression matching the rest of a path from the position
+		of `sub_tree` inside the redirect tree, with `separator` preceding the next
+		component. Each entry reached is appended to `leaves`, and is identified in
+		the expression by its index inside `leaves` as a (*MARK) name.
+
+		Static components are always preferred over wildcards, and once one has been
+		matched the wildcard isn't tried (exactly like walking the tree), so wildcards
+		are guarded by a negative lookahead for every static component at that level.
+		Branch resets mean the n-th variable in the path is always captured by group n.
+	"""
+
+	alternatives = []
+	static_keys = [key for key in sub_tree if key not in [EndpointComponent.WILDCARD, EndpointComponent.ROOT]]
+
+	for key in static_keys:
+		alternatives.append(separator + re.escape(key) + component_pattern(sub_tree[key], leaves, "/"))
+
+	if EndpointComponent.WILDCARD in sub_tree:
+		guard = "(?!(?:{0})(?:/|\\z))".format("|".join(re.escape(key) for key in static_keys)) if static_keys else ""
+		alternatives.append(separator + guard + "([^/]+)" + component_pattern(sub_tree[EndpointComponent.WILDCARD], leaves, "/"))
+
+	if EndpointComponent.ROOT in sub_tree:
+		alternatives.append("\\z(*MARK:{0})".format(len(leaves)))
+		leaves.append(sub_tree[EndpointComponent.ROOT])
+
+	return alternatives[0] if len(alternatives) == 1 else "(?|" + "|".join(alternatives) + ")"
+
+
+def regex_routes(tree):
+	""" Compiles the redirect tree into anchored PCRE patterns, so a path can be resolved
+		and all of its variables extracted with one call to preg_match.
+
+		Patterns are split by the first component of the path (keeping each one well below
+		PCRE's pattern size limit), which is the same decision the tree walk makes first.
+		For each method, the returned dictionary contains:
+
+		* 'static', mapping each static first component to its (pattern, leaves) pair
+		* 'wildcard', the (pattern, leaves) pair for any other first component, or None
+		* 'root', the entry for the path with no components, or None
+
+		Each of the leaves is an entry, whose parameter names are in the same order as
+		the groups capturing their values.
+	"""
+
+	def compiled(sub_tree, key):
+		leaves = []
+		pattern = component_pattern({key: sub_tree[key]}, leaves, "")
+
+		return ("~^" + pattern + "~", leaves)
+
+	routes = {}
+
+	for method, sub_tree in tree.items():
+		static_keys = [key for key in sub_tree if key not in [EndpointComponent.WILDCARD, EndpointComponent.ROOT]]
+		wildcard = None
+
+		# Static first components are dispatched on before the pattern is chosen, so
+		# the wildcard pattern doesn't need to rule them out itself
+
+		if EndpointComponent.WILDCARD in sub_tree:
+			wildcard = compiled(sub_tree, EndpointComponent.WILDCARD)
+
+		routes[method] = {
+			"static": {key: compiled(sub_tree, key) for key in static_keys},
+			"wildcard": wildcard,
+			"root": sub_tree.get(EndpointComponent.ROOT)
+		}
+
+	return routes
+
+
+# Variables beneath nodes with more fixed components than this are left to request.php
+direct_route_exclusion_limit = 50
+
+def direct_routes(tree, static_routes, native_optionals=False):
+	""" Returns the routes which Apache can send straight to their entry, as a list of
+		(method, pattern, entry) where the pattern matches the whole path of a request.
+		Static routes come first, and then every route with variables, unless optionals
+		are stored natively, where only static routes are included.
+
+		The tree walk prefers fixed components over variables and never goes back, so a
+		variable only matches components which aren't fixed components beside it. Each
+		pattern only matches the requests the tree walk would find its entry for, which
+		means no two patterns match the same request.
+	"""
+
+	routes = []
+
+	for key, entry in static_routes.items():
+		method, _, path = key.partition("/")
+		routes.append((method, "^" + "/".join(re.escape(component) for component in path.split("/") if component != "") + "$", entry))
+
+	if native_optionals:
+		return routes
+
+	def walk(method, sub_tree, pieces, has_variable):
+		fixed_components = sorted(key for key in sub_tree if key not in [EndpointComponent.ROOT, EndpointComponent.WILDCARD, EndpointComponent.OPTIONAL])
+
+		for key, value in sub_tree.items():
+			if key == EndpointComponent.ROOT:
+				if has_variable:
+					routes.append((method, "^" + "/".join(pieces) + "$", value))
+			elif key == EndpointComponent.WILDCARD:
+				if len(fixed_components) > direct_route_exclusion_limit:
+					continue
+
+				piece = "[^/]+"
+
+				if len(fixed_components) > 0:
+					piece = "(?!(?:" + "|".join(re.escape(component) for component in fixed_components) + ")(?:/|$))" + piece
+
+				walk(method, value, pieces + [piece], True)
+			elif key != EndpointComponent.OPTIONAL:
+				walk(method, value, pieces + [re.escape(key)], has_variable)
+
+	for method, sub_tree in tree.items():
+		walk(method, sub_tree, [], False)
+
+	return routes
+
+
+def vocabulary(tree):
+	""" Returns the set of every component written anywhere in the redirect tree, leaving
+		out the keys which stand for variables, optionals and the root. A component of a
+		request which isn't in it can only ever be the value of a variable. """
+
+	words = set()
+	sub_trees = list(tree.values())
+
+	while len(sub_trees) > 0:
+		sub_tree = sub_trees.pop()
+
+		for key, value in sub_tree.items():
+			if key != EndpointComponent.ROOT:
+				sub_trees.append(value)
+
+				if key not in [EndpointComponent.WILDCARD, EndpointComponent.OPTIONAL]:
+					words.add(key)
+
+	return words
+
+
+def shared_tree(tree, static_routes):
+	""" Converts the redirect tree into a table of nodes, where identical parts of the
+		tree are only included once and shared by every part of the tree which contains
+		them. Entries are likewise only included once, inside a table of their own.
+
+		Returns a dictionary containing:
+
+		* 'entries', the list of unique entries
+		* 'nodes', the list of unique nodes, each mapping its keys to the index of the
+		  node beneath it (or of the entry, for the root component)
+		* 'roots', mapping each method to the index of the node at the top of its tree
+		* 'static', mapping each key inside `static_routes` to the index of its entry
+	"""
+
+	entries, entry_indexes = [], {}
+	nodes, node_indexes = [], {}
+
+	def entry_index(entry):
+		if entry not in entry_indexes:
+			entry_indexes[entry] = len(entries)
+			entries.append(entry)
+
+		return entry_indexes[entry]
+
+	def node_index(sub_tree):
+
+		# Nodes beneath are numbered first, so identical nodes end up with identical contents
+
+		node = {}
+
+		for key, value in sub_tree.items():
+			node[key] = entry_index(value) if key == EndpointComponent.ROOT else node_index(value)
+
+		signature = tuple(sorted(node.items()))
+
+		if signature not in node_indexes:
+			node_indexes[signature] = len(nodes)
+			nodes.append(node)
+
+		return node_indexes[signature]
+
+	return {
+		"entries": entries,
+		"nodes": nodes,
+		"roots": {method: node_index(sub_tree) for method, sub_tree in tree.items()},
+		"static": {key: entry_index(entry) for key, entry in static_routes.items()}
+	}
+
+
+# Bump this whenever the layout of compact route tables changes, so the runtime can tell
+COMPACT_VERSION = 1
+
+def compact_tree(tree, static_routes):
+	""" Converts the redirect tree into the same table of nodes as `shared_tree`, but with
+		every string (component keys, class names, file names and parameter names) kept
+		once inside a table of strings, referred to by its index, and every node and entry
+		written as a flat list of integers rather than an object.
+
+		Returns a dictionary containing:
+
+		* 'version', the version of the layout, which is `COMPACT_VERSION`
+		* 'strings', the list of unique strings
+		* 'entries', each as [class name, file name, position, parameter name, ...]
+		* 'nodes', each as [entry or -1, key, node, key, node, ...] where the entry is
+		  the one at the root component of the node, if there is one
+		* 'roots' and 'static', as they are for `shared_tree`
+	"""
+
+	shared = shared_tree(tree, static_routes)
+	strings, string_indexes = [], {}
+
+	def string_index(string):
+		if string not in string_indexes:
+			string_indexes[string] = len(strings)
+			strings.append(string)
+
+		return string_indexes[string]
+
+	entries = []
+
+	for entry in shared["entries"]:
+		record = [string_index(entry.class_name), string_index(entry.file_name)]
+
+		for position, name in entry.parameters:
+			record += [position, string_index(name)]
+
+		entries.append(record)
+
+	nodes = []
+
+	for node in shared["nodes"]:
+		record = [node.get(EndpointComponent.ROOT, -1)]
+
+		for key, child in node.items():
+			if key != EndpointComponent.ROOT:
+				record += [string_index(key), child]
+
+		nodes.append(record)
+
+	return {
+		"version": COMPACT_VERSION,
+		"strings": strings,
+		"entries": entries,
+		"nodes": nodes,
+		"roots": shared["roots"],
+		"static": shared["static"]
+	}
+
+
+# Bump this whenever the layout of binary route tables changes, so the runtime can tell
+BINARY_VERSION = 1
+
+BINARY_MAGIC = b"AERT"
+
+# Written wherever there isn't a node or an entry
+BINARY_NONE = 0xFFFFFFFF
+
+# Every record is made up of unsigned 32 bit little endian integers
+binary_header = struct.Struct("<4s10I")
+binary_node = struct.Struct("<5I")
+binary_key = struct.Struct("<3I")
+binary_entry = struct.Struct("<6I")
+binary_parameter = struct.Struct("<3I")
+
+def binary_tree(tree, static_routes):
+	""" Converts the redirect tree into a flat table which the runtime can search without
+		decoding it, returning the table as bytes. Identical parts of the tree are only
+		included once, as they are for `shared_tree`.
+
+		The table begins with a header, made up of:
+
+		* the magic bytes 'AERT', followed by `BINARY_VERSION`
+		* the offsets of the nodes, keys, entries, parameters and strings
+		* the first key and the number of keys for the roots (one per method), and then
+		  for the static routes
+
+		Each section is a list of fixed width records, which are referred to by their
+		index inside it:
+
+		* nodes are (entry, wildcard node, optional node, first key, number of keys)
+		* keys are (string offset, string length, node or entry), where the keys of each
+		  node (and the roots and static routes) are together and sorted by their bytes,
+		  so they can be binary searched
+		* entries are (class name offset, class name length, file name offset, file name
+		  length, first parameter, number of parameters)
+		* parameters are (position, name offset, name length)
+
+		Strings are kept once each inside the string pool at the end of the table, and
+		their offsets are from the start of the pool. `BINARY_NONE` is written wherever
+		there's no node or entry.
+	"""
+
+	shared = shared_tree(tree, static_routes)
+
+	pool, string_offsets = bytearray(), {}
+
+	def string_reference(string):
+		encoded = string.encode("utf-8")
+
+		if encoded not in string_offsets:
+			string_offsets[encoded] = len(pool)
+			pool.extend(encoded)
+
+		return string_offsets[encoded], len(encoded)
+
+	keys = []
+
+	def key_range(items):
+		"""Adds the (string, value) pairs in items as sorted keys, returning where they are."""
+
+		start = len(keys)
+
+		for key, value in sorted(items, key=lambda item: item[0].encode("utf-8")):
+			keys.append(string_reference(key) + (value,))
+
+		return start, len(items)
+
+	nodes = []
+
+	for node in shared["nodes"]:
+		children = [(key, child) for key, child in node.items() if key not in [EndpointComponent.ROOT, EndpointComponent.WILDCARD, EndpointComponent.OPTIONAL]]
+
+		nodes.append((
+			node.get(EndpointComponent.ROOT, BINARY_NONE),
+			node.get(EndpointComponent.WILDCARD, BINARY_NONE),
+			node.get(EndpointComponent.OPTIONAL, BINARY_NONE)
+		) + key_range(children))
+
+	roots = key_range(list(shared["roots"].items()))
+	static = key_range(list(shared["static"].items()))
+
+	entries, parameters = [], []
+
+	for entry in shared["entries"]:
+		entries.append(string_reference(entry.class_name) + string_reference(entry.file_name) + (len(parameters), len(entry.parameters)))
+
+		for position, name in entry.parameters:
+			parameters.append((position,) + string_reference(name))
+
+	# Each section follows the one before it, with the string pool last
+
+	nodes_offset = binary_header.size
+	keys_offset = nodes_offset + binary_node.size * len(nodes)
+	entries_offset = keys_offset + binary_key.size * len(keys)
+	parameters_offset = entries_offset + binary_entry.size * len(entries)
+	strings_offset = parameters_offset + binary_parameter.size * len(parameters)
+
+	table = bytearray(binary_header.pack(BINARY_MAGIC, BINARY_VERSION, nodes_offset, keys_offset, entries_offset, parameters_offset, strings_offset, *(roots + static)))
+
+	for records, record_struct in [(nodes, binary_node), (keys, binary_key), (entries, binary_entry), (parameters, binary_parameter)]:
+		for record in records:
+			table.extend(record_struct.pack(*record))
+
+	table.extend(pool)
+
+	return bytes(table)
@@ -0,0 +1,265 @@
+import os
+import pickle
+import hashlib
+import itertools
+import posixpath
+import multiprocessing
+
+import Tokenizer
+import Parser
+from Parser import ParseError, located
+
+# Bump this whenever the format of the cache (or the entries inside it) changes
+CACHE_VERSION = 2
+
+# Starting worker processes takes longer than parsing a small amount, so included files are
+# only parsed in parallel when there are at least two of them and this many characters between them
+parallel_threshold = 64 * 1024
+
+
+def prefixed(path, message):
+	"""Prefixes an error message with the included file it occurred in, unless it's the definition file itself."""
+
+	if path is None:
+		return message
+
+	return "{0}: {1}".format(path, message)
+
+
+class RecordingParser(Parser.Parser):
+	""" Parses an included file on its own, as if it were a definition file, so it has
+		its own base directory. Every endpoint inserted into the tree is also recorded,
+		along with the location of the export it came from, so the endpoints can be
+		merged into the tree of the definition file afterwards. """
+
+	def __init__(self, *arguments, **keyword_arguments):
+		super().__init__(*arguments, **keyword_arguments)
+
+		# Each endpoint in the form (method, components, entry, location)
+		self.recorded = []
+		self.export_location = None
+
+
+	def process_export(self, *arguments):
+		self.export_location = self.scanner.current_location
+		super().process_export(*arguments)
+
+
+	def insert_endpoint(self, method, components, entry):
+		super().insert_endpoint(method, components, entry)
+		self.recorded.append((method, tuple(components), entry, self.export_location))
+
+
+def parse_file(path, text, native_optionals):
+	""" Tokenises and parses the included file `text`, found at `path`. Returns the
+		endpoints it exports, in the form (method, components, entry, location), the
+		files it includes, in the form (file, location), and a list of the errors found
+		in it.
+
+		This is run inside worker processes, so everything it takes and returns can
+		be pickled. """
+
+	tokenizer = Tokenizer.Tokenizer(text)
+	parser = RecordingParser(tokenizer.tokens(), native_optionals=native_optionals, locate=tokenizer.current_location)
+
+	try:
+		parser.parse()
+	except ParseError as error:
+		return [], [], [prefixed(path, message) for message in str(error).split("\n")]
+
+	return parser.recorded, parser.includes, []
+
+
+def load_cache(cache_path, native_optionals):
+	"""Returns the cached result of parsing each included file, keyed by its path, as (digest, endpoints, includes)."""
+
+	if cache_path is None:
+		return {}
+
+	try:
+		with open(cache_path, "rb") as cache_file:
+			cache = pickle.load(cache_file)
+
+		# Endpoints with optionals stored the other way can't be reused
+		if cache["version"] == CACHE_VERSION and cache["native_optionals"] == native_optionals:
+			return cache["files"]
+	except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+		pass
+
+	return {}
+
+
+def save_cache(cache_path, native_optionals, files):
+	"""Writes the result of parsing each included file, in the form `load_cache` returns, to the cache file."""
+
+	cache = {
+		"version": CACHE_VERSION,
+		"native_optionals": native_optionals,
+		"files": files
+	}
+
+	with open(cache_path, "wb") as cache_file:
+		pickle.dump(cache, cache_file, pickle.HIGHEST_PROTOCOL)
+
+
+
+
+def parsed_files(files, native_optionals, cached_files, workers=None):
+	""" Returns the result of `parse_file` for each of the included files, given as
+		(path, text). Files which haven't changed since they were added to
+		`cached_files`, which is in the form `load_cache` returns, aren't parsed again,
+		and the rest are added to it once they're parsed. They're parsed in parallel by
+		up to `workers` processes when there's enough of them to be worth it.
+	"""
+
+	results = {}
+	pending = []
+
+	for path, text in files:
+		digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+		if path in cached_files and cached_files[path][0] == digest:
+			results[path] = cached_files[path][1:] + ([],)
+		else:
+			pending.append((path, text, digest))
+
+	paths = [path for path, _, _ in pending]
+	texts = [text for _, text, _ in pending]
+
+	# Worker processes of a pool (such as those of build-all) parse serially, as they
+	# can't always start processes of their own
+
+	in_main_process = multiprocessing.current_process().name == "MainProcess"
+
+	if in_main_process and len(pending) > 1 and sum(len(text) for text in texts) >= parallel_threshold:
+		import concurrent.futures
+
+		with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+			parsed = list(executor.map(parse_file, paths, texts, itertools.repeat(native_optionals)))
+	else:
+		parsed = [parse_file(path, text, native_optionals) for path, text in zip(paths, texts)]
+
+	for (path, _, digest), (endpoints, includes, errors) in zip(pending, parsed):
+		results[path] = (endpoints, includes, errors)
+
+		if len(errors) == 0:
+			cached_files[path] = (digest, endpoints, includes)
+
+	return [results[path] for path, _ in files]
+
+
+def included_files(includes, directory, native_optionals, cache_path=None, workers=None):
+	""" Finds and parses every file included by the definition file, either directly or
+		by another included file, starting from `includes`, the (file, location) of each
+		'include' directive the parser of the definition file recorded. Returns a list of
+		(path, text, endpoints) in the order their endpoints are merged, where each file
+		comes after the one which includes it and before anything it includes, along
+		with a list of the errors found.
+
+		Included files are found relative to the file which includes them, and have to
+		be inside `directory`, the one the definition file itself is in. Their paths are
+		given relative to it. Each level of included files is parsed together, as
+		`parsed_files` does, as parsing them is what finds the level beneath.
+	"""
+
+	previous_files = load_cache(cache_path, native_optionals)
+	cached_files = dict(previous_files)
+
+	errors = []
+	seen = set()
+	texts, endpoints, children = {}, {}, {None: []}
+	level = [(None, includes)]
+
+	while len(level) > 0:
+		files = []
+
+		for path, file_includes in level:
+			for name, location in file_includes:
+				included_path = posixpath.normpath(posixpath.join(posixpath.dirname(path or ""), name))
+
+				if posixpath.isabs(name) or included_path == ".." or included_path.startswith("../"):
+					errors.append(prefixed(path, located("included file ‘{0}’ isn't inside the definition file's directory".format(name), location)))
+					continue
+
+				if included_path in seen:
+					errors.append(prefixed(path, located("file ‘{0}’ is included more than once".format(name), location)))
+					continue
+
+				seen.add(included_path)
+
+				try:
+					with open(os.path.join(directory, included_path), encoding="utf-8") as included_file:
+						texts[included_path] = included_file.read()
+				except (OSError, UnicodeDecodeError):
+					errors.append(prefixed(path, located("included file ‘{0}’ can't be read".format(name), location)))
+					continue
+
+				children[path].append(included_path)
+				children[included_path] = []
+				files.append((included_path, texts[included_path]))
+
+		level = []
+
+		for (path, _), (file_endpoints, file_includes, file_errors) in zip(files, parsed_files(files, native_optionals, cached_files, workers)):
+			endpoints[path] = file_endpoints
+			errors.extend(file_errors)
+			level.append((path, file_includes))
+
+	# Only the files which are still included are kept, and nothing is written when they're all unchanged
+
+	cached_files = {path: cached_files[path] for path in texts if path in cached_files}
+
+	if cache_path is not None and cached_files != previous_files:
+		save_cache(cache_path, native_optionals, cached_files)
+
+	ordered = []
+
+	def visit(path):
+		for included_path in children[path]:
+			ordered.append((included_path, texts[included_path], endpoints[included_path]))
+			visit(included_path)
+
+	visit(None)
+
+	return ordered, errors
+
+
+def merge_included_files(parser, directory, cache_path=None, workers=None):
+	""" Finds the files included by the definition file, as `included_files` does, and
+		inserts the endpoints they export into the tree of `parser`, which has already
+		parsed the definition file itself. Returns the included files as (path, text).
+
+		An export which redefines an endpoint of the definition file, or of a file merged
+		before its own, is reported along with the file and location it's at. Every
+		error found in every included file is raised together.
+	"""
+
+	files, errors = included_files(parser.includes, directory, parser.native_optionals, cache_path, workers)
+
+	for path, _, endpoints in files:
+
+		# Every path an export expands to is recorded with the same location, and the
+		# export is left out when any of them are already defined, as it is when parsing
+
+		for location, exported in itertools.groupby(endpoints, key=lambda endpoint: endpoint[3]):
+			exported = list(exported)
+			conflicts = []
+
+			for method, components, _, _ in exported:
+				expanded = parser.expanded_components(components) if parser.native_optionals else [components]
+				conflicts += [(method, endpoint) for endpoint in expanded if parser.endpoint_exists(method, endpoint)]
+
+			if len(conflicts) > 0:
+				for method, endpoint in conflicts:
+					message = "redefinition of endpoint ‘{0}’ for HTTP method ‘{1}’".format(parser.readable_components(endpoint), method)
+					errors.append(prefixed(path, located(message, location)))
+
+				continue
+
+			for method, components, entry, _ in exported:
+				parser.insert_endpoint(method, components, entry)
+
+	if len(errors) > 0:
+		raise ParseError("\n".join(errors))
+
+	return [(path, text) for path, text, _ in files]
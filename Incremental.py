@@ -0,0 +1,276 @@
+import re
+import pickle
+import hashlib
+
+import Tokenizer
+import Parser
+from Parser import ParseError
+
+# Bump this whenever the format of the cache (or the tree inside it) changes
+CACHE_VERSION = 6
+
+# Finds the keywords which can begin a statement, skipping over anything inside strings
+statement_keyword_regex = re.compile('"[^"\n]*"|export|group|base|include')
+
+
+class FallbackRequired(Exception):
+	""" Raised when the definition file can't be safely processed one statement
+		at a time, meaning it has to be parsed as a whole instead. """
+	pass
+
+
+def split_statements(definition):
+	""" Splits the text of an endpoint definition file into the statements which
+		comprise it, without tokenising them. A statement is either a 'base' directive,
+		an 'include' directive, an 'export' directive, or a 'group' along with its base
+		directory and all of the exports which belong to it.
+
+		Returns a list of (keyword, text) pairs, or None if there's anything other
+		than whitespace before the first statement.
+	"""
+
+	keywords = [(match.group(), match.start()) for match in statement_keyword_regex.finditer(definition) if not match.group().startswith('"')]
+
+	if len(keywords) == 0 or definition[:keywords[0][1]].strip() != "":
+		return None
+
+	starts = []
+	in_group, group_base_allowed = False, False
+
+	for keyword, start in keywords:
+
+		if keyword == "group":
+			starts.append((keyword, start))
+			in_group, group_base_allowed = True, True
+
+		elif keyword == "base" and group_base_allowed:
+			group_base_allowed = False # The group's own base directory
+
+		elif keyword in ["base", "include"]:
+			starts.append((keyword, start))
+			in_group = False
+
+		elif not in_group:
+			starts.append((keyword, start))
+
+		else:
+			group_base_allowed = False # An export belonging to the group
+
+	ends = [start for _, start in starts[1:]] + [len(definition)]
+
+	return [(keyword, definition[start:end].strip()) for (keyword, start), end in zip(starts, ends)]
+
+
+def location_of(text, position):
+	"""Returns the (line, column) of the character at position inside text, both starting at 1."""
+
+	line_start = text.rfind("\n", 0, position) + 1
+
+	return text.count("\n", 0, position) + 1, position - line_start + 1
+
+
+class IncrementalParser:
+	""" Parses endpoint definition files, reusing the result of the previous parse
+		for every statement which hasn't changed since.
+
+		Each statement is fingerprinted by its text along with the base directory it's
+		defined beneath. The fingerprints, the endpoints each statement inserted and the
+		tree itself are kept in a cache file, so on the next parse only new or changed
+		statements are tokenised and parsed, and the tree is patched in place.
+	"""
+
+	def __init__(self, cache_path, native_optionals=False):
+		self.cache_path = cache_path
+		self.native_optionals = native_optionals
+		self.parser = None
+
+
+	def load_cache(self):
+		""" Returns the cached tree, static routes, canonical paths and statements, or an
+			empty tree and no statements if there isn't a usable cache. """
+
+		try:
+			with open(self.cache_path, "rb") as cache_file:
+				cache = pickle.load(cache_file)
+
+			# A tree with optionals stored the other way can't be reused
+			if cache["version"] == CACHE_VERSION and cache["native_optionals"] == self.native_optionals:
+				return cache["tree"], cache["static_routes"], cache["canonical_paths"], cache["statements"]
+		except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+			pass
+
+		return {}, {}, set(), []
+
+
+	def save_cache(self, statements):
+		""" Writes the tree, static routes, canonical paths and the given statements, in
+			the form (fingerprint, endpoints), to the cache file. """
+
+		cache = {
+			"version": CACHE_VERSION,
+			"native_optionals": self.native_optionals,
+			"tree": self.parser.tree,
+			"static_routes": self.parser.static_routes,
+			"canonical_paths": self.parser.canonical_paths,
+			"statements": statements
+		}
+
+		with open(self.cache_path, "wb") as cache_file:
+			pickle.dump(cache, cache_file, pickle.HIGHEST_PROTOCOL)
+
+
+	def parse(self, definition):
+		""" Parses the definition file text `definition` and returns the tree, in the same
+			form `Parser.parse` returns it. The static route index is left in
+			`self.parser.static_routes`. """
+
+		statements = split_statements(definition)
+
+		try:
+			if statements is None:
+				raise FallbackRequired()
+
+			tree = self.parse_statements(statements)
+		except FallbackRequired:
+
+			# Parse the whole thing as normal, which can't be cached
+
+			tokenizer = Tokenizer.Tokenizer(definition)
+			self.parser = Parser.Parser(tokenizer.tokens(), native_optionals=self.native_optionals, locate=tokenizer.current_location)
+			return self.parser.parse()
+
+		# Each statement is tokenised on its own, so the files it includes are given the
+		# location their statement starts at inside the whole file instead
+
+		locations = []
+		position = 0
+
+		for keyword, text in statements:
+			position = definition.index(text, position)
+
+			if keyword == "include":
+				locations.append(location_of(definition, position))
+
+			position += len(text)
+
+		self.parser.includes = [(file_name, location) for (file_name, _), location in zip(self.parser.includes, locations)]
+
+		return tree
+
+
+	def parse_statements(self, statements):
+		""" Builds the tree from the cached tree, removing the endpoints of statements
+			which no longer exist and parsing those which are new. """
+
+		tree, static_routes, canonical_paths, cached_statements = self.load_cache()
+
+		self.parser = Parser.Parser([], tree, static_routes, self.native_optionals, canonical_paths)
+
+		# Cached statements, by fingerprint, which haven't been matched up yet
+
+		unmatched = {}
+
+		for fingerprint, endpoints in cached_statements:
+			unmatched.setdefault(fingerprint, []).append(endpoints)
+
+		# Figure out what's changed, keeping track of the base directory as we go
+
+		base_dir = None
+		matched_statements = []
+
+		for keyword, text in statements:
+
+			# Included files are merged in afterwards, so only need checking here
+
+			if keyword == "include":
+				self.run_statement(text, base_dir)
+				continue
+
+			if keyword == "base":
+				self.run_statement(text, None)
+				base_dir = self.parser.base_dir
+
+				continue
+
+			fingerprint = hashlib.sha1("{0}\0{1}".format(base_dir, text).encode("utf-8")).hexdigest()
+
+			if fingerprint in unmatched:
+				endpoints = unmatched[fingerprint].pop()
+
+				if len(unmatched[fingerprint]) == 0:
+					del unmatched[fingerprint]
+			else:
+				endpoints = None
+
+			matched_statements.append((fingerprint, text, base_dir, endpoints))
+
+		# Remove whatever belonged to statements which are now gone
+
+		for endpoint_lists in unmatched.values():
+			for endpoints in endpoint_lists:
+				for method, components in endpoints:
+					self.parser.remove_endpoint(method, components)
+
+		# Then parse the new ones, which checks for redefinitions against the rest of the tree
+
+		new_statements = []
+
+		for fingerprint, text, base_dir, endpoints in matched_statements:
+			if endpoints is None:
+				endpoints = self.run_statement(text, base_dir)
+
+			new_statements.append((fingerprint, endpoints))
+
+		# Nothing needs writing when every statement was already there, in the same order
+
+		if new_statements != cached_statements:
+			self.save_cache(new_statements)
+
+		return self.parser.tree
+
+
+	def run_statement(self, text, base_dir):
+		""" Tokenises and parses the statement `text` beneath the base directory `base_dir`,
+			inserting its endpoints into the tree. Returns the endpoints which were inserted,
+			in the form (method, components).
+
+			Errors are found again by parsing the whole file, so they're reported with
+			the lines and columns they're at in the file, as opposed to the statement. """
+
+		tokenizer = Tokenizer.Tokenizer(text)
+
+		self.parser.scanner = Parser.Scanner(tokenizer.tokens())
+		self.parser.base_dir = base_dir
+		self.parser.journal = []
+
+		try:
+			self.parser.process_statement()
+		except ParseError:
+			raise FallbackRequired()
+
+		# Statements have to be made up of exactly the tokens in their text
+
+		if tokenizer.stopped_early or self.parser.scanner.current_token is not None or len(self.parser.conflicts) > 0:
+			raise FallbackRequired()
+
+		# Optionals can expand to the same place in the tree more than once (with different
+		# variable names), which can only be removed once
+
+		endpoints = []
+		keys = set()
+
+		for method, components in self.parser.journal:
+			key = (method, tuple(self.parser.component_key(component) for component in components))
+
+			if key not in keys:
+				keys.add(key)
+				endpoints.append((method, components))
+
+		self.parser.journal = None
+
+		return endpoints
+
+
+	def all_defined_classes(self):
+		"""Returns the classes defined inside the tree, as `Parser.all_defined_classes` does."""
+		return self.parser.all_defined_classes()
@@ -1,6 +1,7 @@
 import sys
 import re
 import itertools
+import weakref
 
 from Tokenizer import Token, EndpointToken, pairwise
 from enum import Enum
@@ -22,39 +23,129 @@ class Methods:
 class EndpointComponent:
 	""" Represents an entry inside the tree. A wildcard component matches
 		any non-null value, and a root components indicates the leaf node
-		of the tree, where the RedirectEntry resides. """
+		of the tree, where the RedirectEntry resides. An optional component
+		matches either any non-null value or nothing at all. """
 	
 	WILDCARD = "*"
 	ROOT = "/"
+	
+	# Only used when optionals are stored natively, as opposed to every path they expand to
+	OPTIONAL = "?"
 
 
 class RedirectEntry:
 	""" An entry at the end of the tree which describes how to invoke the
 		code upon this endpoint being called. It contains the path of the
-		file to call, the names of the parameters (if any), along with the
-		class name which will reside inside the file. """
+		file to call, the parameters (if any) as (position, name) pairs in
+		order of position, along with the class name which will reside
+		inside the file.
+		
+		Entries are immutable and compare equal when their values are, so a
+		single entry can be shared by every path which leads to it. """
+	
+	__slots__ = ("class_name", "file_name", "parameters", "hash_value", "serialised", "__weakref__")
+	
+	def __init__(self, class_name, file_name, parameters = ()):
+		parameters = tuple(sorted(dict(parameters).items()))
+		
+		object.__setattr__(self, "class_name", class_name)
+		object.__setattr__(self, "file_name", file_name)
+		object.__setattr__(self, "parameters", parameters)
+		object.__setattr__(self, "hash_value", hash((class_name, file_name, parameters)))
+		object.__setattr__(self, "serialised", None)
+	
+	def __setattr__(self, name, value):
+		raise AttributeError("can't set ‘{0}’, RedirectEntry is immutable".format(name))
 	
-	def __init__(self, class_name, file_name, parameter_names = {}):
-		self.parameter_names = parameter_names
-		self.class_name = class_name
-		self.file_name = file_name
+	def __delattr__(self, name):
+		raise AttributeError("can't delete ‘{0}’, RedirectEntry is immutable".format(name))
+	
+	def __eq__(self, other):
+		if not isinstance(other, RedirectEntry):
+			return NotImplemented
+		
+		return self is other or (self.class_name, self.file_name, self.parameters) == (other.class_name, other.file_name, other.parameters)
+	
+	def __hash__(self):
+		return self.hash_value
 	
 	def dict_value(self):
-		"""Returns a dictionary representation of itself"""
-		return {"file": self.file_name, "class": self.class_name, "parameters": self.parameter_names}
+		""" Returns a dictionary representation of itself, which is only built once and
+			must not be modified.
+			
+			Parameters are given as two lists of the same length, their names and the
+			positions of the components they take their values from, so request.php can
+			bind arguments by picking the value at each position. Entries without
+			parameters leave both out. """
+		
+		if self.serialised is None:
+			serialised = {"file": self.file_name, "class": self.class_name}
+			
+			if len(self.parameters) > 0:
+				serialised["names"] = [name for _, name in self.parameters]
+				serialised["positions"] = [position for position, _ in self.parameters]
+			
+			object.__setattr__(self, "serialised", serialised)
+		
+		return self.serialised
 	
 	def __repr__(self):
 		return str(self.dict_value())
+	
+	def __reduce__(self):
+		return (interned_entry, (self.class_name, self.file_name, self.parameters))
+
+
+# Entries which are currently in use, keyed by their class name, file name and parameters
+interned_entries = weakref.WeakValueDictionary()
+
+def interned_entry(class_name, file_name, parameters = ()):
+	""" Returns a RedirectEntry with the given values, which is shared with every
+		other entry with the same values. Optionals and repeated exports create many
+		identical entries, so this means only one of each is kept in memory. The
+		parameters can be given either as a dictionary or as (position, name) pairs. """
+	
+	key = (class_name, file_name, tuple(sorted(dict(parameters).items())))
+	entry = interned_entries.get(key)
+	
+	if entry is None:
+		entry = RedirectEntry(*key)
+		interned_entries[key] = entry
+	
+	return entry
+
+
+def located(message, location):
+	"""Prefixes an error message with the (line, column) it occurred at, if it's known."""
+	
+	if location is None:
+		return message
+	
+	return "line {0}, column {1}: {2}".format(location[0], location[1], message)
 
 
 class Scanner:
 	""" Takes a series of tokens generated by the tokeniser and provides
 		methods to interface with these tokens.
+		
+		The tokens can be any iterable, and are only consumed one at a time
+		as they're needed, so a generator can be given to parse lazily.
+		
+		If `locate` is given, it's called after each token is read and should
+		return the (line, column) the token was found at, which is then kept
+		in `current_location`.
 	"""
 	
-	def __init__(self, tokens):
-		self.tokens = tokens
-		self.current_token = tokens[0]
+	def __init__(self, tokens, locate = None):
+		self.tokens = iter(tokens)
+		self.locate = locate
+		self.advance()
+	
+	def advance(self):
+		"""Moves on to the next token, along with its location."""
+		
+		self.current_token = next(self.tokens, None)
+		self.current_location = self.locate() if self.locate is not None else None
 	
 	def lookahead(self):
 		"""Returns the token (and not the associated value) next in the list."""
@@ -71,13 +162,11 @@ class Scanner:
 		
 		if self.lookahead() in tokens:
 			to_return = self.current_token
-			
-			self.tokens = self.tokens[1:]			
-			self.current_token = None if len(self.tokens) == 0 else self.tokens[0]
+			self.advance()
 			
 			return to_return
 		else:
-			raise ParseError("expected one of " + str(tokens) + " but instead found " + str(self.lookahead()))
+			raise ParseError(located("expected one of " + str(tokens) + " but instead found " + str(self.lookahead()), self.current_location))
 
 
 class Parser:
@@ -89,16 +178,39 @@ class Parser:
 		names of parameters which should map to those sent as part of the request.
 	"""
 	
-	def __init__(self, tokens):
-		self.scanner = Scanner(tokens)
+	def __init__(self, tokens, tree = None, static_routes = None, native_optionals = False, canonical_paths = None, locate = None):
+		self.scanner = Scanner(tokens, locate)
 		self.base_dir = None
-		self.tree = {}
+		self.tree = {} if tree is None else tree
+		
+		# Endpoints without any variables, keyed by their method and path, e.g. 'GET/users/image'
+		self.static_routes = {} if static_routes is None else static_routes
+		
+		# Every path inside the tree, once optionals are expanded, as (method, keys) where
+		# variables are wildcards, e.g. ('GET', ('users', '*', 'image'))
+		self.canonical_paths = set() if canonical_paths is None else canonical_paths
+		
+		# Redefinitions found so far, which are all reported together once parsing is done
+		self.conflicts = []
+		
+		# Whether optionals are stored in the tree as they are, instead of every path they expand to
+		self.native_optionals = native_optionals
+		
+		# When set to a list, every endpoint inserted into the tree is recorded inside it
+		self.journal = None
+		
+		# Every file included so far, as (path, location), which are parsed separately
+		self.includes = []
 	
 	
 	def parse(self):
 		"""Parse the tokens and return a tree containing all endpoints in JSON form"""
 		
 		self.process_root_file()
+		
+		if len(self.conflicts) > 0:
+			raise ParseError("\n".join(self.conflicts))
+		
 		return self.tree
 
 
@@ -106,36 +218,144 @@ class Parser:
 		""" Returns all of the defined classes and files inside the tree in the form
 		    (class_name, file_name). """
 				
-		def all_values(tree):
+		def all_entries(tree):
 			for value in tree.values():
 				if type(value) is dict:
-					yield from all_values(value)
+					yield from all_entries(value)
 				else:
-					yield (value.class_name, value.file_name)
+					yield value
 		
-		return set(all_values(self.tree))
+		# Entries are shared and hashable, so each distinct one is only looked at once
+		return {(entry.class_name, entry.file_name) for entry in set(all_entries(self.tree))}
+	
+	
+	@staticmethod
+	def component_key(component):
+		""" Returns the key inside the tree for a component in the form (name, is_variable),
+			or (name, is_variable, is_optional) when optionals are stored natively. """
 		
+		if len(component) > 2 and component[2]:
+			return EndpointComponent.OPTIONAL
+		
+		name, is_variable = component[:2]
+		
+		return EndpointComponent.WILDCARD if is_variable else name # Variables are wildcards
+	
+	
+	@staticmethod
+	def canonical_path(method, components):
+		""" Given endpoint components in the form (name, is_variable), returns the key of
+			the endpoint inside the set of canonical paths. """
+		
+		return (method, tuple(EndpointComponent.WILDCARD if is_variable else name for name, is_variable in components))
+	
+	
+	def canonical_paths_for(self, method, components):
+		""" Returns the canonical path of every endpoint given by components, in the same
+			form given to `insert_endpoint`. Natively stored optionals lead to every path
+			they expand to, so that redefinitions are found in the same way either way. """
+		
+		if self.native_optionals:
+			return [self.canonical_path(method, endpoint) for endpoint in self.expanded_components(components)]
+		
+		return [self.canonical_path(method, components)]
+	
 	
 	def endpoint_exists(self, method, components):
 		""" Given endpoint components in the form (name, is_variable), returns whether
 			an equivalent endpoint already exists inside the tree. """
 		
+		return self.canonical_path(method, components) in self.canonical_paths
+	
+	
+	@staticmethod
+	def static_route_key(method, components):
+		""" Given endpoint components in the form (name, is_variable), returns the key of
+			the endpoint inside the static route index, or None if it has variables.
+			
+			Natively stored optionals are left out, as the endpoint without any of
+			them is the only one which could be static. """
+		
+		required = [component for component in components if len(component) < 3 or not component[2]]
+		
+		if any(is_variable for _, is_variable, *_ in required):
+			return None
+		
+		return method + "/" + "/".join(name for name, *_ in required)
+	
+	
+	def insert_endpoint(self, method, components, entry):
+		""" Inserts the RedirectEntry `entry` into the tree at the endpoint given by
+			components in the form (name, is_variable), or (name, is_variable, is_optional)
+			when optionals are stored natively. Endpoints without variables are also added
+			to the static route index. """
+		
 		if not method in self.tree:
-			return False # Obviously not in there
+			self.tree[method] = {}
 		
+		current = self.tree[method]
+		
+		for component in components:
+			key = self.component_key(component)
+			
+			if not key in current:
+				current[key] = {}
+			
+			current = current[key]
+		
+		# The end of the tree is here and this is where our entry belongs
+		current[EndpointComponent.ROOT] = entry
+		
+		self.canonical_paths.update(self.canonical_paths_for(method, components))
+		
+		static_key = self.static_route_key(method, components)
+		
+		if static_key is not None:
+			
+			# Parameters only belong to optionals which aren't there in the static route
+			
+			if len(entry.parameters) > 0:
+				entry = interned_entry(entry.class_name, entry.file_name)
+			
+			self.static_routes[static_key] = entry
+		
+		if self.journal is not None:
+			self.journal.append((method, tuple(components)))
+	
+	
+	def remove_endpoint(self, method, components):
+		""" Removes the entry at the endpoint given by components, in the same form given
+			to `insert_endpoint`, from the tree along with any parts of the tree which
+			become empty as a result. """
+		
+		path = [(self.tree, method)]
 		sub_tree = self.tree[method]
 		
-		for name, is_variable in components:
-			key = name if not is_variable else EndpointComponent.WILDCARD # Variables are wildcards
+		for component in components:
+			key = self.component_key(component)
 			
-			if key in sub_tree:
-				sub_tree = sub_tree[key] # Go down another level
-			else:
-				return False # Not a chance
+			path.append((sub_tree, key))
+			sub_tree = sub_tree[key]
 		
-		return EndpointComponent.ROOT in sub_tree # Should be true at this stage, but double check
-
-
+		del sub_tree[EndpointComponent.ROOT]
+		
+		self.canonical_paths.difference_update(self.canonical_paths_for(method, components))
+		
+		static_key = self.static_route_key(method, components)
+		
+		if static_key is not None:
+			del self.static_routes[static_key]
+		
+		# Work back up the tree, removing each level until one isn't empty
+		
+		for parent, key in reversed(path):
+			if len(parent[key]) > 0:
+				break
+			
+			del parent[key]
+	
+	
+	@staticmethod
 	def readable_components(components):
 		""" Given endpoint components in the form (name, is_variable), returns the
 			human-readable representation of those components.
@@ -157,7 +377,7 @@ class Parser:
 		return "/".join(decorated)
 
 	
-	# The following five methods comprise the recursive-descent parser
+	# The following six methods comprise the recursive-descent parser
 	
 	def process_root_file(self):
 		""" The initial parsing method. This method looks for acceptable
@@ -165,7 +385,7 @@ class Parser:
 		
 		self.process_statement()
 		
-		while self.scanner.lookahead() in [Token.GROUP, Token.EXPORT, Token.BASE]:
+		while self.scanner.lookahead() in [Token.GROUP, Token.EXPORT, Token.BASE, Token.INCLUDE]:
 			self.process_statement()
 	
 	
@@ -210,21 +430,39 @@ class Parser:
 			self.base_dir = base_value
 	
 	
+	def process_include(self):
+		""" Parses an 'include' directive, with the following syntax:
+		
+			include <file>
+			
+			The file is only recorded, along with where it was included, as each
+			included file is parsed on its own with its own base directory.
+		"""
+		
+		location = self.scanner.current_location
+		
+		self.scanner.consume(Token.INCLUDE)
+		_, file_name = self.scanner.consume(Token.STRING)
+		
+		self.includes.append((file_name, location))
+	
+	
 	def process_statement(self):
-		""" Parses either a 'group', 'export' or 'base' directive by calling
-			the appropriate parsing method, or by raising an exception if an
-			unexpected token is found. """
+		""" Parses either a 'group', 'export', 'base' or 'include' directive by
+			calling the appropriate parsing method, or by raising an exception if
+			an unexpected token is found. """
 		
 		next = {
 			Token.GROUP: self.process_group,
 			Token.EXPORT: self.process_export,
-			Token.BASE: self.process_base
+			Token.BASE: self.process_base,
+			Token.INCLUDE: self.process_include
 		}
 		
 		if self.scanner.lookahead() in next:
 			next[self.scanner.lookahead()]()
 		else:
-			raise ParseError("expected one of " + str(next.keys()) + " but instead found " + str(scanner.lookahead()))
+			raise ParseError(located("expected one of " + str(next.keys()) + " but instead found " + str(self.scanner.lookahead()), self.scanner.current_location))
 	
 	
 	def process_components(self):
@@ -279,6 +517,7 @@ class Parser:
 						   Token.POST: Methods.POST,
 						   Token.DELETE: Methods.DELETE}
 		
+		location = self.scanner.current_location
 		self.scanner.consume(Token.EXPORT)
 		
 		token = self.scanner.consume(Token.GET, Token.POST, Token.PUT, Token.DELETE)
@@ -291,9 +530,12 @@ class Parser:
 		if endpoint_prefix_components is not None:
 			nondeterministic_endpoints = endpoint_prefix_components + nondeterministic_endpoints
 		
-		# Make them all deterministic so we can insert them into the tree
+		# Make sure they can be made deterministic, so we can insert them into the tree
 		
-		endpoints = self.deterministic_components(nondeterministic_endpoints)
+		try:
+			self.validate_components(nondeterministic_endpoints)
+		except ParseError as error:
+			raise ParseError(located(str(error), location))
 		
 		self.scanner.consume(Token.TO)
 		
@@ -315,35 +557,97 @@ class Parser:
 		
 		file_name = prepend + '/' + file_name.strip('/')
 		
-		# Add these endpoints to the tree, but first make sure an equivalent path doesn't already exist
+		# Add these endpoints to the tree, but first make sure an equivalent path doesn't already exist.
+		# Exports which redefine endpoints are left out, so parsing can go on to find any others
 		
-		for endpoint in endpoints:
-			if self.endpoint_exists(http_method, endpoint):
-				raise ParseError("redefinition of endpoint ‘{0}’ for HTTP method ‘{1}’".format(readable_components(endpoint), http_method))
+		conflicts = [endpoint for endpoint in self.expanded_components(nondeterministic_endpoints) if self.endpoint_exists(http_method, endpoint)]
 		
-		if not http_method in self.tree:
-			self.tree[http_method] = {}
+		if len(conflicts) > 0:
+			for endpoint in conflicts:
+				message = "redefinition of endpoint ‘{0}’ for HTTP method ‘{1}’".format(self.readable_components(endpoint), http_method)
+				self.conflicts.append(located(message, location))
+			
+			return
+		
+		# Natively stored optionals only need one entry, with parameters positioned as
+		# the endpoint was written (where any optionals left out still take up a position)
+		
+		if self.native_optionals:
+			parameters = {i: name for i, (name, is_variable, is_optional) in enumerate(nondeterministic_endpoints) if is_variable or is_optional}
+			self.insert_endpoint(http_method, nondeterministic_endpoints, interned_entry(class_name, file_name, parameters))
+			
+			return
 		
 		# Actually insert the RedirectEntry into the tree for each endpoint
 		
-		for endpoint in endpoints:
+		for endpoint in self.expanded_components(nondeterministic_endpoints):
 					
 			# Figure out the parameters and their positions
 			parameters = {i: name for i, (name, is_variable) in enumerate(endpoint) if is_variable}
-			entry = RedirectEntry(class_name, file_name, parameters)
+			entry = interned_entry(class_name, file_name, parameters)
+			
+			self.insert_endpoint(http_method, endpoint, entry)
+	
+	
+	def validate_components(self, nondeterministic_components):
+		""" Raises an exception if the given components, in the form (name, is_variable,
+			is_optional), can't be made deterministic without ambiguity. """
+		
+		# Make sure we don't have two consecutive optional components
 			
-			current = self.tree[http_method]
+		for pair1, pair2 in pairwise(nondeterministic_components):
 			
-			for name, is_variable in endpoint:
-				key = name if not is_variable else EndpointComponent.WILDCARD # Variables translate to wildcards
-				
-				if not key in current:
-					current[key] = {}
+			parameter_name1, _, is_optional1 = pair1
+			parameter_name2, _, is_optional2 = pair2
+			
+			if is_optional1 and is_optional2:
+				raise ParseError("two consecutive optional components introduces unresolvable ambiguity between parameters ‘{0}’ and ‘{1}’".format(parameter_name1, parameter_name2))
+		
+		# Make sure parameter names aren't reused, whether they're variables or optionals
+		
+		parameter_names = set()
+		
+		for name, is_variable, is_optional in nondeterministic_components:
+			if is_variable or is_optional:
+				if name in parameter_names:
+					raise ParseError("parameter name ‘{0}’ is used more than once".format(name))
 				
-				current = current[key]
+				parameter_names.add(name)
 	
-			# The end of the tree is here and this is where our entry belongs
-			current[EndpointComponent.ROOT] = entry
+	
+	def expanded_components(self, nondeterministic_components):
+		""" Lazily yields each of the routes given by `deterministic_components`, in the
+			same order, as tuples. The components must already have been validated.
+			
+			The components are split into the runs of required components between each
+			optional, and routes are generated depth-first from there. Every route beneath
+			a prefix shares that prefix, so each route only costs as much as yielding it.
+		"""
+		
+		segments, optionals = [[]], []
+		
+		for name, is_variable, is_optional in nondeterministic_components:
+			if is_optional:
+				optionals.append((name, True)) # It's a variable when it's there
+				segments.append([])
+			else:
+				segments[-1].append((name, is_variable))
+		
+		segments = [tuple(segment) for segment in segments]
+		
+		def expand(index, prefix):
+			prefix += segments[index]
+			
+			if index == len(optionals):
+				yield prefix
+				return
+			
+			# Where the optional is there, and then where it's left out
+			
+			yield from expand(index + 1, prefix + (optionals[index],))
+			yield from expand(index + 1, prefix)
+		
+		return expand(0, ())
 	
 	
 	def deterministic_components(self, nondeterministic_components):
@@ -376,57 +680,7 @@ class Parser:
 					- image/[a]/c/[d]
 					- image/[a]/c
 		"""
-			
-		# Make sure we don't have two consecutive optional components
-			
-		for pair1, pair2 in pairwise(nondeterministic_components):
-			
-			parameter_name1, _, is_optional1 = pair1
-			parameter_name2, _, is_optional2 = pair2
-			
-			if is_optional1 and is_optional2:
-				raise ParseError("two consecutive optional components introduces unresolvable ambiguity between parameters ‘{0}’ and ‘{1}’".format(parameter_name1, parameter_name2))
-			
-		# Make sure parameter names aren't reused
-			
-		parameter_names = [name for name, is_variable, _ in nondeterministic_components if is_variable]
-		all_duplicate_parameters = list(set(name for name in parameter_names if parameter_names.count(name) > 1))
-			
-		if len(all_duplicate_parameters) > 0:
-			raise ParseError("parameter name ‘{0}’ is used more than once".format(all_duplicate_parameters[0]))
-			
-		# If there are no optionals, we're done (base case)
-			
-		optionals_exist = any(is_optional for _, _, is_optional in nondeterministic_components)
-			
-		if not optionals_exist:
-			# Return it in the form [(name, is_variable), ...]
-			return [[(name, is_variable) for name, is_variable, _ in nondeterministic_components]]
-		else:
-			# An optional parameter can either exist or not, so we need to find paths for both circumstances
-			# Make the first optional we see a variable and not optional, then recurse
-			
-			components_copy = nondeterministic_components[:]
-			first_optional_index = None
-			
-			for i in range(len(nondeterministic_components)):
-				name, _, is_optional = components_copy[i]
-				
-				if is_optional:
-					components_copy[i] = (name, True, False) # (name, is a variable, isn't an optional)
-					first_optional_index = i
-					
-					break # Only want the first one
-			
-			concrete_optional_paths = self.deterministic_components(components_copy)
-			
-			# Remove the first optional and recurse
-			
-			optional_removed_copy = nondeterministic_components[:]
-			del optional_removed_copy[first_optional_index]
-			
-			without_optional_paths = self.deterministic_components(optional_removed_copy)
-			
-			# total paths = paths without optional + paths with optional as a variable
-			
-			return concrete_optional_paths + without_optional_paths
\ No newline at end of file
+		
+		self.validate_components(nondeterministic_components)
+		
+		return [list(endpoint) for endpoint in self.expanded_components(nondeterministic_components)]
@@ -15,7 +15,7 @@ class Token(Enum):
 	""" Represents a token found in the high-level syntax, but before endpoint
 		component parsing."""
 	
-	EXPORT, GROUP, BASE, STRING, TO, IN, GET, POST, PUT, DELETE = range(10)
+	EXPORT, GROUP, BASE, STRING, TO, IN, GET, POST, PUT, DELETE, INCLUDE = range(11)
 
 
 class EndpointToken(Enum):
@@ -33,6 +33,34 @@ class EndpointToken(Enum):
 	COMPONENT, SEPARATOR, VARIABLE, OPTIONAL = range(4)
 
 
+# Whitespace is defined as being one of either a space, tab, newline or carriage return
+whitespace_regex = re.compile('[ \t\n\r]*')
+
+# Compiled master patterns, keyed on the (token, regex) pairs they were built from
+compiled_patterns = {}
+
+def master_pattern(token_regexes):
+	""" Compiles a list of (token, regex) pairs into a single pattern which, when matched
+		at a position, skips any leading whitespace and then tries every token regex at
+		that position in one pass.
+		
+		Each regex is wrapped inside an optional lookahead with its own named group, so
+		the group for every regex which matches is populated regardless of the order in
+		which they appear. This lets the caller pick the longest match, as opposed to the
+		first alternative which matches (which is what a plain alternation would give).
+		
+		Patterns are cached, so each list of regexes is only ever compiled once.
+	"""
+	
+	key = tuple(token_regexes)
+	
+	if key not in compiled_patterns:
+		alternatives = "".join("(?:(?=(?P<t{0}>{1})))?".format(i, regex) for i, (_, regex) in enumerate(token_regexes))
+		compiled_patterns[key] = re.compile(whitespace_regex.pattern + alternatives)
+	
+	return compiled_patterns[key]
+
+
 class GenericTokenizer:
 	""" Performs tokenisation in the most generic sense, given a list of (token, regex)
 		pairs.
@@ -45,28 +73,12 @@ class GenericTokenizer:
 	def __init__(self, input_string, token_regexes):
 		self.input_string = input_string
 		self.current_char_index = 0
+		self.token_start = 0
 		self.token_regexes = token_regexes
+		self.pattern = master_pattern(token_regexes)
+		self.group_names = ["t" + str(i) for i in range(len(token_regexes))]
 		self.current_token = self.next_token()
 	
-	def skip_whitespace(self):
-		""" Removes all whitespace from the current position in the string forward.
-			Whitespace is defined as being either a space, newline, or carriage return.
-		"""
-		
-		# Make sure we don't go over the length of the string
-		if self.current_char_index >= len(self.input_string) - 1:
-			return
-		
-		# Whitespace is defined as being one of either a space, newline or carriage return
-		
-		while self.input_string[self.current_char_index] in [' ', '\t', '\n', '\r']:
-		
-			# Sanity checking again
-			if self.current_char_index < len(self.input_string) - 1:
-				self.current_char_index += 1
-			else:
-				break
-	
 	def next_token(self):
 		""" Attempts to match a token from the current position in the string forward.
 			Longer matches are preferred, essentially to mimic Flex behaviour.
@@ -75,22 +87,24 @@ class GenericTokenizer:
 			match wasn't found.
 		"""
 		
-		self.skip_whitespace()
+		# Skip the whitespace and try every regex at once, without copying the input
+		match = self.pattern.match(self.input_string, self.current_char_index)
 		
 		# We have nothing to begin with
 		matched_value, token = '', None
 		
-		# Match for a token, starting at the top of the list downward
+		# Prefer longer matches, and the regex highest in the list where they're equal
 		
-		for current_token, token_regex in self.token_regexes:
-			match = re.match(token_regex, self.input_string[self.current_char_index:])
+		for (current_token, _), group_name in zip(self.token_regexes, self.group_names):
+			value = match.group(group_name)
 			
-			# Prefer longer matches
-			if match and match.end() > len(matched_value):
-				matched_value, token = match.group(), current_token
+			if value is not None and len(value) > len(matched_value):
+				matched_value, token = value, current_token
+		
+		# The lookaheads don't consume anything, so the match ends after the whitespace
+		self.token_start = match.end()
+		self.current_char_index = self.token_start + len(matched_value)
 		
-		self.current_char_index += len(matched_value)
-				
 		return token, matched_value
 
 
@@ -100,27 +114,26 @@ class BaseTokenizer(GenericTokenizer):
 		instead leaving this for a later stage.
 	"""
 	
-	def all_tokens(self):
-		""" Returns all tokens found in the tokenisation process. Return items are given
+	def tokens(self):
+		""" Lazily yields each token found in the tokenisation process. Items are given
 			as their token value if they aren't a string token, otherwise as a
 			(token, string value) pair.
 		"""
 		
-		tokens = []
 		current_token, match = self.current_token
-
-		# Tokenise the input and place the tokens into a list for further parsing
-
+		
 		while current_token is not None:
 			if current_token == Token.STRING:
-				tokens.append((Token.STRING, match[1:-1])) # Remove the quotes
+				yield (Token.STRING, match[1:-1]) # Remove the quotes
 			else:
-				tokens.append(current_token)
+				yield current_token
 			
 			# Next one please
 			current_token, match = self.next_token()
-		
-		return tokens
+	
+	def all_tokens(self):
+		""" Returns all tokens found in the tokenisation process, as a list."""
+		return list(self.tokens())
 
 
 class EndpointTokenizer(GenericTokenizer):
@@ -128,17 +141,14 @@ class EndpointTokenizer(GenericTokenizer):
 		An example of an endpoint component string is: /image/[id]?/large/[type]
 	"""
 	
-	def all_tokens(self):
-		""" Returns all tokens found in the tokenisation process. Tokens are returned
+	def tokens(self):
+		""" Lazily yields each token found in the tokenisation process. Tokens are given
 			in the form (token, string value), unless it is a separator token, in
-			which case only the separator token is added.
+			which case only the separator token is given.
 		"""
 		
-		tokens = []
 		current_token, match = self.current_token
-
-		# Tokenise the input and place the tokens into a list for further parsing
-
+		
 		while current_token is not None:
 			string_value = None
 			
@@ -150,19 +160,28 @@ class EndpointTokenizer(GenericTokenizer):
 				string_value = match
 			
 			if string_value is None:
-				tokens.append(current_token)
+				yield current_token
 			else:
-				tokens.append((current_token, string_value))
+				yield (current_token, string_value)
 			
 			# Next one please
 			current_token, match = self.next_token()
-		
-		return tokens
+	
+	def all_tokens(self):
+		""" Returns all tokens found in the tokenisation process, as a list."""
+		return list(self.tokens())
 
 		
 class Tokenizer:
 	""" Takes an input string containing an endpoint definition file and returns the
 		tokens which it comprise. An exception is thrown if the input string is invalid.
+		
+		The input can also be given as an iterable of lines (such as a file handle), in
+		which case tokens are produced as the lines are read. No token can span more than
+		one line, so this gives exactly the same tokens as the whole string would.
+		
+		The line and column at which the most recent high-level token began can be
+		found with `current_location`.
 	"""
 	
 	http_methods = [Token.GET, Token.POST, Token.PUT, Token.DELETE]
@@ -172,6 +191,7 @@ class Tokenizer:
 		(Token.EXPORT, 'export'),
 		(Token.GROUP, 'group'),
 		(Token.BASE, 'base'),
+		(Token.INCLUDE, 'include'), # Longer than 'in', so it's preferred where both match
 		(Token.TO, 'to'),
 		(Token.IN, 'in'),
 		(Token.GET, 'GET'),
@@ -189,37 +209,67 @@ class Tokenizer:
 		(EndpointToken.COMPONENT, '[A-Za-z0-9_\-.]+')
 	]
 	
-	def __init__(self, endpoint_definition_string):
-		self.input_string = endpoint_definition_string
+	def __init__(self, endpoint_definition):
+		self.input_lines = endpoint_definition.splitlines(True) if isinstance(endpoint_definition, str) else endpoint_definition
+		
+		# Becomes True once tokenisation stops at input which couldn't be matched
+		self.stopped_early = False
+		
+		# The (line, column) of the most recent high-level token, both starting at 1
+		self.location = None
 	
-	def all_tokens(self):
-		""" Performs parsing of the given input string, in two stages.
+	def base_tokens(self):
+		""" Yields the tokens from the first pass of the tokenizer, one line at a time.
+			Tokenisation stops at the first piece of input which can't be matched, as
+			it would if the input was tokenised as a single string.
+		"""
 		
-			First, it performs high-level tokenisation, and then scans the tokens for places
-			where endpoint components could exist, and then further tokenises those.
+		for line_number, line in enumerate(self.input_lines, 1):
+			tokenizer = BaseTokenizer(line, self.token_regex)
 			
-			Returns a list of tokens, where entries are just either the token or a (token, value)
+			for token in tokenizer.tokens():
+				self.location = (line_number, tokenizer.token_start + 1)
+				yield token
+			
+			# Anything left over on the line means the input wasn't valid past this point
+			if tokenizer.current_char_index < len(line):
+				self.stopped_early = True
+				return
+	
+	def tokens(self):
+		""" Performs lazy parsing of the given input, in two stages.
+		
+			First, it performs high-level tokenisation, and then looks for tokens where
+			endpoint components could exist, and then further tokenises those as they
+			are found.
+			
+			Yields tokens, where entries are just either the token or a (token, value)
 			pair if that token has meaning encapsulated in a value.
 		"""
 		
-		# Obtain the set of tokens after the first pass of the tokenizer
-		initial_tokens = BaseTokenizer(self.input_string, self.token_regex).all_tokens()
+		previous_token = None
 		
-		# Then further parse endpoint strings, which come directly after either a HTTP method
-		# or a group definition (not terribly efficient but you'll never notice)
+		# Endpoint strings come directly after either a HTTP method or a group definition
 		
-		for index, (token, string_value_tuple) in enumerate(pairwise(initial_tokens)):
+		for token in self.base_tokens():
 			
-			if type(string_value_tuple) is tuple and (token in self.http_methods or token is Token.GROUP):
+			if type(token) is tuple and (previous_token in self.http_methods or previous_token is Token.GROUP):
 				
-				# Parse the endpoint and insert the parsed tokens into the previously generated tokens
-				index_to_replace = index + 1
-				_, endpoint_string = string_value_tuple
-				
-				# Get the tokens from the endpoint string
-				parsed_endpoint = EndpointTokenizer(endpoint_string, self.endpoint_token_regex).all_tokens()
-				
-				# Insert the new tokens and overwrite the old string token
-				initial_tokens[index_to_replace:index_to_replace + 1] = parsed_endpoint
-		
-		return initial_tokens
\ No newline at end of file
+				# Get the tokens from the endpoint string in place of the string token
+				_, endpoint_string = token
+				yield from EndpointTokenizer(endpoint_string, self.endpoint_token_regex).tokens()
+			
+			else:
+				yield token
+			
+			previous_token = token
+	
+	def all_tokens(self):
+		""" Returns a list of all of the tokens yielded by `tokens`."""
+		return list(self.tokens())
+	
+	def current_location(self):
+		""" Returns the (line, column) at which the high-level token most recently
+			yielded began, which for endpoint tokens is that of their endpoint string,
+			or None if nothing has been yielded yet. """
+		return self.location
@@ -1,43 +1,428 @@
 import sys
 import os
-import ctypes
-import argparse
-import json
-import shutil
-from pprint import pprint
 
-import Tokenizer
-import Parser
-
-from Parser import EndpointComponent
+# Everything else is imported where it's needed, so the command line starts quickly
+# and each mode only imports what it uses
 
 class CommonNames:
 	EndpointDefinitionFile = ".definition.json"
+	RouteTableFile = ".definition.php"
+	BinaryRouteTableFile = ".definition.bin"
+	ProjectSettingsFile = ".settings.json"
 	EndpointDefinitionReadableFile = ".definition"	
+	StatementCacheFile = ".definition.statements"
+	IncludeCacheFile = ".definition.includes"
+	IncludedFilesFile = ".definition.included"
+	ManifestFile = ".manifest.json"
+	AutoloadFile = "autoload.php"
+	PreloadFile = "preload.php"
 	HypertextAccessFile = ".htaccess"
 	EngineDirectoryName = "engine"
+	RouteStubDirectoryName = "routes"
+
+
+# The settings a project is created with, unless they're overridden
+default_project_settings = {"router": "tree", "optionals": "expanded", "format": "nested", "rewrite": "request"}
+
+# How many class files are written at once, unless it's overridden
+default_workers = (os.cpu_count() or 1) * 5
+
+# Templates which have been loaded, keyed by their file name inside /templates
+loaded_templates = {}
 
+placeholder_pattern = r"\[(name|classes|files|rules|entry|include-directory-location)\]"
 
-def parse_definition_file(file_handle=sys.stdin):
+
+class CommandError(Exception):
+	"""Raised when a command can't be carried out, with the reason why"""
+	pass
+
+
+def parse_definition_file(file_handle=sys.stdin, settings=default_project_settings, include_directory=None, include_cache_path=None):
 	
-	# Get the definition file
-	definition_file = file_handle.read()
+	""" Parses the definition file read from file_handle, returning its text along with
+	    its compiled outputs and defined classes. Files it includes are found inside
+	    include_directory (or the working directory), and are among the outputs so the
+	    project has its own copy of each, along with a list of them.
+	"""
 	
-	# Make some tokens out of it
+	import Tokenizer
+	import Parser
+	import Includes
 	
-	tokenizer = Tokenizer.Tokenizer(definition_file)
-	tokens = tokenizer.all_tokens()
+	# Read the definition file line by line, keeping hold of what's read so far
+	
+	definition_lines = []
+	lines = iter(file_handle)
+	
+	def recorded_lines():
+		for line in lines:
+			definition_lines.append(line)
+			yield line
+	
+	# Make some tokens out of it, which are only produced as the parser needs them
+	
+	tokenizer = Tokenizer.Tokenizer(recorded_lines())
+	tokens = tokenizer.tokens()
 	
 	# Parse and create a redirect tree from the tokens
 	
-	parser = Parser.Parser(tokens)
+	parser = Parser.Parser(tokens, native_optionals=settings["optionals"] == "native", locate=tokenizer.current_location)
 	out_tree = parser.parse()
 	
-	# Return a JSON-encoded object
+	# Parsing may have stopped early, but the whole definition file is still needed
+	
+	definition_lines.extend(lines)
+	definition_file = "".join(definition_lines)
+	
+	included = Includes.merge_included_files(parser, include_directory or os.getcwd(), include_cache_path)
+	
+	outputs = compiled_outputs(out_tree, parser.static_routes, settings)
+	outputs.update(included_outputs(included))
+	
+	return definition_file, outputs, parser.all_defined_classes()
+
+
+def parse_definition_file_incrementally(file_handle, cache_file_path, settings=default_project_settings, include_directory=None, include_cache_path=None):
+	
+	""" Parses the definition file as `parse_definition_file` does, but only parses the
+	    statements which have changed since the last time, using the statement cache
+	    located at cache_file_path.
+	"""
+	
+	import Incremental
+	import Includes
+	
+	definition_file = file_handle.read()
+	
+	parser = Incremental.IncrementalParser(cache_file_path, settings["optionals"] == "native")
+	out_tree = parser.parse(definition_file)
+	
+	# The statement cache has already been written, so it only ever holds the definition file's own endpoints
+	included = Includes.merge_included_files(parser.parser, include_directory or os.getcwd(), include_cache_path)
+	
+	outputs = compiled_outputs(out_tree, parser.parser.static_routes, settings)
+	outputs.update(included_outputs(included))
+	
+	return definition_file, outputs, parser.all_defined_classes()
+
+
+def compile_definition_file(file_handle, settings=default_project_settings, compile_cache=None, statement_cache_path=None, include_directory=None, include_cache_path=None):
+	
+	""" Returns the definition file read from file_handle, along with its compiled outputs
+	    and defined classes, as `parse_definition_file` does.
+	    
+	    When compile_cache is given and already has the outputs of an identical definition
+	    file compiled with the same settings, and every file they include is unchanged,
+	    they're used without tokenising or parsing anything. Otherwise the definition file is
+	    parsed (incrementally, when the path to the statement cache is given) and the
+	    outputs are added to the compile cache.
+	"""
+	
+	import io
+	
+	def parse(file_handle):
+		if statement_cache_path is None:
+			return parse_definition_file(file_handle, settings, include_directory, include_cache_path)
+		else:
+			return parse_definition_file_incrementally(file_handle, statement_cache_path, settings, include_directory, include_cache_path)
+	
+	if compile_cache is None:
+		return parse(file_handle)
+	
+	# The whole definition file is needed up front to find it inside the cache
+	
+	definition_file = "".join(file_handle)
+	cached = compile_cache.load(definition_file, settings)
 	
-	json_object = json.dumps(out_tree, default=lambda x: x.dict_value())
+	if cached is not None and included_files_unchanged(cached[0], include_directory or os.getcwd()):
+		outputs, defined_classes = cached
+		return definition_file, outputs, defined_classes
 	
-	return definition_file, json_object, parser.all_defined_classes()
+	_, outputs, defined_classes = parse(io.StringIO(definition_file))
+	compile_cache.store(definition_file, settings, outputs, defined_classes)
+	
+	return definition_file, outputs, defined_classes
+
+
+def included_outputs(included):
+	
+	""" Returns the outputs for the included definition files, given as (path, text): a
+	    copy of each one, along with the list of them, so the project knows which files
+	    it has copies of. Nothing is returned when there aren't any.
+	"""
+	
+	outputs = dict(included)
+	
+	if len(included) > 0:
+		outputs[CommonNames.IncludedFilesFile] = "".join(path + "\n" for path, _ in included)
+	
+	return outputs
+
+
+def included_files_unchanged(outputs, include_directory):
+	
+	""" Returns whether each of the included definition files listed among the compiled
+	    outputs is still the same inside include_directory, as they're left out of the
+	    compile cache's key.
+	"""
+	
+	for path in outputs.get(CommonNames.IncludedFilesFile, "").splitlines():
+		try:
+			with open(os.path.join(include_directory, path), encoding="utf-8") as included_file:
+				if included_file.read() != outputs[path]:
+					return False
+		except (OSError, UnicodeDecodeError):
+			return False
+	
+	return True
+
+
+def compiled_outputs(out_tree, static_routes, settings):
+	
+	""" Returns the files generated from the redirect tree out_tree, and the index of
+	    endpoints without variables static_routes, as a dictionary mapping each file
+	    name to its contents. The project's settings determine which router the
+	    route table is compiled for, and the format it's written in.
+	"""
+	
+	import json
+	import hashlib
+	import Emitter
+	
+	serialise = lambda x: x.dict_value()
+	
+	# The route table has the static routes which can be looked up directly, and either
+	# the tree to walk or the patterns to match for everything else. Every component
+	# written in the tree is listed too, so the runtime can tell which parts of a request
+	# could only ever be the value of a variable
+	
+	route_table = {"router": settings["router"], "optionals": settings["optionals"], "format": settings["format"]}
+	route_table["vocabulary"] = {component: 1 for component in sorted(Emitter.vocabulary(out_tree))}
+	
+	if settings["router"] == "regex":
+		route_table["regex"] = Emitter.regex_routes(out_tree)
+	
+	outputs = {}
+	
+	if settings["format"] == "binary":
+		
+		# Binary trees are searched by the runtime as they are. The route table says which
+		# version of the layout it's in, and the table itself is only added to the PHP
+		# file (below), with a file of its own for when the JSON file is used instead
+		
+		binary_tree = Emitter.binary_tree(out_tree if settings["router"] == "tree" else {}, static_routes)
+		route_table["version"] = Emitter.BINARY_VERSION
+		
+		outputs[CommonNames.BinaryRouteTableFile] = binary_tree
+		
+	elif settings["format"] in ["shared", "compact"]:
+		
+		# Shared trees only include identical parts of the tree (and identical entries)
+		# once, which the runtime refers to by their index. Compact trees are shared too,
+		# but with every string in a table of its own and each node and entry as a flat
+		# list of integers, so there's less for the runtime to load
+		
+		table_function = Emitter.shared_tree if settings["format"] == "shared" else Emitter.compact_tree
+		route_table.update(table_function(out_tree if settings["router"] == "tree" else {}, static_routes))
+		
+	else:
+		route_table["static"] = static_routes
+		
+		if settings["router"] == "tree":
+			route_table["tree"] = out_tree
+	
+	# The checksum changes whenever anything the runtime could find does, so anything it
+	# keeps between requests can be told apart from what an older route table found
+	
+	checksum = hashlib.sha256(Emitter.php_value(route_table, default=serialise).encode("utf-8"))
+	
+	if settings["format"] == "binary":
+		checksum.update(outputs[CommonNames.BinaryRouteTableFile])
+	
+	route_table["checksum"] = checksum.hexdigest()
+	
+	outputs.update(rewrite_outputs(out_tree, static_routes, settings))
+	
+	# Nested trees are written to the JSON file as just the tree, but everything else as
+	# the whole route table. The route table is also written as a PHP array, which
+	# opcache can hold on to between requests
+	
+	outputs[CommonNames.EndpointDefinitionFile] = json.dumps(out_tree if settings["format"] == "nested" else route_table, default=serialise)
+	
+	# As a string literal, opcache keeps a binary table in shared memory where every worker
+	# reads it without a copy of its own
+	
+	if settings["format"] == "binary":
+		route_table["binary"] = outputs[CommonNames.BinaryRouteTableFile]
+	
+	outputs[CommonNames.RouteTableFile] = Emitter.php_file(route_table, default=serialise)
+	
+	return outputs
+
+
+def rewrite_outputs(out_tree, static_routes, settings):
+	
+	""" Returns the .htaccess file for the redirect tree out_tree, and the index of endpoints
+	    without variables static_routes, along with a stub inside engine/routes for each
+	    entry which it sends requests to directly, as a dictionary mapping each file name
+	    to its contents. Unless the project's settings say to send requests directly, every
+	    request is sent to engine/request.php.
+	"""
+	
+	import hashlib
+	import Emitter
+	
+	outputs = {}
+	rules = []
+	
+	if settings["rewrite"] == "direct":
+		rules.append("# Endpoints which are sent straight to their handler, without finding them at runtime")
+		
+		for method, pattern, entry in Emitter.direct_routes(out_tree, static_routes, settings["optionals"] == "native"):
+			
+			# Each stub is named after its entry, so it keeps its name as other endpoints change
+			
+			entry_value = Emitter.php_value(entry.dict_value())
+			stub_name = hashlib.sha256(entry_value.encode("utf-8")).hexdigest()[:16] + ".php"
+			stub_path = os.path.join(CommonNames.EngineDirectoryName, CommonNames.RouteStubDirectoryName, stub_name)
+			
+			outputs[stub_path] = render("route.php", {"name": entry.class_name, "entry": entry_value})
+			
+			# The query string is passed on untouched, and the stub takes the arguments from
+			# the path itself, so nothing in the query string can stand in for them
+			
+			rules.append("RewriteCond %{{REQUEST_METHOD}} ={0}".format(method))
+			rules.append("RewriteRule {0} /{1} [END]".format(pattern, stub_path.replace(os.sep, "/")))
+		
+		rules.append("")
+	
+	outputs[CommonNames.HypertextAccessFile] = render("htaccess", {"rules": "\n".join(rules)})
+	
+	return outputs
+
+
+def merged_htaccess(existing, generated):
+	
+	""" Returns the .htaccess file existing with the section APIEngine looks after swapped
+	    for generated, keeping any other directives around it. Files created before the
+	    section was marked have the rules they were created with swapped instead, or
+	    generated put before them if those rules can't be found.
+	"""
+	
+	begin, end = "# BEGIN APIEngine", "# END APIEngine"
+	
+	if existing is None:
+		return generated
+	
+	start, finish = existing.find(begin), existing.find(end)
+	
+	if start >= 0 and finish > start:
+		return existing[:start] + generated + existing[finish + len(end):]
+	
+	unmarked_rules = "RewriteEngine On\nRewriteCond %{REQUEST_FILENAME} !request.php\nRewriteRule ^(.*)$ /engine/request.php?arguments=$1 [L,QSA]"
+	
+	if unmarked_rules in existing:
+		return existing.replace(unmarked_rules, generated, 1)
+	
+	return generated + "\n\n" + existing
+
+
+def write_compiled_outputs(manifest, outputs):
+	
+	""" Writes each of the compiled outputs into the project directory, atomically, unless
+	    the manifest shows it hasn't changed. Stubs inside engine/routes and copies of
+	    included definition files which are no longer among the outputs are deleted, and
+	    only APIEngine's section of .htaccess is written.
+	"""
+	
+	stub_directory = os.path.join(CommonNames.EngineDirectoryName, CommonNames.RouteStubDirectoryName)
+	
+	for file_name in list(manifest.files):
+		if os.path.dirname(file_name) == stub_directory and file_name not in outputs:
+			manifest.remove(file_name)
+	
+	# The files which were included last time are in the list written along with them
+	
+	try:
+		with open(os.path.join(manifest.project_directory, CommonNames.IncludedFilesFile), encoding="utf-8") as included_list:
+			previously_included = included_list.read().splitlines()
+	except FileNotFoundError:
+		previously_included = []
+	
+	for file_name in previously_included + [CommonNames.IncludedFilesFile]:
+		if file_name in manifest.files and file_name not in outputs:
+			manifest.remove(file_name)
+	
+	for file_name, contents in outputs.items():
+		
+		if file_name == CommonNames.HypertextAccessFile:
+			try:
+				with open(os.path.join(manifest.project_directory, file_name), encoding="utf-8") as htaccess_file:
+					contents = merged_htaccess(htaccess_file.read(), contents)
+			except FileNotFoundError:
+				pass
+		
+		# Stubs and included definition files can be inside directories of their own
+		
+		if os.path.dirname(file_name) != "":
+			os.makedirs(os.path.join(manifest.project_directory, os.path.dirname(file_name)), exist_ok=True)
+		
+		# The definition files are important for security, so are read only. Everything
+		# else is read by the web server, so is left readable
+		
+		manifest.write(file_name, contents, 0o440 if file_name.startswith(CommonNames.EndpointDefinitionReadableFile) else None)
+
+
+def load_project_settings(project_directory):
+	
+	"""Returns the settings the project was last created or updated with."""
+	
+	import json
+	
+	settings = dict(default_project_settings)
+	
+	try:
+		with open(os.path.join(project_directory, CommonNames.ProjectSettingsFile), encoding="utf-8") as file:
+			settings.update(json.load(file))
+	except FileNotFoundError:
+		pass # Projects created before settings existed use the defaults
+	
+	return settings
+
+
+def save_project_settings(manifest, settings):
+	
+	import json
+	
+	manifest.write(CommonNames.ProjectSettingsFile, json.dumps(settings, indent="\t", sort_keys=True))
+
+
+def template(template_name):
+	
+	""" Returns the template with the given file name inside /templates, split up around
+	    its placeholders so that every odd item is the name of a placeholder, e.g.
+	    ['class ', 'name', ' implements APIEngine\\Requestable {...']. Each template
+	    is only read and split once.
+	"""
+	
+	import re
+	
+	if template_name not in loaded_templates:
+		template_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "templates", template_name)
+		
+		with open(template_path, encoding="utf-8") as template_file:
+			loaded_templates[template_name] = re.split(placeholder_pattern, template_file.read())
+	
+	return loaded_templates[template_name]
+
+
+def render(template_name, values):
+	
+	"""Fills in the placeholders of a template with the values given for each one."""
+	
+	parts = template(template_name)
+	return "".join(part if i % 2 == 0 else values[part] for i, part in enumerate(parts))
 
 
 def has_edit_permission():
@@ -50,177 +435,538 @@ def has_edit_permission():
 		return ctypes.windll.shell32.IsUserAnAdmin() != 0
 
 
-def create_project(project_directory, endpoint_definition_readable, endpoint_definition_json, defined_classes):
+def autoload_map(defined_classes):
 	
-	""" Creates a project, located at project_directory, with endpoint definition file
-	    endpoint_definition_json. Classes and their respective files which are defined
-	    are passes in the defined_classes argument, in the form (class_name, file_name).
-	    
-	    Files are copied from the /templates directory. The directories and files inside
-	    the definition file are automatically recreated inside the project directory.
+	""" Returns engine/autoload.php, which maps each class in defined_classes (in the form
+	    (class_name, file_name)) to the path of its file from the engine directory.
 	"""
 	
-	script_run_location = os.path.dirname(os.path.realpath(__file__))
-	script_templates_location = os.path.join(script_run_location, "templates")
+	import Emitter
 	
-	# Create the project's main directory
-	os.mkdir(project_directory)
+	lines = ["\t{0} => __DIR__ . {1},".format(Emitter.php_value(class_name), Emitter.php_value("/../" + file_name.lstrip("/"))) for class_name, file_name in sorted(defined_classes)]
 	
-	# Create the project's `engine' directory
-	engine_directory = os.path.join(project_directory, CommonNames.EngineDirectoryName)
-	os.mkdir(engine_directory)
+	return render("autoload.php", {"classes": "\n".join(lines)})
+
+
+def preload_script(compiled_outputs, defined_classes):
 	
-	# Write the human-readable endpoint definition file, used for modifications later on
-	readable_definition_file = os.path.join(project_directory, CommonNames.EndpointDefinitionReadableFile)
+	""" Returns engine/preload.php, which compiles every PHP file among compiled_outputs,
+	    the engine files and the file of each class in defined_classes (in the form
+	    (class_name, file_name)) when it's given as opcache.preload.
+	"""
 	
-	with open(readable_definition_file, "w") as file:
-		file.write(endpoint_definition_readable)
+	import Emitter
 	
-	# Write the endpoint definition JSON
-	endpoint_definition_file = os.path.join(project_directory, CommonNames.EndpointDefinitionFile)
+	# The runtime is left out, as the preload script includes it itself
+	engine_files = ["request.php", CommonNames.AutoloadFile]
 	
-	with open(endpoint_definition_file, "w") as file:
-		file.write(endpoint_definition_json)
+	project_files = [file_name for file_name in sorted(compiled_outputs) if file_name.endswith(".php")]
+	project_files += sorted({file_name.lstrip("/") for _, file_name in defined_classes})
 	
-	# Important for security, read only
-	os.chmod(endpoint_definition_file, 0o440)
+	paths = ["/" + file_name for file_name in engine_files] + ["/../" + file_name for file_name in project_files]
 	
-	# Copy the htaccess file
+	return render("preload.php", {"files": "\n".join("\t__DIR__ . {0},".format(Emitter.php_value(path)) for path in paths)})
+
+
+def write_engine_files(manifest, compiled_outputs, defined_classes):
 	
-	template_htaccess_location = os.path.join(script_templates_location, "htaccess")
-	htaccess_file = os.path.join(project_directory, CommonNames.HypertextAccessFile)
+	""" Writes the request handler, runtime, autoload map and preload script into the engine
+	    directory.
+	"""
 	
-	shutil.copyfile(template_htaccess_location, htaccess_file)
+	for file_name in ["request.php", "runtime.php"]:
+		manifest.write(os.path.join(CommonNames.EngineDirectoryName, file_name), render(file_name, {}))
 	
-	# Copy the request handler and runtime files
+	manifest.write(os.path.join(CommonNames.EngineDirectoryName, CommonNames.AutoloadFile), autoload_map(defined_classes))
+	manifest.write(os.path.join(CommonNames.EngineDirectoryName, CommonNames.PreloadFile), preload_script(compiled_outputs, defined_classes))
+
+
+def runtime_location(project_directory, file_name):
 	
-	request_template_path = os.path.join(script_templates_location, "request.php")
-	request_project_path = os.path.join(engine_directory, "request.php")
+	"""Returns the path to the runtime from the directory of the class file file_name."""
 	
-	runtime_template_path = os.path.join(script_templates_location, "runtime.php")
-	runtime_project_path = os.path.join(engine_directory, "runtime.php")
+	runtime_project_path = os.path.join(project_directory, CommonNames.EngineDirectoryName, "runtime.php")
+	class_file_path = os.path.join(project_directory, file_name.lstrip('/'))
 	
-	# Copy the request file
-	shutil.copyfile(request_template_path, request_project_path)
+	return os.path.relpath(runtime_project_path, os.path.dirname(class_file_path))
 
-	# ..and the runtime file
-	shutil.copyfile(runtime_template_path, runtime_project_path)
+
+def upgrade_class_files(project_directory, defined_classes):
 	
-	# Finally generate the class files
+	""" Class files created by earlier versions include the runtime relative to the working
+	    directory, which request.php no longer changes to. The line including it is swapped
+	    for one relative to the class file, leaving files where it's been changed alone.
+	"""
 	
-	class_definition_path = os.path.join(script_templates_location, "class-definition.php")
+	import Emitter
 	
-	with open(class_definition_path) as class_definition_file:
-		class_definition_template = class_definition_file.read()
+	for file_name in {file_name for _, file_name in defined_classes}:
+		class_file_path = os.path.join(project_directory, file_name.lstrip('/'))
+		include_location = runtime_location(project_directory, file_name)
+		
+		# Handlers can be in any encoding, so they're changed as bytes
+		
+		try:
+			with open(class_file_path, "rb") as class_file:
+				contents = class_file.read()
+		except OSError:
+			continue
+		
+		old_line = 'require_once "{0}";'.format(include_location).encode("utf-8")
+		new_line = 'require_once __DIR__ . "/{0}";'.format(include_location).encode("utf-8")
+		
+		if old_line in contents:
+			Emitter.write_atomically(class_file_path, contents.replace(old_line, new_line, 1), os.stat(class_file_path).st_mode & 0o7777)
+
+
+def create_project(project_directory, endpoint_definition_readable, compiled_outputs, defined_classes, workers=default_workers, settings=default_project_settings):
 	
-	single_class_template_path = os.path.join(script_templates_location, "class.php")
+	""" Creates a project, located at project_directory, with the compiled endpoint
+	    definition files compiled_outputs. Classes and their respective files which are defined
+	    are passes in the defined_classes argument, in the form (class_name, file_name).
+	    
+	    Files are copied from the /templates directory. The directories and files inside
+	    the definition file are automatically recreated inside the project directory, where
+	    up to `workers` class files are written at once.
+	    
+	    Every file APIEngine looks after is recorded in the project's manifest. Class files
+	    aren't, as they're yours to implement once they've been created.
+	"""
 	
-	with open(single_class_template_path) as class_template_file:
-		single_class_template = class_template_file.read()	
+	import concurrent.futures
+	import Emitter
 	
-	# We will create the following files, each with one or more classes inside
+	# Create the project's main directory
+	os.mkdir(project_directory)
 	
-	files_to_create = {file_name: [] for _, file_name in defined_classes}
+	# Create the project's `engine' directory
+	engine_directory = os.path.join(project_directory, CommonNames.EngineDirectoryName)
+	os.mkdir(engine_directory)
 	
-	# Create all of the defined directories if necessary
+	manifest = Emitter.Manifest(project_directory, CommonNames.ManifestFile)
+	
+	# Write the human-readable endpoint definition file, used for modifications later on
+	manifest.write(CommonNames.EndpointDefinitionReadableFile, endpoint_definition_readable)
 	
-	for path in files_to_create.keys():
-		full_path = os.path.join(project_directory, path.lstrip('/'))
-		os.makedirs(os.path.dirname(full_path), exist_ok=True)
+	# Write the endpoint definition JSON and route table
+	write_compiled_outputs(manifest, compiled_outputs)
 	
-	# Now construct the individual PHP classes themselves
+	# Copy the request handler and runtime files, along with the map of where each class is
+	# and the list of files to preload
+	write_engine_files(manifest, compiled_outputs, defined_classes)
+	
+	save_project_settings(manifest, settings)
+	manifest.save()
+	
+	# Finally generate the class files, each with one or more classes inside
+	
+	files_to_create = {file_name: [] for _, file_name in defined_classes}
 	
 	for class_name, file_name in defined_classes:
-		files_to_create[file_name].append(single_class_template.replace("[name]", class_name))
+		files_to_create[file_name].append(render("class.php", {"name": class_name}))
+	
+	# Create all of the defined directories up front, each only once. Sorted by their
+	# components, a directory's subdirectories come straight after it, and only the
+	# deepest need creating as their parents are created along with them
 	
-	# Finally we make the class files, comprised of one or more classes from above
+	directories = {os.path.dirname(os.path.join(project_directory, file_name.lstrip('/'))) for file_name in files_to_create}
+	directories = sorted(directories, key=lambda directory: directory.split(os.sep))
 	
-	for file_name, classes in files_to_create.items():
+	for directory, next_directory in zip(directories, directories[1:] + [""]):
+		if not next_directory.startswith(directory + os.sep):
+			os.makedirs(directory, exist_ok=True)
 	
-		classes_string = "\n".join(classes)		
+	def write_class_file(file_name):
 		class_file_path = os.path.join(project_directory, file_name.lstrip('/'))
 		
-		entire_class = class_definition_template.replace("[classes]", classes_string)
-		
 		# We need the path to the runtime file, so the class has access to the APIRequest namespace
 		
-		relative_runtime_path = os.path.relpath(runtime_project_path, os.path.dirname(class_file_path))
-		entire_class = entire_class.replace("[include-directory-location]", relative_runtime_path)
-		
-		# Now finally write it
+		entire_class = render("class-definition.php", {
+			"classes": "\n".join(files_to_create[file_name]),
+			"include-directory-location": runtime_location(project_directory, file_name)
+		})
 		
-		with open(class_file_path, "w") as file:
+		with open(class_file_path, "w", encoding="utf-8") as file:
 			file.write(entire_class)
+	
+	# Writing each file mostly means waiting on the file system, so several are written at once
+	
+	if workers <= 1:
+		for file_name in files_to_create:
+			write_class_file(file_name)
+	else:
+		with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+			
+			# Consuming the results raises any exception from writing the files
+			for _ in executor.map(write_class_file, files_to_create):
+				pass
 
 
-def update_project(project_directory, endpoint_definition_json):
+def update_project(project_directory, compiled_outputs, defined_classes, settings=default_project_settings):
+	
+	""" Updates the project located at project_directory with the compiled endpoint definition
+	    files compiled_outputs, and the classes defined_classes, only writing the files which
+	    have actually changed.
+	"""
+	
+	import Emitter
+	
+	manifest = Emitter.Manifest(project_directory, CommonNames.ManifestFile)
 	
-	# Write the endpoint definition JSON
-	endpoint_definition_file = os.path.join(project_directory, CommonNames.EndpointDefinitionFile)
+	# Write the endpoint definition JSON and route table
+	write_compiled_outputs(manifest, compiled_outputs)
 	
-	with open(endpoint_definition_file, "w") as file:
-		file.write(endpoint_definition_json)
+	# The request handler may have changed since the project was created
+	write_engine_files(manifest, compiled_outputs, defined_classes)
+	upgrade_class_files(project_directory, defined_classes)
+	
+	save_project_settings(manifest, settings)
+	manifest.save()
+
 
-# Get the arguments from the command line
+def argument_parser():
+	
+	"""Returns the parser for the arguments given on the command line."""
+	
+	import argparse
+	
+	argument_parser = argparse.ArgumentParser()
 
-argument_parser = argparse.ArgumentParser()
+	argument_parser.add_argument("mode", help="The mode in which to execute, either ‘create’ to create a new project, ‘update’ to update an existing project, ‘remove’ to permanently delete a project, ‘check’ to check the definition file given as the standard input without creating anything, ‘build-all’ to update many projects at once, or ‘serve’ to keep running and carry out commands sent to it.")
 
-argument_parser.add_argument("mode", help="The mode in which to execute, either ‘create’ to create a new project, ‘update’ to update an existing project, or ‘remove’ to permanently delete a project.")
+	argument_parser.add_argument("paths", metavar="path", help="The path to the root directory of the project, where the project will either be created or updated from. ‘build-all’ takes any number of projects, where a path to a file is read as a list of projects, one per line.", nargs="*")
 
-argument_parser.add_argument("path", help="The path to the root directory of the project, where the project will either be created or updated from.", default="Untitled", nargs="?")
+	argument_parser.add_argument("--router", choices=["tree", "regex"], help="How requests are routed at runtime, either by walking the tree (‘tree’, the default) or with one precompiled regular expression match (‘regex’). Once set, it's kept when the project is updated.")
 
-arguments = argument_parser.parse_args()
+	argument_parser.add_argument("--format", choices=["nested", "shared", "compact", "binary"], help="How the tree is written out, either as nested objects (‘nested’, the default), as a table where identical parts of the tree are only written once (‘shared’), as a shared table of integers which refer to a table of strings (‘compact’), or as a flat binary table the runtime searches without decoding (‘binary’). Once set, it's kept when the project is updated.")
 
-# Sanity checking
+	argument_parser.add_argument("--optionals", choices=["expanded", "native"], help="How optional components are stored in the tree, either as every path they expand to (‘expanded’, the default) or once each, to be skipped over at runtime (‘native’). Once set, it's kept when the project is updated.")
 
-if arguments.mode not in ["create", "update", "remove"]:
-	print("Error: mode must be one of create, update or remove", file=sys.stderr)
-	sys.exit(1)
+	argument_parser.add_argument("--rewrite", choices=["request", "direct"], help="How Apache sends requests on, either all to engine/request.php (‘request’, the default), or straight to a stub for the endpoint wherever .htaccess can tell which it is (‘direct’). Once set, it's kept when the project is updated.")
 	
-project_directory = os.path.join(os.getcwd(), arguments.path)
+	argument_parser.add_argument("--workers", type=int, default=default_workers, help="How many class files are written at once when creating a project, which helps most on slow or networked file systems.")
 
-# If they're creating a new one, make sure no such project exists
+	argument_parser.add_argument("--no-cache", action="store_true", help="Always parse the definition file, instead of reusing the compiled outputs of an identical one. The cache is kept in $APIENGINE_CACHE_DIR, or ~/.cache/apiengine if it isn't set.")
 
-if arguments.mode == "create":
-	if os.path.exists(project_directory):
-		print("Error: File or directory", arguments.path, "exists", file=sys.stderr)
-		sys.exit(1)
+	argument_parser.add_argument("--socket", help="When serving, the path of a Unix domain socket to listen on, instead of reading commands from the standard input.")
 
-# If they're updating or removing, make sure the project exists and
-# that it is valid
+	argument_parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="How many projects ‘build-all’ updates at once, each in a process of its own. Defaults to the number of CPUs.")
+	
+	return argument_parser
 
-if arguments.mode in ["update", "remove"]:
-	if not os.path.isdir(project_directory):
-		print("Error: no such project", arguments.path, file=sys.stderr)
-		sys.exit(1)
+
+def parse_arguments(argument_parser, argv=None):
 	
-	definition_file_path = os.path.join(arguments.path, CommonNames.EndpointDefinitionFile)
+	""" Parses the command line arguments argv (or sys.argv) with argument_parser, where every
+	    mode other than build-all takes at most one path. """
 	
-	if not os.path.exists(definition_file_path):
-		print("Error: directory", arguments.path, "does not contain a valid project", file=sys.stderr)
-		sys.exit(1)
+	# Paths can be given both before and after options where that's supported (Python 3.7 and later)
+	
+	parse = getattr(argument_parser, "parse_intermixed_args", argument_parser.parse_args)
+	arguments = parse(argv)
+	
+	if arguments.mode != "build-all" and len(arguments.paths) > 1:
+		argument_parser.error("only ‘build-all’ can be given more than one path")
+	
+	arguments.path = arguments.paths[0] if len(arguments.paths) > 0 else "Untitled"
+	
+	return arguments
 
-# Need to be root to delete or update a project
 
-if arguments.mode in ["update", "remove"] and not has_edit_permission():
-	print("Error: must have administrative privileges to update or remove projects", file=sys.stderr)
-	sys.exit(1)
+def run_command(arguments, definition_handle=sys.stdin):
+	
+	""" Carries out the create, update, remove or check command given by arguments, as
+	    parsed by `argument_parser`. The definition file for create and check is read
+	    from definition_handle. Raises CommandError if the command can't be carried out.
+	"""
+	
+	# Sanity checking
+
+	if arguments.mode not in ["create", "update", "remove", "check"]:
+		raise CommandError("mode must be one of create, update, remove, check, build-all or serve")
+	
+	project_directory = os.path.join(os.getcwd(), arguments.path)
+
+	# If they're creating a new one, make sure no such project exists
 
-# Now all of the sanity checks are complete, we can move on to actually
-# doing something
+	if arguments.mode == "create":
+		if os.path.exists(project_directory):
+			raise CommandError("File or directory {0} exists".format(arguments.path))
+
+	# If they're updating or removing, make sure the project exists and
+	# that it is valid
+
+	if arguments.mode in ["update", "remove"]:
+		if not os.path.isdir(project_directory):
+			raise CommandError("no such project {0}".format(arguments.path))
+	
+		definition_file_path = os.path.join(project_directory, CommonNames.EndpointDefinitionFile)
+	
+		if not os.path.exists(definition_file_path):
+			raise CommandError("directory {0} does not contain a valid project".format(arguments.path))
 
-if arguments.mode == "remove":
-	shutil.rmtree(project_directory)
-else:
+	# Need to be root to delete or update a project
+
+	if arguments.mode in ["update", "remove"] and not has_edit_permission():
+		raise CommandError("must have administrative privileges to update or remove projects")
+
+	# Now all of the sanity checks are complete, we can move on to actually
+	# doing something
+
+	if arguments.mode == "remove":
+		import shutil
+		shutil.rmtree(project_directory)
+		
+		return
+	
+	import Parser
+	
+	# Use the settings the project already has, unless they've been given
+	
+	settings = dict(default_project_settings) if arguments.mode != "update" else load_project_settings(project_directory)
+	
+	if arguments.router is not None:
+		settings["router"] = arguments.router
+	
+	if arguments.optionals is not None:
+		settings["optionals"] = arguments.optionals
+	
+	if arguments.format is not None:
+		settings["format"] = arguments.format
+	
+	if arguments.rewrite is not None:
+		settings["rewrite"] = arguments.rewrite
+	
+	# The regex router is compiled from every path, so it can't work with native optionals
+	
+	if settings["router"] == "regex" and settings["optionals"] == "native":
+		raise CommandError("the regex router can't be used with native optionals")
+	
+	# Checking only needs the definition file to parse
+	
+	if arguments.mode == "check":
+		try:
+			parse_definition_file(definition_handle, settings)
+		except Parser.ParseError as error:
+			raise CommandError(str(error))
+		
+		return
+	
 	# Get the definition file's stream
 	preexisting_file_path = os.path.join(project_directory, CommonNames.EndpointDefinitionReadableFile)
-	stream = sys.stdin if arguments.mode == "create" else open(preexisting_file_path)
+	stream = definition_handle if arguments.mode == "create" else open(preexisting_file_path, encoding="utf-8")
+	
+	# We need to parse their endpoint definition file, unless it's been compiled before, where
+	# only changes need parsing on update
+	
+	compile_cache = None
 	
-	# We need to parse their endpoint definition file
-	original, parsed, defined_classes = parse_definition_file(stream)
+	if not arguments.no_cache:
+		import Cache
+		compile_cache = Cache.CompileCache(Cache.default_cache_directory())
+	
+	statement_cache_path = None if arguments.mode == "create" else os.path.join(project_directory, CommonNames.StatementCacheFile)
+	
+	# Included files are copied into the project on create, and read from there on update
+	
+	include_directory = os.getcwd() if arguments.mode == "create" else project_directory
+	include_cache_path = None if arguments.mode == "create" else os.path.join(project_directory, CommonNames.IncludeCacheFile)
+	
+	try:
+		original, parsed, defined_classes = compile_definition_file(stream, settings, compile_cache, statement_cache_path, include_directory, include_cache_path)
+	except Parser.ParseError as error:
+		raise CommandError(str(error))
+	finally:
+		if stream is not definition_handle:
+			stream.close()
 	
 	if arguments.mode == "create":
-		create_project(project_directory, original, parsed, defined_classes)
+		create_project(project_directory, original, parsed, defined_classes, arguments.workers, settings)
 	else:
-		update_project(project_directory, parsed)		
-		stream.close()
\ No newline at end of file
+		update_project(project_directory, parsed, defined_classes, settings)
+
+
+def serve(arguments):
+	
+	""" Keeps running, carrying out commands sent to it one line at a time, so that the
+	    interpreter only starts up once, and modules, compiled patterns and templates
+	    are loaded once for every command.
+	    
+	    Each command is a JSON object, where "arguments" is the list of arguments which
+	    would otherwise be given on the command line, and "definition" is the definition
+	    file for create and check. Each response is a JSON object on a line of its own,
+	    where "ok" is whether the command succeeded, along with either the "seconds" it
+	    took or the "error" which stopped it.
+	    
+	    Commands are read from the standard input, with responses written to the standard
+	    output, unless the path of a Unix domain socket is given to listen on instead.
+	"""
+	
+	import io
+	import json
+	import time
+	
+	parser = argument_parser()
+	
+	def respond(line):
+		start = time.perf_counter()
+		
+		try:
+			command = json.loads(line)
+			command_arguments = parse_arguments(parser, command["arguments"])
+			
+			if command_arguments.mode in ["serve", "build-all"]:
+				raise CommandError("can't {0} from inside serve".format(command_arguments.mode))
+			
+			run_command(command_arguments, io.StringIO(command.get("definition", "")))
+		except SystemExit:
+			return {"ok": False, "error": "invalid arguments"} # argparse has already said why
+		except (CommandError, ValueError, KeyError, TypeError, OSError) as error:
+			return {"ok": False, "error": str(error)}
+		
+		return {"ok": True, "seconds": time.perf_counter() - start}
+	
+	if arguments.socket is None:
+		for line in sys.stdin:
+			if line.strip() != "":
+				print(json.dumps(respond(line)), flush=True)
+		
+		return
+	
+	import socketserver
+	
+	class CommandHandler(socketserver.StreamRequestHandler):
+		def handle(self):
+			for line in self.rfile:
+				if line.strip() != b"":
+					self.wfile.write(json.dumps(respond(line.decode("utf-8"))).encode("utf-8") + b"\n")
+	
+	# Commands are carried out one at a time, even with several connections open
+	
+	import signal
+	
+	server = socketserver.UnixStreamServer(arguments.socket, CommandHandler)
+	
+	# Being stopped either way still removes the socket
+	signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+	
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		os.unlink(arguments.socket)
+
+
+def listed_projects(paths):
+	
+	""" Returns the project directories given by paths, where a path to a file is replaced
+	    by the projects listed inside it, one per line and relative to the file. Blank lines
+	    and those beginning with # are ignored. """
+	
+	projects = []
+	
+	for path in paths:
+		if not os.path.isfile(path):
+			projects.append(path)
+			continue
+		
+		with open(path, encoding="utf-8") as projects_file:
+			for line in projects_file:
+				line = line.strip()
+				
+				if line != "" and not line.startswith("#"):
+					projects.append(os.path.join(os.path.dirname(path), line))
+	
+	return projects
+
+
+def build_project(arguments):
+	
+	""" Updates a single project for build-all, given the arguments to update it with, and
+	    returns how long it took along with the error which stopped it, if any. This runs
+	    inside a worker process, which keeps its modules, compiled patterns and templates
+	    loaded from one project to the next.
+	"""
+	
+	import time
+	
+	start = time.perf_counter()
+	error = None
+	
+	try:
+		run_command(arguments)
+	except Exception as exception: # Reported in the summary, without stopping the rest
+		error = str(exception) or type(exception).__name__
+	
+	return time.perf_counter() - start, error
+
+
+def build_all(arguments):
+	
+	""" Updates every project given to build-all, spreading them over as many processes as
+	    there are jobs, then prints how long each took and why any of them failed. Returns
+	    the number of projects which failed.
+	"""
+	
+	import argparse
+	import concurrent.futures
+	import time
+	
+	try:
+		projects = listed_projects(arguments.paths)
+	except OSError as error:
+		raise CommandError(str(error))
+	
+	commands = [argparse.Namespace(**dict(vars(arguments), mode="update", path=project)) for project in projects]
+	
+	start = time.perf_counter()
+	
+	with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, arguments.jobs)) as executor:
+		results = list(executor.map(build_project, commands))
+	
+	total_time = time.perf_counter() - start
+	failures = 0
+	
+	for project, (seconds, error) in zip(projects, results):
+		if error is None:
+			print("{0:9.3f}s  ok      {1}".format(seconds, project))
+		else:
+			print("{0:9.3f}s  failed  {1}: {2}".format(seconds, project, error))
+			failures += 1
+	
+	print("{0} project(s) built in {1:.3f}s with {2} job(s), {3} failed".format(len(projects), total_time, arguments.jobs, failures))
+	
+	return failures
+
+
+def main(argv=None):
+	
+	# Get the arguments from the command line
+	arguments = parse_arguments(argument_parser(), argv)
+	
+	if arguments.mode == "serve":
+		serve(arguments)
+		return
+	
+	if arguments.mode == "build-all":
+		try:
+			failures = build_all(arguments)
+		except CommandError as error:
+			print("Error:", error, file=sys.stderr)
+			sys.exit(1)
+		
+		sys.exit(1 if failures > 0 else 0)
+	
+	try:
+		run_command(arguments)
+	except CommandError as error:
+		print("Error:", error, file=sys.stderr)
+		sys.exit(1)
+
+
+# Only run when invoked from the command line, so the functions above can be imported
+
+if __name__ == "__main__":
+	main()
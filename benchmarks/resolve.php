@@ -0,0 +1,54 @@
+<?php
+
+//Times how long request.php takes to find the endpoints of requests inside a project, without
+//handling them. Run with: php benchmarks/resolve.php <project directory> <requests file> [iterations]
+//
+//The requests file is a JSON list of [method, components] pairs. The results are printed as JSON.
+
+if (count($argv) < 3) {
+	fwrite(STDERR, "usage: php resolve.php <project directory> <requests file> [iterations]\n");
+	exit(1);
+}
+
+$project_directory = $argv[1];
+$requests = json_decode(file_get_contents($argv[2]), true);
+$iterations = isset($argv[3]) ? intval($argv[3]) : 100000;
+
+define("APIENGINE_NO_DISPATCH", true);
+
+$_SERVER["REQUEST_METHOD"] = "GET";
+$_REQUEST["arguments"] = "";
+
+require $project_directory . "/engine/request.php";
+
+//Loading the route table is timed on its own, since it happens once per request
+
+$start = microtime(true);
+$api_request = new APIRequest();
+$load_time = microtime(true) - $start;
+
+$resolve = new ReflectionMethod("APIRequest", "redirect_entry_for_request");
+$resolve->setAccessible(true);
+
+$found = 0;
+$start = microtime(true);
+
+for ($i = 0; $i < $iterations; $i++) {
+	list($method, $components) = $requests[$i % count($requests)];
+
+	if (!is_null($resolve->invoke($api_request, $method, $components))) {
+		$found++;
+	}
+}
+
+$resolve_time = microtime(true) - $start;
+
+echo json_encode([
+	"load" => $load_time,
+	"resolve" => $resolve_time,
+	"iterations" => $iterations,
+	"found" => $found,
+	"resolution_cache" => $api_request->resolution_cache_statistics()
+]), "\n";
+
+?>
@@ -0,0 +1,273 @@
+""" Times each stage of compiling synthetic endpoint definition files, and compares the
+	results against a stored baseline.
+
+	Run with: python3 benchmarks/run.py [--repeat N] [--save-baseline]
+
+	Every case is built from a definition file with a given number of exports, depth of
+	group prefixes, number of optionals per endpoint and length of names. The tokenizer,
+	parser, component expansion, serialisation of the compiled outputs and project
+	creation are each timed on their own, taking the best of several runs.
+
+	Results are written to benchmarks/results.json. When benchmarks/baseline.json exists,
+	any stage which is slower than the baseline by more than the tolerance is reported,
+	and the exit status is 1. If a `php` binary can be found, route resolution inside
+	request.php is timed as well, using benchmarks/resolve.php.
+"""
+
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Parent directory
+
+import argparse
+import importlib.machinery
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+import Tokenizer
+import Parser
+
+benchmarks_directory = os.path.dirname(os.path.abspath(__file__))
+repository_directory = os.path.dirname(benchmarks_directory)
+
+# The command line script isn't a module of its own, so it's loaded from its file
+
+apiengine = importlib.machinery.SourceFileLoader("apiengine", os.path.join(repository_directory, "__main__.py")).load_module()
+
+# Bump this whenever the layout of the results changes, so old baselines aren't compared
+RESULTS_VERSION = 1
+
+# Each case varies one thing from the first
+cases = [
+	("base", {"exports": 1000, "nesting": 1, "optionals": 1, "string_length": 8}),
+	("exports-5000", {"exports": 5000, "nesting": 1, "optionals": 1, "string_length": 8}),
+	("nesting-4", {"exports": 1000, "nesting": 4, "optionals": 1, "string_length": 8}),
+	("optionals-4", {"exports": 1000, "nesting": 1, "optionals": 4, "string_length": 8}),
+	("strings-64", {"exports": 1000, "nesting": 1, "optionals": 1, "string_length": 64})
+]
+
+# How many exports are put inside each group
+group_size = 10
+
+
+def padded(name, string_length):
+	"""Pads name out to string_length characters, so longer strings can be tried."""
+	return name + "x" * max(0, string_length - len(name))
+
+
+def synthetic_definition(exports, nesting, optionals, string_length):
+	""" Returns the text of a definition file, along with the nondeterministic components of
+		each export in the form (name, is_variable, is_optional), and a request for each
+		export in the form (method, components).
+
+		Exports are put inside groups whose prefixes are `nesting` components deep, or
+		aren't grouped at all when `nesting` is 0. Each endpoint has `optionals` optional
+		components, each after a fixed component so they're never consecutive.
+	"""
+
+	lines = []
+	all_components = []
+	requests = []
+
+	methods = ["GET", "POST", "PUT", "DELETE"]
+
+	for group in range(0, exports, group_size):
+		prefix = []
+
+		# Group prefixes alternate between fixed components and variables
+
+		for level in range(nesting):
+			if level % 2 == 0:
+				prefix.append((padded("g{0}l{1}".format(group, level), string_length), False, False))
+			else:
+				prefix.append((padded("p{0}".format(level), string_length), True, False))
+
+		indent = ""
+
+		if nesting > 0:
+			lines.append('group "/{0}" base "{1}"'.format(readable(prefix), padded("group" + str(group), string_length)))
+			indent = "\t"
+
+		for export in range(group, min(group + group_size, exports)):
+			components = [(padded("e" + str(export), string_length), False, False), (padded("v", string_length), True, False)]
+
+			for optional in range(optionals):
+				components.append((padded("s" + str(optional), string_length), False, False))
+				components.append((padded("o" + str(optional), string_length), False, True))
+
+			method = methods[export % len(methods)]
+			class_name = padded("Class" + str(export), string_length)
+			file_name = padded("file" + str(export // group_size), string_length) + ".php"
+
+			lines.append('{0}export {1} "/{2}" to "{3}" in "{4}"'.format(indent, method, readable(components), class_name, file_name))
+
+			all_components.append(prefix + components)
+			requests.append([method, [name if not (is_variable or is_optional) else "1234" for name, is_variable, is_optional in prefix + components]])
+
+	return "\n".join(lines) + "\n", all_components, requests
+
+
+def readable(components):
+	"""Returns components in the form (name, is_variable, is_optional) as they're written."""
+
+	decorated = []
+
+	for name, is_variable, is_optional in components:
+		if is_optional:
+			decorated.append("[{0}]?".format(name))
+		elif is_variable:
+			decorated.append("[{0}]".format(name))
+		else:
+			decorated.append(name)
+
+	return "/".join(decorated)
+
+
+def best_time(function, repeat):
+	""" Calls function `repeat` times, returning the shortest time taken in seconds along
+		with the value it returned the last time. """
+
+	best, value = None, None
+
+	for _ in range(repeat):
+		start = time.perf_counter()
+		value = function()
+		elapsed = time.perf_counter() - start
+
+		best = elapsed if best is None else min(best, elapsed)
+
+	return best, value
+
+
+def run_case(parameters, repeat, directory):
+	""" Times each stage for a single case, returning a dictionary mapping stages to seconds.
+		Projects are created inside `directory`, which should be empty. """
+
+	definition, all_components, requests = synthetic_definition(**parameters)
+	settings = apiengine.default_project_settings
+
+	timings = {}
+
+	timings["tokenize"], tokens = best_time(lambda: Tokenizer.Tokenizer(definition).all_tokens(), repeat)
+
+	def parse():
+		parser = Parser.Parser(tokens)
+		parser.parse()
+
+		return parser
+
+	timings["parse"], parser = best_time(parse, repeat)
+
+	expander = Parser.Parser([])
+	timings["deterministic_components"], _ = best_time(lambda: [expander.deterministic_components(components) for components in all_components], repeat)
+
+	timings["serialise"], outputs = best_time(lambda: apiengine.compiled_outputs(parser.tree, parser.static_routes, settings), repeat)
+
+	defined_classes = parser.all_defined_classes()
+	project_directories = []
+
+	def create():
+		project_directory = os.path.join(directory, "project" + str(len(project_directories)))
+		project_directories.append(project_directory)
+
+		apiengine.create_project(project_directory, definition, outputs, defined_classes)
+
+	timings["create_project"], _ = best_time(create, repeat)
+
+	# Route resolution can only be timed where PHP is around
+
+	php = shutil.which("php")
+
+	if php is not None:
+		requests_path = os.path.join(directory, "requests.json")
+
+		with open(requests_path, "w", encoding="utf-8") as requests_file:
+			json.dump(requests, requests_file)
+
+		output = subprocess.check_output([php, os.path.join(benchmarks_directory, "resolve.php"), project_directories[0], requests_path])
+		php_results = json.loads(output.decode("utf-8"))
+
+		timings["php_load"] = php_results["load"]
+		timings["php_resolve"] = php_results["resolve"]
+
+	return timings
+
+
+def compare(results, baseline, tolerance):
+	""" Prints each timing next to its baseline, returning the (case, stage) pairs which
+		are slower than the baseline by more than the tolerance. """
+
+	regressions = []
+
+	for name, result in results["cases"].items():
+		baseline_timings = baseline["cases"].get(name, {}).get("timings", {})
+
+		for stage, seconds in result["timings"].items():
+			if stage not in baseline_timings:
+				print("{0:<16} {1:<26} {2:>10.4f}s".format(name, stage, seconds))
+				continue
+
+			ratio = seconds / baseline_timings[stage] if baseline_timings[stage] > 0 else 1.0
+			slower = ratio > 1 + tolerance
+
+			if slower:
+				regressions.append((name, stage))
+
+			print("{0:<16} {1:<26} {2:>10.4f}s {3:>10.4f}s {4:>7.2f}x{5}".format(name, stage, seconds, baseline_timings[stage], ratio, " slower" if slower else ""))
+
+	return regressions
+
+
+def main():
+	argument_parser = argparse.ArgumentParser(description="Times each stage of compiling synthetic endpoint definition files.")
+
+	argument_parser.add_argument("--repeat", type=int, default=3, help="How many times each stage is run, where the fastest is kept.")
+	argument_parser.add_argument("--output", default=os.path.join(benchmarks_directory, "results.json"), help="Where the results are written.")
+	argument_parser.add_argument("--baseline", default=os.path.join(benchmarks_directory, "baseline.json"), help="The results to compare against.")
+	argument_parser.add_argument("--tolerance", type=float, default=0.25, help="How much slower than the baseline a stage can be, as a fraction, before it's reported.")
+	argument_parser.add_argument("--save-baseline", action="store_true", help="Also store the results as the new baseline.")
+	argument_parser.add_argument("--case", action="append", help="Only run the case with this name, which can be given more than once.")
+
+	arguments = argument_parser.parse_args()
+
+	results = {"version": RESULTS_VERSION, "python": platform.python_version(), "cases": {}}
+	directory = tempfile.mkdtemp()
+
+	try:
+		for name, parameters in cases:
+			if arguments.case is None or name in arguments.case:
+				case_directory = os.path.join(directory, name)
+				os.mkdir(case_directory)
+
+				results["cases"][name] = {"parameters": parameters, "timings": run_case(parameters, arguments.repeat, case_directory)}
+	finally:
+		shutil.rmtree(directory)
+
+	with open(arguments.output, "w", encoding="utf-8") as output_file:
+		json.dump(results, output_file, indent="\t", sort_keys=True)
+
+	if arguments.save_baseline:
+		shutil.copyfile(arguments.output, arguments.baseline)
+
+	baseline = {"cases": {}}
+
+	try:
+		with open(arguments.baseline, encoding="utf-8") as baseline_file:
+			stored_baseline = json.load(baseline_file)
+
+		if stored_baseline.get("version") == RESULTS_VERSION:
+			baseline = stored_baseline
+	except FileNotFoundError:
+		pass
+
+	regressions = compare(results, baseline, arguments.tolerance)
+
+	if len(regressions) > 0:
+		print("{0} stage(s) slower than the baseline".format(len(regressions)), file=sys.stderr)
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,90 @@
+<?php
+
+//Compares finding static endpoints by walking the redirect tree against looking them up
+//inside the static route index. Run with: php benchmarks/static_routes.php [depth] [routes]
+
+$depth = isset($argv[1]) ? intval($argv[1]) : 8;
+$route_count = isset($argv[2]) ? intval($argv[2]) : 5000;
+$iterations = 200000;
+
+//Build a tree and index shaped like the ones in .definition.php
+
+$tree = ["GET" => []];
+$static_routes = [];
+$paths = [];
+
+for ($i = 0; $i < $route_count; $i++) {
+	$components = [];
+
+	for ($level = 0; $level < $depth; $level++) {
+		$components[] = "c" . ($i % ($level + 2)) . "_" . $level;
+	}
+
+	$components[] = "r$i";
+
+	$entry = ["file" => "/file$i.php", "class" => "Class$i"];
+	$sub_tree = &$tree["GET"];
+
+	foreach ($components as $component) {
+		if (!array_key_exists($component, $sub_tree)) {
+			$sub_tree[$component] = [];
+		}
+
+		$sub_tree = &$sub_tree[$component];
+	}
+
+	$sub_tree["/"] = $entry;
+	unset($sub_tree);
+
+	$static_routes["GET/" . implode("/", $components)] = $entry;
+	$paths[] = $components;
+}
+
+//The same walk as APIRequest::redirect_entry_for_request
+
+function walk_tree($tree, $method, $components) {
+	$sub_tree = $tree[$method];
+	$current_item = 0;
+
+	while ($current_item < count($components)) {
+		$current_component = $components[$current_item];
+
+		if (array_key_exists($current_component, $sub_tree)) {
+			$sub_tree = $sub_tree[$current_component];
+			$current_item++;
+		} else if (array_key_exists("*", $sub_tree)) {
+			$sub_tree = $sub_tree["*"];
+			$current_item++;
+		} else {
+			return null;
+		}
+	}
+
+	return array_key_exists("/", $sub_tree) ? $sub_tree["/"] : null;
+}
+
+function lookup_static($static_routes, $method, $components) {
+	$static_key = $method . "/" . implode("/", $components);
+	return array_key_exists($static_key, $static_routes) ? $static_routes[$static_key] : null;
+}
+
+$start = microtime(true);
+
+for ($i = 0; $i < $iterations; $i++) {
+	walk_tree($tree, "GET", $paths[$i % $route_count]);
+}
+
+$tree_time = microtime(true) - $start;
+$start = microtime(true);
+
+for ($i = 0; $i < $iterations; $i++) {
+	lookup_static($static_routes, "GET", $paths[$i % $route_count]);
+}
+
+$static_time = microtime(true) - $start;
+
+printf("depth %d, %d routes, %d lookups\n", $depth, $route_count, $iterations);
+printf("tree walk:    %.3fs\n", $tree_time);
+printf("static index: %.3fs (%.1fx faster)\n", $static_time, $tree_time / $static_time);
+
+?>
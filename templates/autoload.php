@@ -0,0 +1,10 @@
+<?php
+
+//Generated from the endpoint definition file, mapping each class to the file it's defined in.
+//It's rewritten whenever the project is updated, so there's no need to edit it
+
+return [
+[classes]
+];
+
+?>
@@ -1,6 +1,6 @@
 <?php
 
-require_once "[include-directory-location]";
+require_once __DIR__ . "/[include-directory-location]";
 [classes]
 
 ?>
\ No newline at end of file
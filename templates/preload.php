@@ -0,0 +1,19 @@
+<?php
+
+//Generated from the endpoint definition file, for opcache.preload. Pointing opcache.preload at
+//this file compiles the route table, the runtime and every handler once, as PHP starts up, so
+//no request has to. It's rewritten whenever the project is updated, which PHP only picks up
+//once it's restarted
+
+//Handlers implement the runtime's interfaces, which need declaring before they can be linked
+require_once __DIR__ . "/runtime.php";
+
+foreach ([
+[files]
+] as $file) {
+	if (file_exists($file)) {
+		opcache_compile_file($file);
+	}
+}
+
+?>
@@ -1,26 +1,13 @@
 <?php
 
-require_once "runtime.php";
+require_once __DIR__ . "/runtime.php";
 
 use APIEngine\Method;
 
 abstract class EndpointComponent {
 	const WILDCARD = "*";
 	const ROOT = "/";
-}
-
-class RedirectEntry {
-	
-	public $class_name;
-	public $file_name;
-	public $parameters;
-	
-	function __construct($dict) {
-		$this->class_name = $dict["class"];
-		$this->file_name = $dict["file"];
-		$this->parameters = array_key_exists("parameters", $dict) ? $dict["parameters"] : [];
-	}
-	
+	const OPTIONAL = "?";
 }
 
 class APIRequest {
@@ -28,7 +15,66 @@ class APIRequest {
 	private $method;
 	private $arguments;
 	
+	private $router = "tree";
+	private $optionals = "expanded";
+	
 	private $redirect_tree;
+	private $regex_routes;
+	private $static_routes = [];
+	
+	//The layout of compact route tables this runtime understands
+	const COMPACT_VERSION = 1;
+	
+	//Only set for shared trees, where nodes and entries are referred to by their index
+	private $nodes = null;
+	private $entries = null;
+	
+	//Only set for compact trees, where every string is referred to by its index, and nodes
+	//are only turned back into arrays once they're reached
+	private $strings = null;
+	private $decoded_nodes = [];
+	
+	//Compact and binary entries, keyed by their index, once they've been turned back into arrays
+	private $decoded_entries = [];
+	
+	//The layout of binary route tables this runtime understands
+	const BINARY_VERSION = 1;
+	const BINARY_NONE = 0xFFFFFFFF;
+	
+	//Only set for binary trees, which are searched as they are rather than turned into arrays
+	private $binary = null;
+	private $binary_header = null;
+	
+	//How many resolved request shapes are kept inside APCu for each route table, unless the
+	//constant APIENGINE_RESOLUTION_CACHE_SIZE says otherwise (where 0 turns the cache off)
+	const RESOLUTION_CACHE_SIZE = 256;
+	
+	//How many seconds resolved request shapes are kept inside APCu
+	const RESOLUTION_CACHE_TTL = 3600;
+	
+	//Every component written in the tree, and the checksum of the route table, which are
+	//only set for route tables compiled with them
+	private $vocabulary = null;
+	private $checksum = null;
+	
+	//Entries are used as they were compiled, ["class" => ..., "file" => ...], along with the
+	//names of the parameters and the positions of the components they take their values
+	//from, in the same order, when there are any. Entries which were found along with their
+	//arguments have them as "arguments" as well
+	
+	//Maps each parameter of $entry to its value among $values, which are in the order the
+	//endpoint was written
+	static function bound_arguments($entry, $values) {
+		
+		if (!array_key_exists("names", $entry)) {
+			return [];
+		}
+		
+		return array_combine($entry["names"], array_map(function ($position) use ($values) {
+			return $values[$position];
+		}, $entry["positions"]));
+		
+	}
 	
 	static function internal_error($reason) {
 		
@@ -40,37 +86,470 @@ class APIRequest {
 		
 	}
 	
+	private function node($index) {
+		
+		if (is_null($this->strings)) {
+			return $this->nodes[$index];
+		}
+		
+		if (!array_key_exists($index, $this->decoded_nodes)) {
+			
+			//Compact nodes are [entry or -1, key, node, key, node, ...]
+			
+			$record = $this->nodes[$index];
+			$node = [];
+			
+			if ($record[0] >= 0) {
+				$node[EndpointComponent::ROOT] = $record[0];
+			}
+			
+			for ($i = 1; $i < count($record); $i += 2) {
+				$node[$this->strings[$record[$i]]] = $record[$i + 1];
+			}
+			
+			$this->decoded_nodes[$index] = $node;
+			
+		}
+		
+		return $this->decoded_nodes[$index];
+		
+	}
+	
+	private function binary_string($offset, $length) {
+		return substr($this->binary, $this->binary_header["strings"] + $offset, $length);
+	}
+	
+	private function binary_search($start, $count, $key) {
+		
+		//Keys are sorted by their bytes, which is the order strcmp compares them in
+		
+		$low = 0;
+		$high = $count - 1;
+		
+		while ($low <= $high) {
+			$middle = ($low + $high) >> 1;
+			list(, $offset, $length, $value) = unpack("V3", $this->binary, $this->binary_header["keys"] + 12 * ($start + $middle));
+			
+			$comparison = strcmp($key, $this->binary_string($offset, $length));
+			
+			if ($comparison == 0) {
+				return $value;
+			} else if ($comparison < 0) {
+				$high = $middle - 1;
+			} else {
+				$low = $middle + 1;
+			}
+		}
+		
+		return null;
+		
+	}
+	
+	private function binary_child($node, $key) {
+		
+		//Nodes are (entry, wildcard node, optional node, first key, number of keys)
+		
+		$offset = $this->binary_header["nodes"] + 20 * $node;
+		
+		if ($key === EndpointComponent::WILDCARD || $key === EndpointComponent::OPTIONAL) {
+			$child = unpack("V", $this->binary, $offset + ($key === EndpointComponent::WILDCARD ? 4 : 8))[1];
+			return $child == self::BINARY_NONE ? null : $child;
+		}
+		
+		list(, $start, $count) = unpack("V2", $this->binary, $offset + 12);
+		
+		return $this->binary_search($start, $count, $key);
+		
+	}
+	
+	private function binary_entry($entry) {
+		
+		if (!array_key_exists($entry, $this->decoded_entries)) {
+			
+			//Entries are (class name, file name, first parameter, number of parameters), where
+			//each string is an offset and a length
+			
+			$record = unpack("V6", $this->binary, $this->binary_header["entries"] + 24 * $entry);
+			$names = [];
+			$positions = [];
+			
+			for ($i = 0; $i < $record[6]; $i++) {
+				list(, $position, $offset, $length) = unpack("V3", $this->binary, $this->binary_header["parameters"] + 12 * ($record[5] + $i));
+				$names[] = $this->binary_string($offset, $length);
+				$positions[] = $position;
+			}
+			
+			$this->decoded_entries[$entry] = [
+				"class" => $this->binary_string($record[1], $record[2]),
+				"file" => $this->binary_string($record[3], $record[4]),
+				"names" => $names,
+				"positions" => $positions
+			];
+		}
+		
+		return $this->decoded_entries[$entry];
+		
+	}
+	
+	//The part of the tree for the method, or null if it has no endpoints
+	private function root($method) {
+		
+		if (!is_null($this->binary)) {
+			return $this->binary_search($this->binary_header["roots_start"], $this->binary_header["roots_count"], $method);
+		}
+		
+		if (is_null($this->redirect_tree) || !array_key_exists($method, $this->redirect_tree)) {
+			return null;
+		}
+		
+		return $this->child($this->redirect_tree, $method);
+		
+	}
+	
+	//The part of the tree beneath $sub_tree for $key, or null if there isn't one
+	private function child($sub_tree, $key) {
+		
+		if (!is_null($this->binary)) {
+			return $this->binary_child($sub_tree, $key);
+		}
+		
+		if (!array_key_exists($key, $sub_tree)) {
+			return null;
+		}
+		
+		return is_null($this->nodes) ? $sub_tree[$key] : $this->node($sub_tree[$key]);
+		
+	}
+	
+	private function entry($entry) {
+		
+		if (!is_null($this->binary)) {
+			return $this->binary_entry($entry);
+		}
+		
+		if (is_null($this->entries)) {
+			return $entry;
+		}
+		
+		if (is_null($this->strings)) {
+			return $this->entries[$entry];
+		}
+		
+		//Compact entries are [class name, file name, position, parameter name, ...]
+		
+		if (!array_key_exists($entry, $this->decoded_entries)) {
+			$record = $this->entries[$entry];
+			$names = [];
+			$positions = [];
+			
+			for ($i = 2; $i < count($record); $i += 2) {
+				$positions[] = $record[$i];
+				$names[] = $this->strings[$record[$i + 1]];
+			}
+			
+			$this->decoded_entries[$entry] = [
+				"class" => $this->strings[$record[0]],
+				"file" => $this->strings[$record[1]],
+				"names" => $names,
+				"positions" => $positions
+			];
+		}
+		
+		return $this->decoded_entries[$entry];
+		
+	}
+	
+	//The entry at the root of $sub_tree, or null if there isn't one
+	private function root_entry($sub_tree) {
+		
+		if (!is_null($this->binary)) {
+			$entry = unpack("V", $this->binary, $this->binary_header["nodes"] + 20 * $sub_tree)[1];
+			return $entry == self::BINARY_NONE ? null : $this->binary_entry($entry);
+		}
+		
+		return array_key_exists(EndpointComponent::ROOT, $sub_tree) ? $this->entry($sub_tree[EndpointComponent::ROOT]) : null;
+		
+	}
+	
+	private function static_entry($static_key) {
+		
+		if (!is_null($this->binary)) {
+			$entry = $this->binary_search($this->binary_header["static_start"], $this->binary_header["static_count"], $static_key);
+			return is_null($entry) ? null : $this->binary_entry($entry);
+		}
+		
+		return array_key_exists($static_key, $this->static_routes) ? $this->entry($this->static_routes[$static_key]) : null;
+		
+	}
+	
+	private static function use_apcu() {
+		return function_exists("apcu_fetch") && apcu_enabled();
+	}
+	
+	function resolution_cache_statistics() {
+		
+		//The counts are kept for each route table, alongside the resolutions themselves
+		
+		if (!self::use_apcu()) {
+			return ["backend" => "none", "hits" => 0, "misses" => 0];
+		}
+		
+		return [
+			"backend" => "apcu",
+			"hits" => intval(apcu_fetch("apiengine:resolutions:" . $this->checksum . ":hits")),
+			"misses" => intval(apcu_fetch("apiengine:resolutions:" . $this->checksum . ":misses"))
+		];
+		
+	}
+	
+	private function cached_resolution($cache_key) {
+		
+		$resolution = apcu_fetch($cache_key);
+		$counter_key = "apiengine:resolutions:" . $this->checksum . ($resolution === false ? ":misses" : ":hits");
+		
+		if (apcu_inc($counter_key) === false) {
+			apcu_add($counter_key, 1);
+		}
+		
+		return $resolution;
+		
+	}
+	
+	private function cache_resolution($cache_key, $resolution, $cache_size) {
+		
+		//APCu is shared by every worker, so it's bounded by a ring of slots for each route
+		//table. Storing a resolution evicts whichever was stored in its slot before, which
+		//is the one stored longest ago rather than the least recently used
+		
+		$ring_key = "apiengine:resolutions:" . $this->checksum;
+		$next = apcu_inc($ring_key . ":next");
+		
+		if ($next === false) {
+			apcu_add($ring_key . ":next", 0, self::RESOLUTION_CACHE_TTL);
+			$next = apcu_inc($ring_key . ":next");
+		}
+		
+		$slot_key = $ring_key . ":slot:" . ($next % $cache_size);
+		$evicted_key = apcu_fetch($slot_key);
+		
+		if ($evicted_key !== false && $evicted_key !== $cache_key) {
+			apcu_delete($evicted_key);
+		}
+		
+		apcu_store($slot_key, $cache_key, self::RESOLUTION_CACHE_TTL);
+		apcu_store($cache_key, $resolution, self::RESOLUTION_CACHE_TTL);
+		
+	}
+	
 	private function redirect_entry_for_request($method, $components) {
+		
+		$cache_size = defined("APIENGINE_RESOLUTION_CACHE_SIZE") ? APIENGINE_RESOLUTION_CACHE_SIZE : self::RESOLUTION_CACHE_SIZE;
+		
+		//Without APCu nothing outlives the request, so there'd never be anything to find
+		
+		if (is_null($this->vocabulary) || $cache_size <= 0 || !self::use_apcu()) {
+			return $this->resolve_request($method, $components);
+		}
+		
+		//Components which aren't written anywhere in the tree can only be the value of a
+		//variable, so they're replaced by a placeholder giving their position. Every request
+		//with the same shape finds the same entry, with its arguments in the same places
+		
+		$shape = [];
+		
+		foreach ($components as $index => $component) {
+			$shape[] = array_key_exists($component, $this->vocabulary) ? $component : "\0" . $index;
+		}
+		
+		$cache_key = "apiengine:resolution:" . $this->checksum . ":" . $method . "/" . implode("/", $shape);
+		$resolution = $this->cached_resolution($cache_key);
+		
+		if ($resolution === false) {
+			$redirect_entry = $this->resolve_request($method, $shape);
+			
+			//Requests which don't find anything aren't kept, so they can't push out those which do
+			
+			if (is_null($redirect_entry)) {
+				return null;
+			}
+			
+			$arguments = array_key_exists("arguments", $redirect_entry) ? $redirect_entry["arguments"] : self::bound_arguments($redirect_entry, $shape);
+			
+			$resolution = ["class" => $redirect_entry["class"], "file" => $redirect_entry["file"], "arguments" => $arguments];
+			$this->cache_resolution($cache_key, $resolution, $cache_size);
+		}
+		
+		//Placeholders are swapped back for the components they stand for
+		
+		foreach ($resolution["arguments"] as $name => $value) {
+			if (is_string($value) && strlen($value) > 0 && $value[0] === "\0") {
+				$resolution["arguments"][$name] = $components[intval(substr($value, 1))];
+			}
+		}
+		
+		return $resolution;
+		
+	}
+	
+	private function resolve_request($method, $components) {
 
-		if (is_null($this->redirect_tree) || !array_key_exists($method, $this->redirect_tree)) {
+		//Endpoints without any variables can be found with a single lookup
+		
+		$static_entry = $this->static_entry($method . "/" . implode("/", $components));
+		
+		if (!is_null($static_entry)) {
+			return $static_entry;
+		}
+		
+		if ($this->router == "regex") {
+			return $this->regex_entry_for_request($method, $components);
+		}
+		
+		$sub_tree = $this->root($method);
+		
+		if (is_null($sub_tree)) {
 			return null;
 		}
 		
-		$sub_tree = $this->redirect_tree[$method];
+		if ($this->optionals == "native") {
+			return $this->native_entry_for_request($sub_tree, $components);
+		}
+		
 		$current_item = 0;
 		
 		while ($current_item < count($components)) {
 			$current_component = $components[$current_item];
 			
-			if (array_key_exists($current_component, $sub_tree)) {
-				$sub_tree = $sub_tree[$current_component];
-				$current_item++;
-			} else if (array_key_exists(EndpointComponent::WILDCARD, $sub_tree)) {
-				$sub_tree = $sub_tree[EndpointComponent::WILDCARD];
+			$next_tree = $this->child($sub_tree, $current_component);
+			
+			if (is_null($next_tree)) {
+				$next_tree = $this->child($sub_tree, EndpointComponent::WILDCARD);
+			}
+			
+			if (!is_null($next_tree)) {
+				$sub_tree = $next_tree;
 				$current_item++;
-			} else if (count($current_component) == 0) {
+			} else if ($current_component === "") {
 				break;
 			} else {
 				return null;
 			}
 		}
 		
-		if (array_key_exists(EndpointComponent::ROOT, $sub_tree)) {
-			return new RedirectEntry($sub_tree[EndpointComponent::ROOT]);
+		return $this->root_entry($sub_tree);
+		
+	}
+	
+	private function optional_closure($states) {
+		
+		//Add every part of the tree which can be reached by leaving out an optional,
+		//where the optional's value is null
+		
+		for ($i = 0; $i < count($states); $i++) {
+			list($sub_tree, $values) = $states[$i];
+			
+			$optional_tree = $this->child($sub_tree, EndpointComponent::OPTIONAL);
+			
+			if (!is_null($optional_tree)) {
+				$values[] = null;
+				$states[] = [$optional_tree, $values];
+			}
+		}
+		
+		return $states;
+		
+	}
+	
+	private function native_entry_for_request($method_tree, $components) {
+		
+		//With optionals stored natively, the request could be in several places in the tree
+		//at once, each given as the part of the tree along with the values taken to get there
+		
+		$states = $this->optional_closure([[$method_tree, []]]);
+		
+		foreach ($components as $current_component) {
+			$static_states = [];
+			$variable_states = [];
+			
+			foreach ($states as list($sub_tree, $values)) {
+				$values[] = $current_component;
+				
+				$static_tree = $this->child($sub_tree, $current_component);
+				
+				if (!is_null($static_tree)) {
+					$static_states[] = [$static_tree, $values];
+				}
+				
+				foreach ([EndpointComponent::WILDCARD, EndpointComponent::OPTIONAL] as $key) {
+					$variable_tree = $this->child($sub_tree, $key);
+					
+					if (!is_null($variable_tree)) {
+						$variable_states[] = [$variable_tree, $values];
+					}
+				}
+			}
+			
+			//Static components are preferred over variables, just as they are in the tree walk
+			
+			$states = $this->optional_closure(count($static_states) > 0 ? $static_states : $variable_states);
+			
+			if (count($states) == 0) {
+				return null;
+			}
+		}
+		
+		foreach ($states as list($sub_tree, $values)) {
+			$redirect_entry = $this->root_entry($sub_tree);
+			
+			if (!is_null($redirect_entry)) {
+				
+				//Parameters are positioned as the endpoint was written, including optionals left out
+				$redirect_entry["arguments"] = self::bound_arguments($redirect_entry, $values);
+				
+				return $redirect_entry;
+			}
+		}
+		
+		return null;
+		
+	}
+	
+	private function regex_entry_for_request($method, $components) {
+		
+		if (!array_key_exists($method, $this->regex_routes)) {
+			return null;
+		}
+		
+		$routes = $this->regex_routes[$method];
+		
+		if (count($components) == 0) {
+			return $routes["root"];
+		}
+		
+		//The pattern to use depends on the first component, just like the first step of the tree walk
+		
+		$first_component = $components[0];
+		
+		if (array_key_exists($first_component, $routes["static"])) {
+			list($pattern, $leaves) = $routes["static"][$first_component];
+		} else if (!is_null($routes["wildcard"])) {
+			list($pattern, $leaves) = $routes["wildcard"];
 		} else {
 			return null;
 		}
 		
+		//One match finds the entry (by its mark) and captures every variable in order
+		
+		if (preg_match($pattern, implode("/", $components), $matches) !== 1) {
+			return null;
+		}
+		
+		$redirect_entry = $leaves[$matches["MARK"]];
+		$names = array_key_exists("names", $redirect_entry) ? $redirect_entry["names"] : [];
+		$redirect_entry["arguments"] = array_combine($names, array_slice($matches, 1, count($names)));
+		
+		return $redirect_entry;
+		
 	}
 	
 	function execute() {
@@ -81,46 +560,179 @@ class APIRequest {
 	        header("HTTP/1.1 404 Not Found");
 	        die("<h1>404 Not Found</h1><p>The requested endpoint ‘/" . $_REQUEST["arguments"] . "’ does not exist</p>");
         }
+        
+        $this->execute_entry($desired_entry);
+        
+	}
+	
+	//Handles the request with the endpoint of $desired_entry, an entry as it was compiled. The
+	//stubs which .htaccess sends requests straight to call this, without finding the endpoint first
+	function execute_entry($desired_entry) {
 
 		//We can now construct the request object
         
         $request = new APIEngine\Request();
         
         $request->method = $this->method;
-        $request->headers = apache_request_headers();
-        $request->arguments = [];
-        
-        //Get the arguments and map them to their names
-        
-        foreach ($desired_entry->parameters as $index => $name) {
-	        $request->arguments[$name] = $this->arguments[$index];
-        }
         
-        //Now we open the desired class and ensure that it implements the Requestable interface
+        //Get the arguments and map them to their names, unless that's already been done
+        $request->arguments = array_key_exists("arguments", $desired_entry) ? $desired_entry["arguments"] : self::bound_arguments($desired_entry, $this->arguments);
         
-        $script_location = "../" . trim($desired_entry->file_name, "/");
+        //Now we load the desired class, which the autoloader includes from its file, and
+        //ensure that it implements the Requestable interface
         
-        //Go to the location of the script
-        chdir(dirname($script_location));
+        $class_name = $desired_entry["class"];
         
-        //Include it
-        require_once basename($desired_entry->file_name);
-        		
-        if (class_exists($desired_entry->class_name) == false) {
-	        self::internal_error("Class ‘" . $desired_entry->class_name . "’ does not exist");
+        if (class_exists($class_name) == false) {
+	        self::internal_error("Class ‘" . $class_name . "’ does not exist");
         }
         
-        $instance = new $desired_entry->class_name;
+        $instance = new $class_name;
         
         if ($instance instanceof APIEngine\Requestable) {
 	        $instance->execute($request);
         } else {
-	        self::internal_error("Class ‘" . $desired_entry->class_name . "’ does not implement interface <code>Requestable</code>");
+	        self::internal_error("Class ‘" . $class_name . "’ does not implement interface <code>Requestable</code>");
         }
 
 	}
 	
-	function __construct() {
+	static function register_autoloader() {
+		
+		//Every class is mapped to its file when the project is compiled, so finding one
+		//is a single lookup, and its file is included by its full path
+		
+		$class_files = require __DIR__ . "/autoload.php";
+		
+		spl_autoload_register(function ($class_name) use ($class_files) {
+			if (array_key_exists($class_name, $class_files)) {
+				require_once $class_files[$class_name];
+			}
+		});
+		
+	}
+	
+	//Only used when the route table comes from the JSON file, where the binary table can't be
+	//a string literal which opcache keeps in shared memory, so each worker has a copy of it
+	private function read_binary_route_table($path, $checksum) {
+		
+		//APCu saves reading the file each request, keyed on the checksum so a table which
+		//has changed is never used, but fetching it still copies it into the worker
+		
+		$cache_key = "apiengine:" . $checksum;
+		$use_apcu = self::use_apcu();
+		$binary = $use_apcu ? apcu_fetch($cache_key) : false;
+		
+		if ($binary === false) {
+			$binary = file_get_contents($path);
+			
+			if ($binary === false) {
+				self::internal_error("The binary route table does not exist");
+			}
+			
+			if ($use_apcu) {
+				apcu_store($cache_key, $binary);
+			}
+		}
+		
+		return $binary;
+		
+	}
+	
+	private function load_binary_route_table($binary) {
+		
+		$header = unpack("a4magic/Vversion/Vnodes/Vkeys/Ventries/Vparameters/Vstrings/Vroots_start/Vroots_count/Vstatic_start/Vstatic_count", $binary);
+		
+		if ($header["magic"] !== "AERT" || $header["version"] !== self::BINARY_VERSION) {
+			self::internal_error("The binary route table is not one this version of APIEngine can read");
+		}
+		
+		$this->binary = $binary;
+		$this->binary_header = $header;
+		
+	}
+	
+	private function load_route_table($route_table) {
+		
+		$this->router = $route_table["router"];
+		$this->optionals = $route_table["optionals"];
+		
+		if (array_key_exists("static", $route_table)) {
+			$this->static_routes = $route_table["static"];
+		}
+		
+		if ($this->router == "regex") {
+			$this->regex_routes = $route_table["regex"];
+		}
+		
+		if (array_key_exists("vocabulary", $route_table)) {
+			$this->vocabulary = $route_table["vocabulary"];
+			$this->checksum = $route_table["checksum"];
+		}
+		
+		if ($route_table["format"] == "compact") {
+			if ($route_table["version"] !== self::COMPACT_VERSION) {
+				self::internal_error("The route table was compiled for a different version of APIEngine, so the project needs updating");
+			}
+			
+			$this->strings = $route_table["strings"];
+		}
+		
+		if ($route_table["format"] == "binary") {
+			if ($route_table["version"] !== self::BINARY_VERSION) {
+				self::internal_error("The route table was compiled for a different version of APIEngine, so the project needs updating");
+			}
+			
+			//The compiled route table has the binary table as a string literal, which is interned
+			//by opcache, so using it doesn't copy it
+			
+			if (array_key_exists("binary", $route_table)) {
+				$this->load_binary_route_table($route_table["binary"]);
+			} else {
+				$this->load_binary_route_table($this->read_binary_route_table(__DIR__ . "/../.definition.bin", $route_table["checksum"]));
+			}
+		} else if (in_array($route_table["format"], ["shared", "compact"])) {
+			$this->nodes = $route_table["nodes"];
+			$this->entries = $route_table["entries"];
+			$this->redirect_tree = $route_table["roots"];
+		} else if ($this->router == "tree") {
+			$this->redirect_tree = $route_table["tree"];
+		}
+		
+	}
+	
+	private function load_route_table_file() {
+		
+		//Prefer the compiled route table, which opcache keeps hold of between requests
+		
+		$route_table_path = __DIR__ . "/../.definition.php";
+		
+		if (file_exists($route_table_path)) {
+			$this->load_route_table(require $route_table_path);
+		} else if (file_exists(__DIR__ . "/../.definition.json")) {
+			$redirect_tree_string = file_get_contents(__DIR__ . "/../.definition.json");
+			$redirect_tree = json_decode($redirect_tree_string, true);
+			
+			//Shared and compact trees are written out as the whole route table, but nested ones as just the tree
+			
+			if (array_key_exists("format", $redirect_tree)) {
+				$this->load_route_table($redirect_tree);
+			} else {
+				$this->redirect_tree = $redirect_tree;
+			}
+		} else {
+			self::internal_error("The endpoint definition file does not exist");
+		}
+		
+	}
+	
+	//The path of the request, without the query string, as .htaccess matched it
+	static function request_path() {
+		return rawurldecode(explode("?", $_SERVER["REQUEST_URI"], 2)[0]);
+	}
+	
+	//The path is passed on by .htaccess as the "arguments" parameter, unless it's given
+	function __construct($load_route_table = true, $path = null) {
 		
 		$this->method = $_SERVER["REQUEST_METHOD"];
 		
@@ -128,31 +740,37 @@ class APIRequest {
 			self::internal_error("This server can only accept GET, POST, PUT and DELETE requests");
 		}
 		
-		if (!file_exists("../.definition.json")) {
-			self::internal_error("The endpoint definition file does not exist");
+		//Requests sent straight to their endpoint's stub don't need to find it
+		
+		if ($load_route_table) {
+			$this->load_route_table_file();
 		}
 		
-		$redirect_tree_string = file_get_contents("../.definition.json");
-		$this->redirect_tree = json_decode($redirect_tree_string, true);
+		//PUT and DELETE parameters aren't stored inside $_REQUEST for some reason, so manually
+		//merge them, unless they're only wanted once the handler asks for them
 		
-		//PUT and DELETE parameters aren't stored inside $_REQUEST for some reason, so manually merge them
-         
-        if (in_array($this->method, [Method::PUT, Method::DELETE])) {
-            $parameters = [];
-            parse_str(file_get_contents("php://input"), $parameters);
-             
-            $_REQUEST = array_merge($_REQUEST, $parameters);
-        }
-        
-        $this->arguments = array_filter(explode("/", $_REQUEST["arguments"]), function($value) {
+		if (!APIEngine\Request::lazy_parameters() && in_array($this->method, [Method::PUT, Method::DELETE])) {
+			$parameters = [];
+			parse_str(file_get_contents("php://input"), $parameters);
+			
+			$_REQUEST = array_merge($_REQUEST, $parameters);
+		}
+		
+        $this->arguments = array_values(array_filter(explode("/", is_null($path) ? $_REQUEST["arguments"] : $path), function($value) {
 	        return $value !== "";
-	    });
+	    }));
                			
 	}
 	
 }
 
-$incoming_request = new APIRequest();
-$incoming_request->execute();
+//The benchmarks load this file to time finding endpoints, without handling a request
+
+if (!defined("APIENGINE_NO_DISPATCH")) {
+	APIRequest::register_autoloader();
+	
+	$incoming_request = new APIRequest();
+	$incoming_request->execute();
+}
 	
 ?>
\ No newline at end of file
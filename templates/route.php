@@ -0,0 +1,15 @@
+<?php
+
+//Generated for the endpoint handled by [name], which .htaccess sends requests to directly,
+//so they're handled without finding the endpoint first
+
+define("APIENGINE_NO_DISPATCH", true);
+
+require __DIR__ . "/../request.php";
+
+APIRequest::register_autoloader();
+
+$incoming_request = new APIRequest(false, APIRequest::request_path());
+$incoming_request->execute_entry([entry]);
+
+?>
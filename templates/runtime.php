@@ -5,7 +5,117 @@ namespace APIEngine;
 class Request {
     public $method;
     public $arguments;
-    public $headers;
+    
+    //Each is only read from the request the first time it's asked for, then kept
+    private $headers = null;
+    private $body = null;
+    private $parameters = null;
+    
+    //Anything else handlers set on the request, which would otherwise be a dynamic property
+    private $properties = [];
+    
+    //Handlers written before the headers were read lazily use $request->headers
+    function __get($name) {
+        if ($name === "headers") {
+            return $this->headers();
+        }
+        
+        if (array_key_exists($name, $this->properties)) {
+            return $this->properties[$name];
+        }
+        
+        trigger_error("Undefined property: " . __CLASS__ . "::$" . $name, E_USER_NOTICE);
+        return null;
+    }
+    
+    //..and can still check it with isset, or replace it
+    function __isset($name) {
+        if ($name === "headers") {
+            return !is_null($this->headers());
+        }
+        
+        return isset($this->properties[$name]);
+    }
+    
+    function __set($name, $value) {
+        if ($name === "headers") {
+            $this->headers = $value;
+        } else {
+            $this->properties[$name] = $value;
+        }
+    }
+    
+    function __unset($name) {
+        unset($this->properties[$name]);
+    }
+    
+    //PHP only parses the body of POST requests by itself, so request.php merges the body of
+    //PUT and DELETE requests into $_REQUEST before the handler runs, unless the constant
+    //APIENGINE_LAZY_PARAMETERS is defined as true, where it's only parsed once parameters()
+    //is called
+    static function lazy_parameters() {
+        return defined("APIENGINE_LAZY_PARAMETERS") && APIENGINE_LAZY_PARAMETERS;
+    }
+    
+    function headers() {
+        if (is_null($this->headers)) {
+            $this->headers = apache_request_headers();
+        }
+        
+        return $this->headers;
+    }
+    
+    //The whole body of the request, as a string
+    function body() {
+        if (is_null($this->body)) {
+            $this->body = file_get_contents("php://input");
+        }
+        
+        return $this->body;
+    }
+    
+    //The body of the request as a stream, which can be read a little at a time without the
+    //whole body ever being held in memory
+    function body_stream() {
+        return fopen("php://input", "rb");
+    }
+    
+    //Yields the body of the request in chunks of at most $chunk_size bytes
+    function body_chunks($chunk_size = 65536) {
+        $stream = $this->body_stream();
+        
+        try {
+            while (!feof($stream)) {
+                $chunk = fread($stream, $chunk_size);
+                
+                if ($chunk === false) {
+                    break;
+                }
+                
+                if ($chunk !== "") {
+                    yield $chunk;
+                }
+            }
+        } finally {
+            fclose($stream);
+        }
+    }
+    
+    //The request's form parameters, including those in the body of PUT and DELETE requests
+    function parameters() {
+        if (is_null($this->parameters)) {
+            $this->parameters = $_REQUEST;
+            
+            if (self::lazy_parameters() && in_array($this->method, [Method::PUT, Method::DELETE])) {
+                $body_parameters = [];
+                parse_str($this->body(), $body_parameters);
+                
+                $this->parameters = array_merge($this->parameters, $body_parameters);
+            }
+        }
+        
+        return $this->parameters;
+    }
 }
 
 class Method {
@@ -0,0 +1,99 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Parent directory
+
+import shutil
+import tempfile
+from unittest import mock
+
+import Cache
+
+import unittest
+
+class CompileCacheTests(unittest.TestCase):
+
+	definition_code = 'export GET "/info" to "InfoRequest" in "info.php"\n'
+	settings = {"router": "tree", "optionals": "expanded", "format": "nested"}
+
+	outputs = {".definition.json": "{}"}
+	classes = {("InfoRequest", "/info.php")}
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+
+	def test_load(self):
+
+		cache = Cache.CompileCache(self.directory)
+
+		self.assertIsNone(cache.load(self.definition_code, self.settings))
+
+		cache.store(self.definition_code, self.settings, self.outputs, self.classes)
+
+		self.assertEqual((self.outputs, self.classes), cache.load(self.definition_code, self.settings))
+
+		# Anything which could change the outputs means they can't be reused
+
+		self.assertIsNone(cache.load(self.definition_code + "\n", self.settings))
+		self.assertIsNone(cache.load(self.definition_code, dict(self.settings, router="regex")))
+
+		cache.version = "another version"
+		self.assertIsNone(cache.load(self.definition_code, self.settings))
+
+
+	def test_engine_version(self):
+
+		# Templates are rendered into the outputs, so changing one changes the version
+
+		templates_directory = os.path.join(self.directory, "templates")
+		os.mkdir(templates_directory)
+
+		with open(os.path.join(templates_directory, "htaccess"), "w") as template_file:
+			template_file.write("RewriteEngine On\n")
+
+		with mock.patch.object(Cache, "templates_directory", templates_directory):
+			version = Cache.engine_version()
+
+			with open(os.path.join(templates_directory, "htaccess"), "a") as template_file:
+				template_file.write("RewriteBase /\n")
+
+			self.assertNotEqual(version, Cache.engine_version())
+
+
+	def test_corrupt_entry(self):
+
+		cache = Cache.CompileCache(self.directory)
+		cache.store(self.definition_code, self.settings, self.outputs, self.classes)
+
+		with open(cache.entry_path(cache.key(self.definition_code, self.settings)), "wb") as entry_file:
+			entry_file.write(b"not a pickle")
+
+		self.assertIsNone(cache.load(self.definition_code, self.settings))
+
+
+	def test_eviction(self):
+
+		cache = Cache.CompileCache(self.directory, max_entries=3)
+
+		for i in range(3):
+			definition_code = self.definition_code * (i + 1)
+			cache.store(definition_code, self.settings, self.outputs, self.classes)
+
+			# Each is used after the one before, whatever the resolution of the clock
+			os.utime(cache.entry_path(cache.key(definition_code, self.settings)), (i, i))
+
+		# Using the first makes the second the least recently used
+
+		self.assertIsNotNone(cache.load(self.definition_code, self.settings))
+
+		cache.store(self.definition_code * 4, self.settings, self.outputs, self.classes)
+
+		self.assertEqual(3, len(os.listdir(self.directory)))
+		self.assertIsNotNone(cache.load(self.definition_code, self.settings))
+		self.assertIsNone(cache.load(self.definition_code * 2, self.settings))
+
+if __name__ == '__main__':
+	unittest.main()
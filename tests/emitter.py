@@ -0,0 +1,339 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Parent directory
+
+import Tokenizer
+import Parser
+import Emitter
+from Parser import EndpointComponent
+
+import itertools
+import re
+import unittest
+
+def parse(definition_code):
+	parser = Parser.Parser(Tokenizer.Tokenizer(definition_code).tokens())
+	parser.parse()
+
+	return parser
+
+
+def resolve(tree, method, components):
+	"""Walks the tree the way request.php does, returning the entry found or None."""
+
+	sub_tree = tree.get(method)
+
+	for component in components:
+		if sub_tree is None:
+			return None
+
+		sub_tree = sub_tree.get(component, sub_tree.get(EndpointComponent.WILDCARD))
+
+	return None if sub_tree is None else sub_tree.get(EndpointComponent.ROOT)
+
+
+class BinaryTable:
+	"""Reads a binary route table as request.php does, without decoding it first."""
+
+	def __init__(self, table):
+		self.table = table
+
+		header = Emitter.binary_header.unpack_from(table)
+		self.magic, self.version, self.nodes, self.keys, self.entries, self.parameters, self.strings = header[:7]
+		self.roots_range, self.static_range = header[7:9], header[9:11]
+
+	def string(self, offset, length):
+		return self.table[self.strings + offset:self.strings + offset + length].decode("utf-8")
+
+	def search(self, key_range, key):
+		start, count = key_range
+		low, high = 0, count - 1
+
+		while low <= high:
+			middle = (low + high) // 2
+			offset, length, value = Emitter.binary_key.unpack_from(self.table, self.keys + Emitter.binary_key.size * (start + middle))
+			candidate = self.string(offset, length)
+
+			if key == candidate:
+				return value
+			elif key.encode("utf-8") < candidate.encode("utf-8"):
+				high = middle - 1
+			else:
+				low = middle + 1
+
+		return None
+
+	def node(self, index):
+		return Emitter.binary_node.unpack_from(self.table, self.nodes + Emitter.binary_node.size * index)
+
+	def child(self, index, key):
+		entry, wildcard, optional, start, count = self.node(index)
+
+		if key == EndpointComponent.WILDCARD:
+			return None if wildcard == Emitter.BINARY_NONE else wildcard
+
+		return self.search((start, count), key)
+
+	def entry(self, index):
+		class_offset, class_length, file_offset, file_length, start, count = Emitter.binary_entry.unpack_from(self.table, self.entries + Emitter.binary_entry.size * index)
+		parameters = []
+
+		for parameter in range(start, start + count):
+			position, offset, length = Emitter.binary_parameter.unpack_from(self.table, self.parameters + Emitter.binary_parameter.size * parameter)
+			parameters.append((position, self.string(offset, length)))
+
+		return self.string(class_offset, class_length), self.string(file_offset, file_length), tuple(parameters)
+
+	def resolve(self, method, components):
+		node = self.search(self.roots_range, method)
+
+		for component in components:
+			if node is None:
+				return None
+
+			child = self.child(node, component)
+			node = self.child(node, EndpointComponent.WILDCARD) if child is None else child
+
+		if node is None or self.node(node)[0] == Emitter.BINARY_NONE:
+			return None
+
+		return self.entry(self.node(node)[0])
+
+
+def python_pattern(pattern):
+	""" Translates a pattern from `Emitter.regex_routes` into one Python can run. Branch
+		resets become ordinary groups, so variables are told apart by their order rather
+		than their number, and each (*MARK) becomes an empty group named after it. """
+
+	pattern = pattern[len("~^"):-len("~")].replace("(?|", "(?:").replace("\\z", "\\Z")
+
+	return re.compile(re.sub(r"\(\*MARK:(\d+)\)", r"(?P<mark\1>)", pattern))
+
+
+def regex_resolve(routes, method, components):
+	""" Finds the entry for a request with the regex routes the way request.php does,
+		returning it along with its arguments, or None. """
+
+	if method not in routes:
+		return None
+
+	routes = routes[method]
+
+	if len(components) == 0:
+		return None if routes["root"] is None else (routes["root"], {})
+
+	if components[0] in routes["static"]:
+		pattern, leaves = routes["static"][components[0]]
+	elif routes["wildcard"] is not None:
+		pattern, leaves = routes["wildcard"]
+	else:
+		return None
+
+	compiled = python_pattern(pattern)
+	match = compiled.match("/".join(components))
+
+	if match is None:
+		return None
+
+	marks = [name for name, value in match.groupdict().items() if value is not None]
+	captured = [value for index, value in enumerate(match.groups(), 1) if value is not None and index not in compiled.groupindex.values()]
+
+	entry = leaves[int(marks[0][len("mark"):])]
+
+	return entry, dict(zip(entry.dict_value().get("names", []), captured))
+
+
+class EmitterTests(unittest.TestCase):
+
+	definition_code = """export GET "/users/[id]/image" to "ImageRequest" in "image.php"
+						 export GET "/groups/[id]/image" to "ImageRequest" in "image.php"
+						 export POST "/users/[id]/image" to "ImageRequest" in "image.php"
+						 export GET "/info" to "InfoRequest" in "info.php"
+					  """
+
+	def test_php_value(self):
+
+		value = {"it's": [1, None, True, r"back\slash"], 2: {}}
+		expected_php = r"['it\'s'=>[1,null,true,'back\\slash',],2=>[],]"
+
+		self.assertEqual(expected_php, Emitter.php_value(value))
+
+		# Bytes are only ever written as printable ASCII, with nothing PHP would interpolate
+		self.assertEqual(r'"AERT\x00\xff\x22\x24\x5c"', Emitter.php_value(b'AERT\x00\xff"$\\'))
+
+
+	def test_php_file(self):
+
+		# Single-quoted strings leave $ alone, and only need quotes and backslashes escaped
+
+		for text, expected_php in [("$name", "'$name'"), ('"{$x}"', "'\"{$x}\"'"), ("it's", r"'it\'s'"), ("trailing\\", r"'trailing\\'"), ("\\'", r"'\\\''")]:
+			self.assertEqual(expected_php, Emitter.php_value(text))
+
+		route_table = {"tree": {"GET": {"users": {"*": {"/": {"class": "A", "file": "/a.php"}}}, "empty": {}}}, "static": {}, "roots": [[], [0, [1]]]}
+		expected_php = "<?php\n\nreturn ['tree'=>['GET'=>['users'=>['*'=>['/'=>['class'=>'A','file'=>'/a.php',],],],'empty'=>[],],],'static'=>[],'roots'=>[[],[0,[1,],],],];\n"
+
+		self.assertEqual(expected_php, Emitter.php_file(route_table))
+
+		# Entries are written as their dictionary values
+		self.assertEqual("['/'=>['file'=>'/a.php','class'=>'A',],]", Emitter.php_value({"/": Parser.RedirectEntry("A", "/a.php")}, default=lambda entry: entry.dict_value()))
+
+
+	def test_vocabulary(self):
+
+		parser = parse(self.definition_code)
+
+		# Variables and the root aren't components anyone can write
+		self.assertEqual({"users", "groups", "image", "info"}, Emitter.vocabulary(parser.tree))
+
+
+	def test_shared_tree(self):
+
+		parser = parse(self.definition_code)
+		shared_tree = Emitter.shared_tree(parser.tree, parser.static_routes)
+
+		nodes, entries = shared_tree["nodes"], shared_tree["entries"]
+
+		# Everything beneath 'users' and 'groups' is identical, in both methods
+		get_root = nodes[shared_tree["roots"]["GET"]]
+		post_root = nodes[shared_tree["roots"]["POST"]]
+
+		self.assertEqual(get_root["users"], get_root["groups"])
+		self.assertEqual(get_root["users"], post_root["users"])
+		self.assertEqual(2, len(entries))
+
+		# Each path leads to the same entry as it does in the tree
+
+		for method, components in [("GET", ["users", "*", "image"]), ("POST", ["users", "*", "image"]), ("GET", ["info"])]:
+			sub_tree, node = parser.tree[method], nodes[shared_tree["roots"][method]]
+
+			for component in components:
+				sub_tree, node = sub_tree[component], nodes[node[component]]
+
+			self.assertIs(sub_tree[EndpointComponent.ROOT], entries[node[EndpointComponent.ROOT]])
+
+		self.assertEqual("InfoRequest", entries[shared_tree["static"]["GET/info"]].class_name)
+
+
+	def test_compact_tree(self):
+
+		parser = parse(self.definition_code)
+		compact_tree = Emitter.compact_tree(parser.tree, parser.static_routes)
+
+		strings, nodes, entries = compact_tree["strings"], compact_tree["nodes"], compact_tree["entries"]
+
+		self.assertEqual(Emitter.COMPACT_VERSION, compact_tree["version"])
+		self.assertEqual(len(strings), len(set(strings)))
+
+		# Every node and entry is made up of nothing but integers
+		self.assertTrue(all(isinstance(value, int) for record in nodes + entries for value in record))
+
+		def decoded_entry(index):
+			record = entries[index]
+			return strings[record[0]], strings[record[1]], tuple((record[i], strings[record[i + 1]]) for i in range(2, len(record), 2))
+
+		# Each path leads to the same entry as it does in the tree, the way request.php decodes it
+
+		for method, components in [("GET", ["users", "*", "image"]), ("POST", ["users", "*", "image"]), ("GET", ["info"])]:
+			sub_tree, record = parser.tree[method], nodes[compact_tree["roots"][method]]
+
+			for component in components:
+				children = {strings[record[i]]: record[i + 1] for i in range(1, len(record), 2)}
+				sub_tree, record = sub_tree[component], nodes[children[component]]
+
+			entry = sub_tree[EndpointComponent.ROOT]
+			self.assertEqual((entry.class_name, entry.file_name, entry.parameters), decoded_entry(record[0]))
+
+		self.assertEqual("InfoRequest", decoded_entry(compact_tree["static"]["GET/info"])[0])
+
+
+	def test_binary_tree(self):
+
+		parser = parse(self.definition_code + 'export GET "/users/me" to "MeRequest" in "me.php"\n')
+		table = BinaryTable(Emitter.binary_tree(parser.tree, parser.static_routes))
+
+		self.assertEqual((Emitter.BINARY_MAGIC, Emitter.BINARY_VERSION), (table.magic, table.version))
+
+		def expected(method, components):
+			entry = resolve(parser.tree, method, components)
+			return None if entry is None else (entry.class_name, entry.file_name, entry.parameters)
+
+		requests = [
+			("GET", ["users", "me"]), ("GET", ["users", "12", "image"]), ("GET", ["groups", "12", "image"]),
+			("POST", ["users", "12", "image"]), ("GET", ["info"]), ("GET", ["users"]), ("PUT", ["info"]),
+			("GET", ["users", "12", "avatar"]), ("GET", [])
+		]
+
+		for method, components in requests:
+			self.assertEqual(expected(method, components), table.resolve(method, components), (method, components))
+
+		# Static routes are searched the same way as the keys of each node
+		self.assertEqual("InfoRequest", table.entry(table.search(table.static_range, "GET/info"))[0])
+		self.assertIsNone(table.search(table.static_range, "GET/nothing"))
+
+
+	def test_direct_routes(self):
+
+		parser = parse(self.definition_code + """export GET "/users/me/image" to "MeRequest" in "me.php"
+												 export GET "/users/[id]/friends/[friend]" to "FriendRequest" in "friends.php"
+											  """)
+
+		routes = Emitter.direct_routes(parser.tree, parser.static_routes)
+		components = ["users", "groups", "me", "image", "friends", "info", "12", "34"]
+
+		# Each request matches the pattern of the entry the tree walk finds, and no other
+
+		for method in ["GET", "POST"]:
+			for length in range(5):
+				for path in itertools.product(components, repeat=length):
+					matched = [entry for route_method, pattern, entry in routes if route_method == method and re.match(pattern, "/".join(path))]
+					expected = resolve(parser.tree, method, list(path))
+
+					self.assertEqual([] if expected is None else [expected], matched, (method, path))
+
+
+	def test_regex_pattern(self):
+
+		parser = parse("""export GET "/users/[id]" to "UserRequest" in "user.php"
+						  export GET "/users/me" to "MeRequest" in "me.php"
+						  export GET "/[page]/edit" to "EditRequest" in "edit.php"
+						  export GET "/" to "HomeRequest" in "home.php"
+					   """)
+
+		routes = Emitter.regex_routes(parser.tree)["GET"]
+
+		# The variable beside 'me' can't be 'me', and each branch of the reset captures it as group 1
+		pattern, leaves = routes["static"]["users"]
+		self.assertEqual(r"~^users(?|/me\z(*MARK:0)|/(?!(?:me)(?:/|\z))([^/]+)\z(*MARK:1))~", pattern)
+		self.assertEqual(["MeRequest", "UserRequest"], [entry.class_name for entry in leaves])
+
+		# Requests split by their first component, with anything else left to the wildcard pattern
+		self.assertEqual(["users"], list(routes["static"]))
+		self.assertEqual(r"~^([^/]+)/edit\z(*MARK:0)~", routes["wildcard"][0])
+
+		# ..and the empty path is found without a pattern at all
+		self.assertEqual("HomeRequest", routes["root"].class_name)
+
+
+	def test_regex_routes(self):
+
+		parser = parse(self.definition_code + """export GET "/users/me/image" to "MeRequest" in "me.php"
+												 export GET "/users/[id]/friends/[friend]?" to "FriendRequest" in "friends.php"
+												 export PUT "/[page]?/[section]/edit" to "EditRequest" in "edit.php"
+												 export PUT "/info/edit" to "InfoEditRequest" in "info.php"
+												 export GET "/" to "HomeRequest" in "home.php"
+											  """)
+
+		routes = Emitter.regex_routes(parser.tree)
+		components = ["users", "groups", "me", "image", "friends", "info", "edit", "12"]
+
+		# Each request finds the entry the tree walk finds, with the same arguments
+
+		for method in ["GET", "POST", "PUT", "DELETE"]:
+			for length in range(5):
+				for path in itertools.product(components, repeat=length):
+					entry = resolve(parser.tree, method, list(path))
+					expected = None if entry is None else (entry, {name: path[position] for position, name in entry.parameters})
+
+					self.assertEqual(expected, regex_resolve(routes, method, list(path)), (method, path))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,210 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Parent directory
+
+import json
+import shutil
+import tempfile
+from unittest import mock
+
+import Tokenizer
+import Parser
+import Incremental
+import Includes
+from Parser import ParseError
+
+import unittest
+
+def encode(tree):
+	return json.dumps(tree, default=lambda x: x.dict_value(), sort_keys=True)
+
+
+class IncludeTests(unittest.TestCase):
+
+	definition_code = """base "code"
+	include "users.def"
+
+	export GET "/info" to "InfoRequest" in "info.php"
+	include "admin/admin.def"
+	"""
+
+	included_code = {
+		"users.def": """group "/users/[id]?" base "users"
+							export GET "/" to "UserGetRequest" in "main.php"
+							export GET "/image/[size]?" to "UserImageRequest" in "image.php"
+					 """,
+		"admin/admin.def": """base "admin"
+							  export GET "/admin" to "AdminRequest" in "admin.php"
+							  include "settings.def"
+						   """,
+		"admin/settings.def": """export PUT "/admin/settings" to "SettingsRequest" in "settings.php"
+							  """
+	}
+
+	# What the definition file and its includes amount to, where each has its own base
+	# directory (and the order endpoints are inserted in doesn't matter)
+	combined_code = """export PUT "/admin/settings" to "SettingsRequest" in "settings.php"
+	group "/users/[id]?" base "users"
+		export GET "/" to "UserGetRequest" in "main.php"
+		export GET "/image/[size]?" to "UserImageRequest" in "image.php"
+
+	base "admin"
+	export GET "/admin" to "AdminRequest" in "admin.php"
+
+	base "code"
+	export GET "/info" to "InfoRequest" in "info.php"
+	"""
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.cache_path = os.path.join(self.directory, "cache")
+
+		for path, text in self.included_code.items():
+			self.write(path, text)
+
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+
+	def write(self, path, text):
+		os.makedirs(os.path.dirname(os.path.join(self.directory, path)), exist_ok=True)
+
+		with open(os.path.join(self.directory, path), "w") as included_file:
+			included_file.write(text)
+
+
+	def parse(self, definition_code, native_optionals=False):
+		tokenizer = Tokenizer.Tokenizer(definition_code)
+
+		parser = Parser.Parser(tokenizer.tokens(), native_optionals=native_optionals, locate=tokenizer.current_location)
+		parser.parse()
+
+		self.included = Includes.merge_included_files(parser, self.directory, self.cache_path)
+
+		return parser
+
+
+	def test_merged_tree(self):
+
+		for native_optionals in [False, True]:
+			expected = Parser.Parser(Tokenizer.Tokenizer(self.combined_code).tokens(), native_optionals=native_optionals)
+			expected.parse()
+
+			actual = self.parse(self.definition_code, native_optionals)
+
+			self.assertEqual(encode(expected.tree), encode(actual.tree))
+			self.assertEqual(encode(expected.static_routes), encode(actual.static_routes))
+			self.assertEqual(expected.canonical_paths, actual.canonical_paths)
+
+		self.assertEqual(["users.def", "admin/admin.def", "admin/settings.def"], [path for path, _ in self.included])
+
+
+	def test_redefinitions(self):
+
+		self.write("admin/settings.def", """export GET "/users" to "A" in "a.php"
+											export GET "/other" to "B" in "b.php"
+											  export GET "/info" to "C" in "c.php"
+										 """)
+
+		for native_optionals in [False, True]:
+			with self.assertRaises(ParseError) as context:
+				self.parse(self.definition_code, native_optionals)
+
+			self.assertEqual([
+				"admin/settings.def: line 1, column 1: redefinition of endpoint ‘users’ for HTTP method ‘GET’",
+				"admin/settings.def: line 3, column 14: redefinition of endpoint ‘info’ for HTTP method ‘GET’"
+			], str(context.exception).split("\n"))
+
+		# Errors inside included files say which file they're in
+		self.write("users.def", 'export GET "/users" to "A"')
+
+		with self.assertRaises(ParseError) as context:
+			self.parse(self.definition_code)
+
+		self.assertTrue(str(context.exception).startswith("users.def: "), str(context.exception))
+
+
+	def test_invalid_includes(self):
+
+		for definition_code, message in [
+			('base "a"\n  include "missing.def"', "line 2, column 3: included file ‘missing.def’ can't be read"),
+			('include "../users.def"', "line 1, column 1: included file ‘../users.def’ isn't inside the definition file's directory"),
+			('include "/users.def"', "line 1, column 1: included file ‘/users.def’ isn't inside the definition file's directory"),
+			('include "users.def" include "admin/../users.def"', "line 1, column 21: file ‘admin/../users.def’ is included more than once")
+		]:
+			with self.assertRaises(ParseError) as context:
+				self.parse(definition_code)
+
+			self.assertEqual(message, str(context.exception))
+
+		# An include which includes itself
+		self.write("users.def", 'include "users.def"')
+
+		with self.assertRaises(ParseError) as context:
+			self.parse('include "users.def"')
+
+		self.assertEqual("users.def: line 1, column 1: file ‘users.def’ is included more than once", str(context.exception))
+
+		# Strings which only look like includes aren't
+		self.parse('export GET "/include" to "A" in "a.php"')
+		self.assertEqual([], self.included)
+
+
+	def test_incremental_locations(self):
+
+		cache_path = os.path.join(self.directory, "statements")
+
+		for _ in range(2): # Without and with a statement cache
+			parser = Incremental.IncrementalParser(cache_path)
+			parser.parse('base "a"\n  include "missing.def"\n')
+
+			with self.assertRaises(ParseError) as context:
+				Includes.merge_included_files(parser.parser, self.directory)
+
+			self.assertEqual("line 2, column 3: included file ‘missing.def’ can't be read", str(context.exception))
+
+
+	def test_cached_files(self):
+
+		expected = encode(self.parse(self.definition_code).tree)
+
+		# Only files which have changed are parsed again
+
+		with mock.patch.object(Includes, "parse_file", wraps=Includes.parse_file) as parse_file:
+			self.assertEqual(expected, encode(self.parse(self.definition_code).tree))
+			self.assertEqual(0, parse_file.call_count)
+
+			self.write("users.def", self.included_code["users.def"].replace('"/"', '"/profile"'))
+			edited = self.parse(self.definition_code)
+
+			self.assertEqual([("users.def",)], [call[0][:1] for call in parse_file.call_args_list])
+			self.assertIn("profile", edited.tree["GET"]["users"])
+
+
+	def test_parallel_parsing(self):
+
+		serial = self.parse(self.definition_code)
+
+		with mock.patch.object(Includes, "parallel_threshold", 0):
+			parallel = Parser.Parser(Tokenizer.Tokenizer(self.definition_code).tokens())
+			parallel.parse()
+
+			Includes.merge_included_files(parallel, self.directory, workers=2)
+
+		self.assertEqual(encode(serial.tree), encode(parallel.tree))
+
+		# Entries coming back from the worker processes are still shared
+		self.assertIs(parallel.tree["GET"]["admin"][Parser.EndpointComponent.ROOT], parallel.static_routes["GET/admin"])
+
+
+	def test_parsing_in_worker_process(self):
+
+		# Worker processes of a pool parse serially, rather than starting processes of their own
+
+		with mock.patch.object(Includes, "parallel_threshold", 0), \
+			 mock.patch.object(Includes.multiprocessing, "current_process", return_value=mock.Mock()), \
+			 mock.patch("concurrent.futures.ProcessPoolExecutor", side_effect=AssertionError("started worker processes")):
+			self.assertEqual(encode(self.parse(self.definition_code).tree), encode(Parser.Parser(Tokenizer.Tokenizer(self.combined_code).tokens()).parse()))
+
+if __name__ == '__main__':
+	unittest.main()
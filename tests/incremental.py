@@ -0,0 +1,184 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Parent directory
+
+import io
+import json
+import shutil
+import tempfile
+import importlib.machinery
+
+import Tokenizer
+import Parser
+import Incremental
+
+import unittest
+
+# The command line script isn't a module of its own, so it's loaded from its file
+apiengine = importlib.machinery.SourceFileLoader("apiengine", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "__main__.py")).load_module()
+
+class IncrementalParsingTests(unittest.TestCase):
+
+	definition_code = """base "code"
+
+	group "/users/[id]?" base "users"
+		export GET "/" to "UserGetRequest" in "main.php"
+		export GET "/image/[size]?" to "UserImageRequest" in "image.php"
+
+	base "misc"
+	export GET "/info" to "InfoRequest" in "info.php"
+	export POST "/info" to "InfoUpdateRequest" in "info.php"
+	"""
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.cache_path = os.path.join(self.directory, "cache")
+
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+
+	def assertSameTree(self, definition_code):
+
+		expected_parser = Parser.Parser(Tokenizer.Tokenizer(definition_code).tokens())
+		expected_tree = expected_parser.parse()
+
+		actual_parser = Incremental.IncrementalParser(self.cache_path)
+		actual_tree = actual_parser.parse(definition_code)
+
+		encode = lambda tree: json.dumps(tree, default=lambda x: x.dict_value(), sort_keys=True)
+
+		self.assertEqual(encode(expected_tree), encode(actual_tree))
+		self.assertEqual(encode(expected_parser.static_routes), encode(actual_parser.parser.static_routes))
+		self.assertEqual(expected_parser.canonical_paths, actual_parser.parser.canonical_paths)
+
+
+	def test_split_statements(self):
+
+		expected_keywords = ["base", "group", "base", "export", "export"]
+		actual_keywords = [keyword for keyword, _ in Incremental.split_statements(self.definition_code)]
+
+		self.assertEqual(expected_keywords, actual_keywords)
+
+
+	def test_split_include(self):
+
+		# An include ends the group before it, as a base directory does
+		definition_code = self.definition_code.replace('\n\n\tbase "misc"', '\n\tinclude "more.def"\n\n\tbase "misc"')
+
+		expected_keywords = ["base", "group", "include", "base", "export", "export"]
+		actual_keywords = [keyword for keyword, _ in Incremental.split_statements(definition_code)]
+
+		self.assertEqual(expected_keywords, actual_keywords)
+
+		# It's only checked, as the included file is merged in separately
+		self.assertSameTree(definition_code)
+
+
+	def test_edits(self):
+
+		self.assertSameTree(self.definition_code)
+
+		# Change an export
+		edited_code = self.definition_code.replace('"/info" to "InfoRequest"', '"/about" to "InfoRequest"')
+		self.assertSameTree(edited_code)
+
+		# Remove one, then put it back
+		self.assertSameTree(edited_code.replace('export POST "/info" to "InfoUpdateRequest" in "info.php"', ''))
+		self.assertSameTree(edited_code)
+
+		# Change a base directory which the following statements depend on
+		self.assertSameTree(edited_code.replace('base "misc"', 'base "other"'))
+
+
+	def test_static_routes(self):
+
+		self.assertSameTree(self.definition_code)
+
+		# Removing an export removes every static route it expanded to, and nothing else
+
+		parser = Incremental.IncrementalParser(self.cache_path)
+		parser.parse(self.definition_code.replace('export GET "/image/[size]?" to "UserImageRequest" in "image.php"', ''))
+
+		self.assertEqual(["GET/info", "GET/users", "POST/info"], sorted(parser.parser.static_routes))
+
+		# ..and changing one replaces its entry
+
+		parser = Incremental.IncrementalParser(self.cache_path)
+		parser.parse(self.definition_code.replace('"InfoRequest"', '"AboutRequest"'))
+
+		self.assertEqual("AboutRequest", parser.parser.static_routes["GET/info"].class_name)
+		self.assertEqual(["GET/info", "GET/users", "GET/users/image", "POST/info"], sorted(parser.parser.static_routes))
+
+
+	def test_redefinition(self):
+
+		self.assertSameTree(self.definition_code)
+
+		redefined_code = self.definition_code + 'export GET "/info" to "OtherRequest" in "other.php"'
+
+		with self.assertRaises(Parser.ParseError):
+			Incremental.IncrementalParser(self.cache_path).parse(redefined_code)
+
+		# The cache shouldn't have been touched by the failed parse
+		self.assertSameTree(self.definition_code)
+
+
+	def test_invalid_input(self):
+
+		# Tokenisation stops at the invalid input, which is only handled by a full parse
+		self.assertSameTree(self.definition_code + "@@INVALID@@")
+		
+		with self.assertRaises(Parser.ParseError):
+			invalid_code = self.definition_code.replace('export GET "/info"', 'exporter GET "/info"')
+			Incremental.IncrementalParser(self.cache_path).parse(invalid_code)
+
+
+	def test_redefinitions(self):
+
+		self.assertSameTree(self.definition_code)
+
+		# Reported with their location inside the whole file, not just the statement
+		with self.assertRaisesRegex(Parser.ParseError, "^line 10, column 3: redefinition of endpoint ‘info’"):
+			Incremental.IncrementalParser(self.cache_path).parse(self.definition_code + '\texport GET "/info" to "A" in "a.php"')
+
+		self.assertSameTree(self.definition_code)
+
+
+	def test_repeated_expansions(self):
+
+		# Both optionals expand to the same path with two variables, which is inserted twice
+		definition_code = self.definition_code + 'export GET "/[x]?/[y]/[z]?" to "A" in "a.php"\n'
+
+		self.assertSameTree(definition_code)
+		self.assertSameTree(definition_code.replace('"A"', '"B"'))
+		self.assertSameTree(self.definition_code)
+
+
+	@unittest.skipUnless(apiengine.has_edit_permission(), "updating projects needs administrative privileges")
+	def test_update_repeated_expansions(self):
+
+		project_directory = os.path.join(self.directory, "project")
+		definition_path = os.path.join(project_directory, apiengine.CommonNames.EndpointDefinitionReadableFile)
+		run = lambda mode, definition_handle=None: apiengine.run_command(apiengine.parse_arguments(apiengine.argument_parser(), [mode, project_directory, "--no-cache"]), definition_handle)
+
+		run("create", io.StringIO(self.definition_code + '\tgroup "/[gid]?"\n\t\texport GET "/[v]/[w]?" to "A" in "a.php"\n'))
+		run("update") # Fills the statement cache
+
+		# Edit the group, which removes each path it expanded to once
+
+		with open(definition_path, encoding="utf-8") as definition_file:
+			definition_code = definition_file.read()
+
+		os.chmod(definition_path, 0o640)
+
+		with open(definition_path, "w", encoding="utf-8") as definition_file:
+			definition_file.write(definition_code.replace('"A"', '"B"'))
+
+		run("update")
+
+		with open(os.path.join(project_directory, apiengine.CommonNames.EndpointDefinitionFile), encoding="utf-8") as compiled_file:
+			self.assertIn('"B"', compiled_file.read())
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,287 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Parent directory
+
+import itertools
+
+import Tokenizer
+import Parser
+import Emitter
+from Parser import EndpointComponent, ParseError
+
+import unittest
+
+def parse(definition_code, native_optionals = False):
+	parser = Parser.Parser(Tokenizer.Tokenizer(definition_code).tokens(), native_optionals=native_optionals)
+	parser.parse()
+
+	return parser
+
+
+def resolve(tree, method, components):
+	""" Walks the tree the way request.php does, returning the class name and the
+		arguments of the endpoint found, or None if there isn't one. """
+
+	sub_tree = tree[method]
+
+	for component in components:
+		if component in sub_tree:
+			sub_tree = sub_tree[component]
+		elif EndpointComponent.WILDCARD in sub_tree:
+			sub_tree = sub_tree[EndpointComponent.WILDCARD]
+		else:
+			return None
+
+	if EndpointComponent.ROOT not in sub_tree:
+		return None
+
+	entry = sub_tree[EndpointComponent.ROOT]
+
+	return entry.class_name, {name: components[index] for index, name in entry.parameters}
+
+
+def resolve_native(tree, method, components):
+	""" Does the same as `resolve` for trees with optionals stored natively, the way
+		request.php does. Arguments of optionals which were left out are None. """
+
+	states = [(tree[method], [])]
+
+	def closure(states):
+		for sub_tree, values in states:
+			if EndpointComponent.OPTIONAL in sub_tree:
+				states.append((sub_tree[EndpointComponent.OPTIONAL], values + [None]))
+
+		return states
+
+	states = closure(states)
+
+	for component in components:
+		static_states = [(sub_tree[component], values + [component]) for sub_tree, values in states if component in sub_tree]
+		variable_states = [(sub_tree[key], values + [component]) for sub_tree, values in states for key in [EndpointComponent.WILDCARD, EndpointComponent.OPTIONAL] if key in sub_tree]
+
+		states = closure(static_states or variable_states)
+
+	for sub_tree, values in states:
+		if EndpointComponent.ROOT in sub_tree:
+			entry = sub_tree[EndpointComponent.ROOT]
+			return entry.class_name, {name: values[index] for index, name in entry.parameters}
+
+	return None
+
+
+class ParserTests(unittest.TestCase):
+
+	definition_code = """group "/users/[id]?" base "users"
+							export GET "/" to "UserGetRequest" in "main.php"
+							export GET "/image/[size]?" to "UserImageRequest" in "image.php"
+							export GET "/image/[size]?/as/[format]" to "UserImageFormatRequest" in "image.php"
+						 export GET "/users/image/original" to "OriginalImageRequest" in "image.php"
+						 export GET "/[section]/info" to "InfoRequest" in "info.php"
+					  """
+
+	def test_deterministic_components(self):
+
+		nondeterministic_components = [('image', False, False), ('a', True, False), ('b', False, True), ('c', False, False), ('d', False, True)]
+
+		expected_components = [
+			[('image', False), ('a', True), ('b', True), ('c', False), ('d', True)],
+			[('image', False), ('a', True), ('b', True), ('c', False)],
+			[('image', False), ('a', True), ('c', False), ('d', True)],
+			[('image', False), ('a', True), ('c', False)]
+		]
+
+		actual_components = Parser.Parser([]).deterministic_components(nondeterministic_components)
+
+		self.assertEqual(expected_components, actual_components)
+
+
+	def test_invalid_components(self):
+
+		parser = Parser.Parser([])
+
+		with self.assertRaises(ParseError):
+			parser.deterministic_components([('a', False, True), ('b', False, True)])
+
+		with self.assertRaises(ParseError):
+			parser.deterministic_components([('a', True, False), ('b', False, False), ('a', False, True)])
+
+
+	def test_expansion_is_lazy(self):
+
+		# 2^40 paths, but only the first is ever generated
+
+		nondeterministic_components = []
+
+		for i in range(40):
+			nondeterministic_components += [('s' + str(i), False, False), ('o' + str(i), False, True)]
+
+		parser = Parser.Parser([])
+		parser.validate_components(nondeterministic_components)
+
+		first_path = next(parser.expanded_components(nondeterministic_components))
+
+		self.assertEqual(80, len(first_path))
+
+
+	def test_native_optionals(self):
+
+		expanded_tree = parse(self.definition_code).tree
+		native_tree = parse(self.definition_code, native_optionals=True).tree
+
+		# The native tree only stores each export once
+		self.assertEqual(1, len(native_tree["GET"]["users"]))
+
+		components = ["users", "image", "original", "as", "1234", "info"]
+
+		for length in range(5):
+			for path in itertools.product(components, repeat=length):
+				expected = resolve(expanded_tree, "GET", list(path))
+				actual = resolve_native(native_tree, "GET", list(path))
+
+				# Optionals left out are None natively, instead of not being there at all
+
+				if actual is not None:
+					actual = (actual[0], {name: value for name, value in actual[1].items() if value is not None})
+
+				self.assertEqual(expected, actual, path)
+
+
+	def test_request_shapes(self):
+
+		# request.php caches what it finds for a request with every component which isn't in
+		# the vocabulary swapped for a placeholder, then swaps the placeholders back
+
+		for native_optionals, resolve_function in [(False, resolve), (True, resolve_native)]:
+			tree = parse(self.definition_code, native_optionals=native_optionals).tree
+			vocabulary = Emitter.vocabulary(tree)
+
+			components = ["users", "image", "original", "as", "1234", "5678", "info"]
+
+			for length in range(5):
+				for path in itertools.product(components, repeat=length):
+					shape = [component if component in vocabulary else "\0" + str(index) for index, component in enumerate(path)]
+					resolved = resolve_function(tree, "GET", shape)
+
+					if resolved is not None:
+						arguments = {name: path[int(value[1:])] if value is not None and value.startswith("\0") else value for name, value in resolved[1].items()}
+						resolved = (resolved[0], arguments)
+
+					self.assertEqual(resolve_function(tree, "GET", list(path)), resolved, path)
+
+
+	def test_extraction_plans(self):
+
+		# request.php binds arguments with array_combine(names, array_map(..., positions)),
+		# picking the value at each position
+
+		def bind(entry, values):
+			plan = entry.dict_value()
+
+			return dict(zip(plan.get("names", []), [values[position] for position in plan.get("positions", [])]))
+
+		entry = Parser.RedirectEntry("A", "/a.php", {4: "e", 1: "b", 2: "c"})
+		self.assertEqual({"b": "1", "c": "2", "e": "4"}, bind(entry, ["a", "1", "2", "d", "4"]))
+
+		# Each entry binds the same arguments the tree walk finds
+
+		tree = parse(self.definition_code).tree
+
+		for path in [["users", "12", "image", "large", "as", "png"], ["users", "image", "as", "png"], ["users", "12"], ["users", "image"]]:
+			sub_tree = tree["GET"]
+
+			for component in path:
+				sub_tree = sub_tree[component] if component in sub_tree else sub_tree[EndpointComponent.WILDCARD]
+
+			self.assertEqual(resolve(tree, "GET", path)[1], bind(sub_tree[EndpointComponent.ROOT], path), path)
+
+
+	def test_native_redefinition(self):
+
+		# Conflicts with '/users/[id]/image', where the optional in the group is there
+
+		with self.assertRaises(ParseError):
+			parse('export GET "/users/[a]/image" to "A" in "a.php"' + self.definition_code, native_optionals=True)
+
+		parser = parse('export GET "/users/[a]/avatar" to "A" in "a.php"' + self.definition_code, native_optionals=True)
+
+		self.assertEqual("UserImageRequest", parser.static_routes["GET/users/image"].class_name)
+		self.assertEqual((), parser.static_routes["GET/users/image"].parameters)
+
+
+	def test_static_routes(self):
+
+		definition_code = """export GET "/" to "HomeRequest" in "home.php"
+							 export POST "/a/[x]?/b/[y]?" to "BRequest" in "b.php"
+							 export GET "/[section]/info" to "InfoRequest" in "info.php"
+							 group "/users/[id]?" base "users"
+								export GET "/" to "UserGetRequest" in "main.php"
+								export GET "/image/[size]?" to "UserImageRequest" in "image.php"
+						  """
+
+		expected_keys = ["GET/", "GET/users", "GET/users/image", "POST/a/b"]
+
+		for native_optionals in [False, True]:
+			parser = parse(definition_code, native_optionals)
+
+			# Only the paths each export expands to without any variables are indexed
+			self.assertEqual(expected_keys, sorted(parser.static_routes))
+			self.assertTrue(all(entry.parameters == () for entry in parser.static_routes.values()))
+
+		# ..and each leads to the entry the tree walk finds for it
+
+		parser = parse(definition_code)
+
+		for key, entry in parser.static_routes.items():
+			method, _, path = key.partition("/")
+			self.assertEqual((entry.class_name, {}), resolve(parser.tree, method, [component for component in path.split("/") if component != ""]), key)
+
+
+	def test_entries(self):
+
+		entry = Parser.RedirectEntry("A", "/a.php", {2: "b", 0: "a"})
+
+		self.assertEqual(((0, "a"), (2, "b")), entry.parameters)
+		self.assertEqual(entry, Parser.RedirectEntry("A", "/a.php", [(0, "a"), (2, "b")]))
+		self.assertEqual(1, len({entry, Parser.RedirectEntry("A", "/a.php", {0: "a", 2: "b"})}))
+		self.assertNotEqual(entry, Parser.RedirectEntry("A", "/a.php"))
+
+		with self.assertRaises(AttributeError):
+			entry.class_name = "B"
+
+		# Serialised once, then reused
+		self.assertIs(entry.dict_value(), entry.dict_value())
+		self.assertEqual({"file": "/a.php", "class": "A", "names": ["a", "b"], "positions": [0, 2]}, entry.dict_value())
+		self.assertEqual({"file": "/a.php", "class": "A"}, Parser.RedirectEntry("A", "/a.php").dict_value())
+
+		# Every path an export expands to shares the same entry where the parameters match
+		parser = parse(self.definition_code)
+		self.assertIs(parser.tree["GET"]["users"]["image"][EndpointComponent.ROOT], parser.static_routes["GET/users/image"])
+
+
+	def test_all_redefinitions_reported(self):
+
+		definition_code = """export GET "/a/[x]" to "A" in "a.php"
+							 export GET "/b" to "B" in "b.php"
+							   export GET "/a/[y]" to "C" in "c.php"
+							 group "/b" base "d"
+								export GET "/" to "D" in "d.php"
+								export GET "/[z]?" to "E" in "e.php"
+						  """
+
+		for native_optionals in [False, True]:
+			tokenizer = Tokenizer.Tokenizer(definition_code)
+			parser = Parser.Parser(tokenizer.tokens(), native_optionals=native_optionals, locate=tokenizer.current_location)
+
+			with self.assertRaises(ParseError) as context:
+				parser.parse()
+
+			self.assertEqual([
+				"line 3, column 11: redefinition of endpoint ‘a/[y]’ for HTTP method ‘GET’",
+				"line 5, column 9: redefinition of endpoint ‘b’ for HTTP method ‘GET’",
+				"line 6, column 9: redefinition of endpoint ‘b’ for HTTP method ‘GET’"
+			], str(context.exception).split("\n"))
+
+			# Only the exports which didn't conflict made it into the tree
+			self.assertEqual({("GET", ("a", "*")), ("GET", ("b",))}, parser.canonical_paths)
+
+if __name__ == '__main__':
+	unittest.main()
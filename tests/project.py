@@ -0,0 +1,320 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Parent directory
+
+import argparse
+import contextlib
+import importlib.machinery
+import io
+import re
+import shutil
+import subprocess
+import tempfile
+from unittest import mock
+
+import Tokenizer
+import Emitter
+import Cache
+
+import unittest
+
+# The command line script isn't a module of its own, so it's loaded from its file (which
+# also puts it in sys.modules, where worker processes find it by name)
+
+apiengine = importlib.machinery.SourceFileLoader("apiengine", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "__main__.py")).load_module()
+
+
+def project_files(project_directory):
+	""" Returns the contents of every file inside the project, keyed by their path
+		relative to the project's directory. """
+
+	files = {}
+
+	for directory, _, file_names in os.walk(project_directory):
+		for file_name in file_names:
+			path = os.path.join(directory, file_name)
+
+			with open(path, encoding="utf-8") as file:
+				files[os.path.relpath(path, project_directory)] = file.read()
+
+	return files
+
+
+class ProjectTests(unittest.TestCase):
+
+	definition_code = """base "code"
+
+	group "/users/[id]?" base "users"
+		export GET "/" to "UserGetRequest" in "main.php"
+		export GET "/image/[size]?" to "UserImageRequest" in "image.php"
+		export POST "/image" to "UserImageUploadRequest" in "image.php"
+
+	base "code/misc"
+	export GET "/info" to "InfoRequest" in "info.php"
+	export GET "/help" to "HelpRequest" in "help/topics.php"
+	"""
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+
+	def create(self, name, workers):
+		project_directory = os.path.join(self.directory, name)
+
+		original, outputs, defined_classes = apiengine.parse_definition_file(self.definition_code.splitlines(True))
+		apiengine.create_project(project_directory, original, outputs, defined_classes, workers)
+
+		return project_directory
+
+
+	def test_parallel_creation(self):
+
+		serial_files = project_files(self.create("serial", 1))
+		parallel_files = project_files(self.create("parallel", 4))
+
+		# The manifests only differ by the times the files were written
+		del serial_files[apiengine.CommonNames.ManifestFile], parallel_files[apiengine.CommonNames.ManifestFile]
+
+		self.assertEqual(serial_files, parallel_files)
+
+		image_file = parallel_files[os.path.join("code", "users", "image.php")]
+
+		self.assertIn('require_once __DIR__ . "/../../engine/runtime.php";', image_file)
+		self.assertIn("class UserImageRequest implements", image_file)
+		self.assertIn("class UserImageUploadRequest implements", image_file)
+
+		self.assertIn(os.path.join("code", "misc", "help", "topics.php"), parallel_files)
+
+		# Every class can be found from the engine directory, without changing to it
+		autoload_file = parallel_files[os.path.join("engine", "autoload.php")]
+		self.assertIn("'UserImageRequest' => __DIR__ . '/../code/users/image.php',", autoload_file)
+
+		# ..and every file a request could need is compiled up front when preloading
+		preload_file = parallel_files[os.path.join("engine", "preload.php")]
+
+		for path in ["/request.php", "/autoload.php", "/../.definition.php", "/../code/users/image.php", "/../code/misc/help/topics.php"]:
+			self.assertIn("__DIR__ . '{0}',".format(path), preload_file)
+
+
+	def test_ascii_locale(self):
+
+		# Templates and outputs are UTF-8 whatever the locale, so the engine files are copied exactly
+
+		project_directory = os.path.join(self.directory, "ascii")
+		main_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "__main__.py")
+		environment = dict(os.environ, LC_ALL="C", PYTHONCOERCECLOCALE="0", PYTHONUTF8="0", APIENGINE_CACHE_DIR=os.path.join(self.directory, "cache"))
+
+		with tempfile.TemporaryFile("w+") as definition_file:
+			definition_file.write(self.definition_code)
+			definition_file.seek(0)
+
+			subprocess.check_call([sys.executable, main_path, "create", project_directory], stdin=definition_file, env=environment)
+
+		for file_name in ["request.php", "runtime.php"]:
+			with open(os.path.join(os.path.dirname(main_path), "templates", file_name), "rb") as template_file, open(os.path.join(project_directory, "engine", file_name), "rb") as engine_file:
+				self.assertEqual(template_file.read(), engine_file.read())
+
+
+	def test_binary_route_table(self):
+
+		settings = dict(apiengine.default_project_settings, format="binary")
+		_, outputs, _ = apiengine.parse_definition_file(self.definition_code.splitlines(True), settings)
+
+		# The PHP route table has the binary table as a string literal, the way PHP reads it
+
+		literal = re.search(r"'binary'=>\"((?:[^\"\\]|\\.)*)\"", outputs[apiengine.CommonNames.RouteTableFile])
+		table = re.sub(r"\\x([0-9a-f]{2})", lambda match: chr(int(match.group(1), 16)), literal.group(1)).encode("latin-1")
+
+		self.assertEqual(outputs[apiengine.CommonNames.BinaryRouteTableFile], table)
+		self.assertTrue(all(0x20 <= ord(character) < 0x7f for character in literal.group(1)))
+
+
+	def test_unchanged_files_skipped(self):
+
+		project_directory = self.create("project", 1)
+		_, outputs, defined_classes = apiengine.parse_definition_file(self.definition_code.splitlines(True))
+
+		with mock.patch.object(Emitter, "write_atomically", wraps=Emitter.write_atomically) as write_atomically:
+
+			apiengine.update_project(project_directory, outputs, defined_classes)
+			apiengine.update_project(project_directory, outputs, defined_classes)
+
+			self.assertEqual(0, write_atomically.call_count)
+
+			# Only what changed is written, along with the manifest
+			changed_outputs = dict(outputs, **{apiengine.CommonNames.EndpointDefinitionFile: "{}"})
+			apiengine.update_project(project_directory, changed_outputs, defined_classes)
+
+			written = [os.path.basename(call[0][0]) for call in write_atomically.call_args_list]
+			self.assertEqual([apiengine.CommonNames.EndpointDefinitionFile, apiengine.CommonNames.ManifestFile], written)
+
+		# Files changed by something else are written again, even if the manifest says otherwise
+
+		route_table_path = os.path.join(project_directory, apiengine.CommonNames.RouteTableFile)
+		os.chmod(route_table_path, 0o640)
+
+		with open(route_table_path, "a") as route_table_file:
+			route_table_file.write("\n")
+
+		apiengine.update_project(project_directory, outputs, defined_classes)
+
+		self.assertEqual(outputs[apiengine.CommonNames.RouteTableFile], project_files(project_directory)[apiengine.CommonNames.RouteTableFile])
+
+
+	def test_class_files_upgraded(self):
+
+		project_directory = self.create("project", 1)
+		_, outputs, defined_classes = apiengine.parse_definition_file(self.definition_code.splitlines(True))
+
+		# Written the way earlier versions did, and then by hand
+
+		old_files = {
+			os.path.join("code", "users", "image.php"): '<?php\n\nrequire_once "../../engine/runtime.php";\n',
+			os.path.join("code", "misc", "help", "topics.php"): '<?php\n\nrequire_once "/somewhere/else/runtime.php";\n'
+		}
+
+		for file_name, contents in old_files.items():
+			with open(os.path.join(project_directory, file_name), "w") as file:
+				file.write(contents)
+
+		apiengine.update_project(project_directory, outputs, defined_classes)
+		files = project_files(project_directory)
+
+		self.assertEqual('<?php\n\nrequire_once __DIR__ . "/../../engine/runtime.php";\n', files[os.path.join("code", "users", "image.php")])
+		self.assertEqual(old_files[os.path.join("code", "misc", "help", "topics.php")], files[os.path.join("code", "misc", "help", "topics.php")])
+
+
+	def test_direct_rewrites(self):
+
+		project_directory = os.path.join(self.directory, "project")
+		settings = dict(apiengine.default_project_settings, rewrite="direct")
+
+		original, outputs, defined_classes = apiengine.parse_definition_file(self.definition_code.splitlines(True), settings)
+		apiengine.create_project(project_directory, original, outputs, defined_classes, 1, settings)
+
+		stub_directory = os.path.join(project_directory, "engine", "routes")
+
+		with open(os.path.join(project_directory, ".htaccess")) as htaccess_file:
+			htaccess = htaccess_file.read()
+
+		# One stub for each distinct entry, which .htaccess sends requests straight to, leaving
+		# the query string alone so it can't stand in for the arguments
+		referenced_stubs = set(re.findall(r"/engine/routes/(\w+\.php) \[END\]$", htaccess, re.MULTILINE))
+
+		self.assertEqual(set(os.listdir(stub_directory)), referenced_stubs)
+		self.assertIn("RewriteRule ^info$ ", htaccess)
+
+		# ..where the stub takes the arguments from the path of the request
+		for stub_name in referenced_stubs:
+			with open(os.path.join(stub_directory, stub_name), encoding="utf-8") as stub_file:
+				self.assertIn("new APIRequest(false, APIRequest::request_path())", stub_file.read())
+
+		# Going back to sending every request to request.php deletes the stubs, but keeps
+		# directives added to .htaccess by hand
+
+		with open(os.path.join(project_directory, ".htaccess"), "a") as htaccess_file:
+			htaccess_file.write("\nOptions -Indexes\n")
+
+		_, outputs, defined_classes = apiengine.parse_definition_file(self.definition_code.splitlines(True))
+		apiengine.update_project(project_directory, outputs, defined_classes)
+
+		self.assertEqual([], os.listdir(stub_directory))
+		self.assertEqual(apiengine.render("htaccess", {"rules": ""}) + "\nOptions -Indexes\n", project_files(project_directory)[".htaccess"])
+
+		# Files from before the section was marked have their rules swapped for it
+		self.assertEqual("Options -Indexes\n" + apiengine.render("htaccess", {"rules": ""}), apiengine.merged_htaccess("Options -Indexes\nRewriteEngine On\nRewriteCond %{REQUEST_FILENAME} !request.php\nRewriteRule ^(.*)$ /engine/request.php?arguments=$1 [L,QSA]", apiengine.render("htaccess", {"rules": ""})))
+
+
+	def test_compile_cache(self):
+
+		compile_cache = Cache.CompileCache(self.directory)
+		expected = apiengine.parse_definition_file(self.definition_code.splitlines(True))
+
+		self.assertEqual(expected, apiengine.compile_definition_file(self.definition_code.splitlines(True), compile_cache=compile_cache))
+
+		# Identical definition files aren't even tokenised the second time
+
+		with mock.patch.object(Tokenizer, "Tokenizer", side_effect=AssertionError("tokenised")):
+			self.assertEqual(expected, apiengine.compile_definition_file(self.definition_code.splitlines(True), compile_cache=compile_cache))
+
+
+	def test_included_files(self):
+
+		definition_directory = os.path.join(self.directory, "definition")
+		os.makedirs(os.path.join(definition_directory, "more"))
+
+		with open(os.path.join(definition_directory, "more", "about.def"), "w") as included_file:
+			included_file.write('export GET "/about" to "AboutRequest" in "about.php"\n')
+
+		definition_code = self.definition_code + 'include "more/about.def"\n'
+
+		compile_cache = Cache.CompileCache(os.path.join(self.directory, "cache"))
+		compile = lambda: apiengine.compile_definition_file(definition_code.splitlines(True), compile_cache=compile_cache, include_directory=definition_directory)
+
+		original, outputs, defined_classes = compile()
+		self.assertIn(("AboutRequest", "/about.php"), defined_classes)
+
+		# The project gets its own copy of each included file, where update looks for it
+
+		project_directory = os.path.join(self.directory, "project")
+		apiengine.create_project(project_directory, original, outputs, defined_classes, 1)
+
+		self.assertEqual('export GET "/about" to "AboutRequest" in "about.php"\n', project_files(project_directory)["more/about.def"])
+		self.assertEqual("more/about.def\n", project_files(project_directory)[apiengine.CommonNames.IncludedFilesFile])
+
+		# Editing an included file means the compile cache can't be used
+
+		with open(os.path.join(definition_directory, "more", "about.def"), "w") as included_file:
+			included_file.write('export GET "/about" to "AboutPageRequest" in "about.php"\n')
+
+		self.assertIn(("AboutPageRequest", "/about.php"), compile()[2])
+
+		# Once it's no longer included, the project's copy is deleted
+
+		_, outputs, defined_classes = apiengine.parse_definition_file(self.definition_code.splitlines(True))
+		apiengine.update_project(project_directory, outputs, defined_classes)
+
+		self.assertNotIn("more/about.def", project_files(project_directory))
+		self.assertNotIn(apiengine.CommonNames.IncludedFilesFile, project_files(project_directory))
+
+
+	def test_listed_projects(self):
+
+		list_path = os.path.join(self.directory, "projects")
+		os.mkdir(os.path.join(self.directory, "a"))
+
+		with open(list_path, "w") as list_file:
+			list_file.write("# Projects\nb\n\n c \n")
+
+		expected = [os.path.join(self.directory, "a"), os.path.join(self.directory, "b"), os.path.join(self.directory, "c")]
+		self.assertEqual(expected, apiengine.listed_projects([os.path.join(self.directory, "a"), list_path]))
+
+
+	@unittest.skipUnless(apiengine.has_edit_permission(), "updating projects needs administrative privileges")
+	def test_build_all(self):
+
+		projects = [self.create("project" + str(i), 1) for i in range(3)] + [os.path.join(self.directory, "missing")]
+
+		arguments = apiengine.parse_arguments(apiengine.argument_parser(), ["build-all", "--no-cache", "--jobs", "2", "--router", "regex"] + projects)
+		output = io.StringIO()
+
+		with contextlib.redirect_stdout(output):
+			failures = apiengine.build_all(arguments)
+
+		self.assertEqual(1, failures)
+
+		lines = output.getvalue().splitlines()
+
+		for line, project in zip(lines, projects[:3]):
+			self.assertTrue(line.endswith("ok      " + project), line)
+
+		self.assertTrue(lines[3].endswith("failed  {0}: no such project {0}".format(projects[3])), lines[3])
+
+		for project in projects[:3]:
+			self.assertEqual("regex", apiengine.load_project_settings(project)["router"])
+
+if __name__ == '__main__':
+	unittest.main()
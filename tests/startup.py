@@ -0,0 +1,51 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Parent directory
+
+import subprocess
+
+import unittest
+
+main_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "__main__.py")
+
+# How long importing everything beyond what the interpreter imports anyway can take, in microseconds
+STARTUP_BUDGET = 50000
+
+# Modules which only some modes need, so they shouldn't be imported before they're used
+deferred_modules = ["Tokenizer", "Parser", "Incremental", "Includes", "Emitter", "Cache", "json", "pickle", "tempfile", "concurrent.futures", "ctypes", "socketserver"]
+
+
+def import_times(*arguments):
+	""" Runs the interpreter with the given arguments under -X importtime, returning the
+		time each module took to import by itself, in microseconds, keyed by its name. """
+
+	process = subprocess.run([sys.executable, "-X", "importtime"] + list(arguments), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+	times = {}
+
+	for line in process.stderr.splitlines():
+		if line.startswith("import time:"):
+			self_time, _, name = line[len("import time:"):].split("|")
+
+			if self_time.strip().isdigit(): # Not the header
+				times[name.strip()] = int(self_time)
+
+	return times
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "-X importtime needs Python 3.7")
+class StartupTests(unittest.TestCase):
+
+	def test_startup(self):
+
+		interpreter_modules = import_times("-c", "pass")
+
+		for arguments in [["remove", "/nonexistent/project"], ["--help"]]:
+			times = import_times(main_path, *arguments)
+			startup_times = {name: time for name, time in times.items() if name not in interpreter_modules}
+
+			for module in deferred_modules:
+				self.assertNotIn(module, startup_times, arguments)
+
+			self.assertLess(sum(startup_times.values()), STARTUP_BUDGET, arguments)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -4,6 +4,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # P
 import Tokenizer
 from Tokenizer import Token, EndpointToken
 
+import io
 import unittest
 
 class TokenizationTests(unittest.TestCase):
@@ -18,6 +19,18 @@ class TokenizationTests(unittest.TestCase):
 		self.assertEqual(expected_tokens, actual_tokens)
 	
 	
+	def test_include(self):
+		
+		# 'in' is a prefix of 'include', which has to win
+		
+		definition_code = 'include "users.def"'
+		expected_tokens = [Token.INCLUDE, (Token.STRING, "users.def")]
+		
+		actual_tokens = Tokenizer.Tokenizer(definition_code).all_tokens()
+		
+		self.assertEqual(expected_tokens, actual_tokens)
+	
+	
 	def test_export_simple(self):
 		
 		definition_code = 'export GET "/info" to "ClassName" in "FileName"'
@@ -162,5 +175,38 @@ class TokenizationTests(unittest.TestCase):
 		
 		self.assertTrue(expected_tokens, actual_tokens)
 
+	def test_longest_match(self):
+		
+		# The shorter regex comes first, but the longer match should still win
+		token_regexes = [(Token.IN, 'in'), (Token.STRING, 'in[a-z]+')]
+		
+		tokenizer = Tokenizer.GenericTokenizer("in include", token_regexes)
+		
+		self.assertEqual((Token.IN, "in"), tokenizer.current_token)
+		self.assertEqual((Token.STRING, "include"), tokenizer.next_token())
+		self.assertEqual((None, ""), tokenizer.next_token())
+	
+	
+	def test_many_exports(self):
+		
+		definition_code = 'export GET "/users/[id]?/image" to "UserImageRequest" in "file.php"\n'
+		
+		single_tokens = Tokenizer.Tokenizer(definition_code).all_tokens()
+		actual_tokens = Tokenizer.Tokenizer(definition_code * 500).all_tokens()
+		
+		self.assertEqual(single_tokens * 500, actual_tokens)
+
+	def test_lines(self):
+		
+		definition_code = """base "code"
+		                     group "/users/[id]?" base "users"
+		                         export GET "/image/[size]?" to "UserImageRequest" in "image.php"
+		                     export POST "/info" to "InfoRequest" in "info.php" @@INVALID@@ export"""
+		
+		expected_tokens = Tokenizer.Tokenizer(definition_code).all_tokens()
+		actual_tokens = list(Tokenizer.Tokenizer(io.StringIO(definition_code)).tokens())
+		
+		self.assertEqual(expected_tokens, actual_tokens)
+
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file